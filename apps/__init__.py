@@ -2,9 +2,13 @@ import logging
 
 from flask import Flask
 import lib.log as log
-from apps.app_v1.models import initialize_db
+from lib.metrics import Metrics, track_caches, track_pool
+from lib.tracing import Tracer
+from lib.sql_profiler import SqlProfiler
+from apps.app_v1.models import initialize_db, db
 from config import config, APP_NAME
 from utils.kafka_utils.kafka_publisher import Publisher
+from utils.api_utils.http_client import HttpClient
 
 Logger = logging.getLogger(APP_NAME)
 
@@ -15,8 +19,34 @@ def create_app(config_name):
 	config[config_name].init_app(app)
 	log.setup_logging(config[config_name])
 	initialize_db(app)
+	Metrics.init(app)
+	Tracer.init(app)
+	SqlProfiler.init(app)
 	Publisher.init(app)
+	HttpClient.init(app)
 
 	from apps.app_v1.routes import app_v1 as v1_router
 	app.register_blueprint(v1_router, url_prefix='/grocery_orderapi/v1')
+
+	from apps.app_v1.api.cart_service import CatalogCache, CatalogBatcher
+	from apps.app_v1.api.status_service import StatusService
+	from apps.app_v1.api.outbox_service import OutboxService
+	from apps.app_v1.api.cart_cache import CartCache
+	from apps.app_v1.api.coupon_service import CouponCheckCache
+	from apps.app_v1.api.delivery_service import ShipmentPreviewCache
+	CatalogCache.init(app)
+	CatalogBatcher.init(app)
+	CartCache.init(app)
+	CouponCheckCache.init(app)
+	ShipmentPreviewCache.init(app)
+	OutboxService.init(app)
+	StatusService.init(app)
+	track_caches({'catalog': lambda: CatalogCache.cache.get_stats(),
+				  'cart': CartCache.get_stats,
+				  'coupon_check': CouponCheckCache.get_stats,
+				  'shipment_preview': ShipmentPreviewCache.get_stats})
+	with app.app_context():
+		track_pool(db.engine)
+		Tracer.trace_sql(db.engine)
+		SqlProfiler.profile(db.engine)
 	return app
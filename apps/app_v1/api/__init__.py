@@ -7,6 +7,7 @@ from apps.app_v1.models.models import Address, Payment
 from config import APP_NAME
 import config
 from flask import g
+from lib.log import loggable_payload
 
 __author__ = 'divyagarg'
 
@@ -73,7 +74,7 @@ class ERROR(object):
 
 def parse_request_data(body):
 	json_data = json.loads(body)
-	Logger.info('{%s} Json encoded content {%s}' % (g.UUID, json_data))
+	Logger.info('{%s} Json encoded content {%s}', g.UUID, loggable_payload(json_data))
 	return json_data
 
 
@@ -495,3 +495,8 @@ CHECK_COUPON_SCHEMA = {
 		FUNCTIONS: [{String: {}}]
 	}
 }
+
+for each_schema in (CREATE_CART_SCHEMA, CREATE_ORDER_SCHEMA_WITHOUT_CART_REFERENCE,
+			   CREATE_ORDER_SCHEMA_WITH_CART_REFERENCE, GET_COUNT_OF_CART_ITEMS, GET_DELIVERY_DETAILS,
+			   UPDATE_DELIVERY_SLOT, CHECK_COUPON_SCHEMA):
+	compile_schema(each_schema)
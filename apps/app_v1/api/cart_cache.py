@@ -0,0 +1,151 @@
+import logging
+
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import joinedload, subqueryload
+from sqlalchemy.orm.attributes import set_committed_value, get_history
+from sqlalchemy.orm.session import make_transient_to_detached
+from apps.app_v1.models.models import db, Cart, CartItem, OrderShipmentDetail
+from config import APP_NAME
+from utils.cache_utils.ttl_cache import TTLCache
+
+__author__ = 'divyagarg'
+
+Logger = logging.getLogger(APP_NAME)
+
+CART_CACHE_KEYS = 'cart_cache_keys'
+
+
+def column_keys(model_class):
+	return tuple(column_property.key for column_property in inspect(model_class).column_attrs)
+
+SNAPSHOT_COLUMNS = {Cart: column_keys(Cart), CartItem: column_keys(CartItem),
+					OrderShipmentDetail: column_keys(OrderShipmentDetail)}
+
+
+def snapshot_row(obj):
+	return dict((key, getattr(obj, key)) for key in SNAPSHOT_COLUMNS[type(obj)])
+
+
+def detached_row(model_class, values):
+	obj = model_class(**values)
+	# resets attribute history, so the row reads as if it had just been loaded
+	make_transient_to_detached(obj)
+	return obj
+
+
+class CartCache(object):
+	"""
+	Snapshot of a cart with its items and shipments, keyed by (geo_id, user_id).
+
+	Snapshots hold plain column values. A hit is rebuilt into the current
+	session with merge(load=False), so it behaves like a loaded cart without
+	any SQL. Carts touched by a flush are invalidated once the transaction
+	commits. The local cache is per process: across uwsgi workers it is only
+	coherent with a shared backend, so keep it disabled otherwise.
+	"""
+	enabled = False
+	cache = TTLCache()
+	reference_to_key = {}
+	events_registered = False
+
+	def __init__(self):
+		pass
+
+	@staticmethod
+	def init(app, shared_backend=None):
+		CartCache.enabled = app.config.get('CART_CACHE_ENABLED', False)
+		CartCache.cache = TTLCache(maxsize=app.config.get('CART_CACHE_MAXSIZE', 10000),
+								   ttl=app.config.get('CART_CACHE_TTL', 30),
+								   shared_backend=shared_backend)
+		CartCache.reference_to_key = {}
+		if CartCache.enabled and not CartCache.events_registered:
+			# db.session is a scoped_session over a partial, events have to go on the session class
+			event.listen(SignallingSession, 'after_flush', collect_touched_carts)
+			event.listen(SignallingSession, 'after_commit', invalidate_touched_carts)
+			event.listen(SignallingSession, 'after_rollback', discard_touched_carts)
+			CartCache.events_registered = True
+
+	@staticmethod
+	def key(geo_id, user_id):
+		return (int(geo_id), str(user_id))
+
+	@staticmethod
+	def get_cart(geo_id, user_id):
+		"""
+		Returns the cart from the cache when possible. A cart that is going to
+		be cached is loaded with its cartItem and orderShipmentDetail, each
+		collection eagerly in its own query so they do not multiply each
+		other's rows; otherwise both load lazily as before.
+		"""
+		key = CartCache.key(geo_id, user_id)
+		if not CartCache.enabled:
+			return Cart.query.filter_by(geo_id=int(geo_id), user_id=user_id).first()
+		snapshot = CartCache.cache.get(key)
+		if snapshot is not None:
+			return CartCache.rehydrate(snapshot)
+		if db.session.new or db.session.dirty or db.session.deleted or db.session.info.get(CART_CACHE_KEYS):
+			# pending or uncommitted changes would end up in the snapshot
+			return Cart.query.filter_by(geo_id=int(geo_id), user_id=user_id).first()
+		cart = Cart.query.options(joinedload(Cart.cartItem), subqueryload(Cart.orderShipmentDetail)) \
+			.filter_by(geo_id=int(geo_id), user_id=user_id).first()
+		if cart is not None:
+			CartCache.put(key, cart)
+		return cart
+
+	@staticmethod
+	def put(key, cart):
+		snapshot = {'cart': snapshot_row(cart),
+					'items': [snapshot_row(cart_item) for cart_item in cart.cartItem],
+					'shipments': [snapshot_row(shipment) for shipment in cart.orderShipmentDetail]}
+		CartCache.cache.set(key, snapshot)
+		if len(CartCache.reference_to_key) >= CartCache.cache.maxsize:
+			CartCache.reference_to_key.clear()
+		CartCache.reference_to_key[cart.cart_reference_uuid] = key
+
+	@staticmethod
+	def rehydrate(snapshot):
+		cart = detached_row(Cart, snapshot['cart'])
+		set_committed_value(cart, 'cartItem', [detached_row(CartItem, values) for values in snapshot['items']])
+		set_committed_value(cart, 'orderShipmentDetail',
+							[detached_row(OrderShipmentDetail, values) for values in snapshot['shipments']])
+		return db.session.merge(cart, load=False)
+
+	@staticmethod
+	def invalidate(key):
+		CartCache.cache.invalidate(key)
+
+	@staticmethod
+	def get_stats():
+		return CartCache.cache.get_stats()
+
+
+def collect_touched_carts(session, flush_context):
+	keys = session.info.setdefault(CART_CACHE_KEYS, set())
+	touched_references = set()
+	for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+		if isinstance(obj, Cart):
+			if obj.geo_id is not None and obj.user_id is not None:
+				keys.add(CartCache.key(obj.geo_id, obj.user_id))
+			# a changed user_id leaves the old key behind
+			for old_user_id in get_history(obj, 'user_id').deleted:
+				keys.add(CartCache.key(obj.geo_id, old_user_id))
+			touched_references.add(obj.cart_reference_uuid)
+		elif isinstance(obj, (CartItem, OrderShipmentDetail)):
+			touched_references.add(obj.cart_id)
+	for reference in touched_references:
+		key = CartCache.reference_to_key.get(reference)
+		if key is not None:
+			keys.add(key)
+	for obj in session.identity_map.values():
+		if isinstance(obj, Cart) and obj.cart_reference_uuid in touched_references:
+			keys.add(CartCache.key(obj.geo_id, obj.user_id))
+
+
+def invalidate_touched_carts(session):
+	for key in session.info.pop(CART_CACHE_KEYS, set()):
+		CartCache.invalidate(key)
+
+
+def discard_touched_carts(session):
+	session.info.pop(CART_CACHE_KEYS, None)
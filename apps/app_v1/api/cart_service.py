@@ -2,10 +2,10 @@ import uuid
 import json
 import logging
 import datetime
+from collections import namedtuple
 
 from requests.exceptions import ConnectTimeout
 from flask import g, current_app
-import requests
 from apps.app_v1.api.coupon_service import CouponService
 import config
 from apps.app_v1.api import parse_request_data, RequiredFieldMissing,\
@@ -20,14 +20,102 @@ from utils.jsonutils.json_schema_validator import validate
 from config import APP_NAME
 from apps.app_v1.models.models import db
 from apps.app_v1.api import ERROR
+from utils.api_utils.http_client import HttpClient
+from utils.api_utils.circuit_breaker import CircuitOpenException
+from utils.api_utils.single_flight import SingleFlight
+from utils.api_utils.micro_batcher import MicroBatcher
+from lib.metrics import StageTimer
+from utils.api_utils.parallel import BackgroundCall
+from utils.cache_utils.ttl_cache import TTLCache
+from apps.app_v1.api.cart_cache import CartCache
 
 __author__ = 'divyagarg'
 
 Logger = logging.getLogger(APP_NAME)
 
+# Item fields the coupon check needs, available before the catalog has priced the items
+CouponProduct = namedtuple('CouponProduct', ['cart_item_id', 'quantity', 'promo_codes'])
+
+
+class CatalogCache(object):
+	"""
+	Catalog details of items keyed by (order_type, item_id), so repeated cart
+	views of the same SKUs do not go to the product catalog every time.
+	Only the fields the cart reads are kept.
+	"""
+	FIELDS = ['id', 'basePrice', 'offerPrice', 'transferPrice', 'maxQuantity', 'deliveryDays',
+			  'title', 'imageURL']
+	enabled = False
+	cache = TTLCache()
+
+	def __init__(self):
+		pass
+
+	@staticmethod
+	def init(app, shared_backend=None):
+		CatalogCache.enabled = app.config.get('CATALOG_CACHE_ENABLED', False)
+		CatalogCache.cache = TTLCache(maxsize=app.config.get('CATALOG_CACHE_MAXSIZE', 10000),
+									  ttl=app.config.get('CATALOG_CACHE_TTL', 60),
+									  shared_backend=shared_backend)
+
+	@staticmethod
+	def get_many(order_type, item_ids):
+		if not CatalogCache.enabled:
+			return {}, list(item_ids)
+		found, missing = CatalogCache.cache.get_many([(order_type, item_id) for item_id in item_ids])
+		catalog_items = {}
+		for key, item in found.items():
+			catalog_items[key[1]] = dict(item)
+		return catalog_items, [key[1] for key in missing]
+
+	@staticmethod
+	def set_many(order_type, catalog_items):
+		if not CatalogCache.enabled:
+			return
+		mapping = {}
+		for item_id, item in catalog_items.items():
+			mapping[(order_type, item_id)] = dict((field, item.get(field)) for field in CatalogCache.FIELDS)
+		CatalogCache.cache.set_many(mapping)
+
+
+CATALOG_FLIGHT = SingleFlight('catalog')
+
+
+class CatalogBatcher(object):
+	"""
+	Optionally holds catalog lookups for CATALOG_BATCH_WINDOW_MS so that the
+	item ids of concurrent cart and order requests of one order type go out
+	as a single search. With a zero window every lookup is searched directly.
+	"""
+	batcher = None
+
+	def __init__(self):
+		pass
+
+	@staticmethod
+	def init(app):
+		window = app.config.get('CATALOG_BATCH_WINDOW_MS', 0)
+		if window > 0:
+			CatalogBatcher.batcher = MicroBatcher('catalog', search_catalog_items, window=window / 1000.0,
+												  max_batch_size=app.config.get('CATALOG_BATCH_MAX_ITEMS', 100))
+		else:
+			CatalogBatcher.batcher = None
+
+	@staticmethod
+	def get_many(order_type, item_ids):
+		if CatalogBatcher.batcher is None:
+			return search_catalog_items(order_type, item_ids)
+		return CatalogBatcher.batcher.get_many(order_type, item_ids)
+
+	@staticmethod
+	def get_stats():
+		if CatalogBatcher.batcher is None:
+			return {'window': 0}
+		return CatalogBatcher.batcher.get_stats()
+
 
 def get_cart_for_geo_user_id(geo_id, user_id):
-	return Cart().query.filter_by(geo_id=int(geo_id), user_id=user_id).first()
+	return CartCache.get_cart(geo_id, user_id)
 
 
 def check_if_calculate_price_api_response_is_correct_or_quantity_is_available\
@@ -51,13 +139,25 @@ def convert_list_type_from_int_to_str(freebies_id_list):
 
 
 def calculate_price_api(req_data):
-	request_data = json.dumps(req_data)
+	"""
+	Identical catalog searches in flight in this worker, e.g. many users adding
+	the same SKUs at once, are merged into one upstream request.
+	"""
+	request_data = json.dumps(req_data, sort_keys=True)
+	return CATALOG_FLIGHT.do(request_data, search_catalog, request_data)
+
+
+def search_catalog(request_data):
 	Logger.info("[%s] Request data for calculate price API is [%s]",
 				         g.UUID, request_data)
-	response = requests.post(url=current_app.config['PRODUCT_CATALOGUE_URL'],
-							                   data=request_data,
-							 				   headers={'Content-type': 'application/json'},
-							 				   timeout=current_app.config['API_TIMEOUT'])
+	try:
+		response = HttpClient.post(url=current_app.config['PRODUCT_CATALOGUE_URL'],
+								   data=request_data,
+								   headers={'Content-type': 'application/json'},
+								   dependency='catalog')
+	except CircuitOpenException:
+		Logger.error("[%s] Circuit for catalog search API is open", g.UUID)
+		raise ServiceUnAvailableException(ERROR.PRODUCT_CATALOG_SERVICE_DOWN)
 	if response.status_code != 200:
 		if response.status_code == 404:
 			Logger.error("[%s] Catalog search API is down", g.UUID)
@@ -74,33 +174,60 @@ def calculate_price_api(req_data):
 	return json_data['results']
 
 
-def get_freebie_details(freebies_id_list, order_type):
+def get_catalog_items(item_ids, order_type, use_cache=True):
+	"""
+	Returns catalog details of the items as {item_id: item}. Items found in
+	CatalogCache are served from it and only the missing ids are sent to the
+	catalog; pass use_cache=False to always fetch fresh details.
+	"""
+	item_ids = [int(item_id) for item_id in item_ids]
+	catalog_items = {}
+	missing_ids = item_ids
+	if use_cache:
+		catalog_items, missing_ids = CatalogCache.get_many(order_type, item_ids)
+	if missing_ids.__len__() == 0:
+		Logger.info("[%s] Catalog details of items %s served from cache", g.UUID, item_ids)
+		return catalog_items
+
+	fetched_items = CatalogBatcher.get_many(order_type, missing_ids)
+	CatalogCache.set_many(order_type, fetched_items)
+	catalog_items.update(fetched_items)
+	return catalog_items
+
+
+def search_catalog_items(order_type, item_ids):
 	req_data = {
 		"query": {
 			"type": [order_type],
 			"filters": {
-				"id": freebies_id_list
+				"id": item_ids
 			},
 			"select": config.SEARCH_API_SELECT_CLAUSE
 		},
-		"count": freebies_id_list.__len__(),
+		"count": item_ids.__len__(),
 		"offset": 0
 	}
 	response = calculate_price_api(req_data)
-	if len(response) == 0:
-		return None
+	fetched_items = {}
+	if response is None or response.__len__() == 0:
+		return fetched_items
+	for item in response[0].get('items')[0].get('items'):
+		fetched_items[int(item.get('id'))] = item
+	return fetched_items
 
-	order_item_price_dict = {}
-	for response in response[0].get('items')[0].get('items'):
-		order_item_price_dict[response.get('id')] = response
+
+def get_freebie_details(freebies_id_list, order_type):
+	order_item_price_dict = get_catalog_items(freebies_id_list, order_type)
+	if order_item_price_dict.__len__() == 0:
+		return None
 
 	freebie_detail_list = list()
 	for each_freebie_id in freebies_id_list:
 		freebie_json = {'id': each_freebie_id,
 						'title': order_item_price_dict.get(
-							each_freebie_id).get('title'),
+							int(each_freebie_id)).get('title'),
 						'image_url': order_item_price_dict.get(
-							each_freebie_id).get('imageURL')}
+							int(each_freebie_id)).get('imageURL')}
 		freebie_detail_list.append(freebie_json)
 
 	return freebie_detail_list
@@ -118,8 +245,7 @@ def create_address_json(shipping_address):
 	return shipping_add
 
 
-def get_response_from_check_coupons_api(cart_items, data, cart):
-	url = current_app.config['COUPON_CHECK_URL']
+def create_check_coupons_request_data(cart_items, data, cart):
 	req_data = {
 		"area_id": str(data['geo_id']),
 		"customer_id": data['user_id'],
@@ -134,7 +260,6 @@ def get_response_from_check_coupons_api(cart_items, data, cart):
 	if 'payment_mode' in data:
 		req_data['payment_mode'] = payment_modes_dict[
 			data.get('payment_mode')]
-		url = url + config.COUPON_QUERY_PARAM
 	if 'promo_codes' in data:
 		if data.get('promo_codes') == []:
 			cart.promo_codes = None
@@ -143,7 +268,35 @@ def get_response_from_check_coupons_api(cart_items, data, cart):
 			req_data["coupon_codes"] = map(str, data.get('promo_codes'))
 	elif cart is not None and cart.promo_codes is not None:
 		req_data["coupon_codes"] = json.loads(cart.promo_codes)
-	response = CouponService.call_check_coupon_api(req_data)
+	return req_data
+
+
+def start_check_coupons_api(cart_items, data, cart):
+	"""
+	Speculatively issues the coupon check while the catalog is being queried.
+	Returns (request, call) to be handed to get_response_from_check_coupons_api,
+	or (None, None) when parallel cart calls are disabled.
+	"""
+	if not current_app.config.get('PARALLEL_CART_FANOUT', False):
+		return None, None
+	try:
+		req_data = create_check_coupons_request_data(cart_items, data, cart)
+	except Exception as exception:
+		Logger.info("[%s] Coupon check not prefetched [%s]", g.UUID, str(exception))
+		return None, None
+	return req_data, BackgroundCall(CouponService.call_check_coupon_api, req_data)
+
+
+def get_response_from_check_coupons_api(cart_items, data, cart,
+										speculative_request=None, speculative_call=None):
+	req_data = create_check_coupons_request_data(cart_items, data, cart)
+	if speculative_call is not None and speculative_request == req_data:
+		response = speculative_call.get()
+	else:
+		if speculative_call is not None:
+			Logger.info("[%s] Item set changed after catalog lookup, discarding speculative coupon check",
+						g.UUID)
+		response = CouponService.call_check_coupon_api(req_data)
 	if response.status_code != 200:
 		if response.status_code == 404:
 			Logger.error("[%s] Coupon service is temporarily unavailable",
@@ -178,32 +331,14 @@ def fetch_product_price(items, data):
 	if data.get('order_type') is not None:
 		order_type = order_types[data.get('order_type')]
 
-	req_data = {
-		"query": {
-			"type": [order_type],
-			"filters": {
-				"id": request_items_ids
-			},
-			"select": config.SEARCH_API_SELECT_CLAUSE
-		},
-		"count": request_items_ids.__len__(),
-		"offset": 0
-	}
-
-	return calculate_price_api(req_data)
+	return get_catalog_items(request_items_ids, order_type)
 
 
 def fetch_items_price_return_dict(data):
-	response_product_fetch_data = fetch_product_price(
-		data['orderitems'], data)
+	order_item_dict = fetch_product_price(data['orderitems'], data)
 
-	if response_product_fetch_data is None or response_product_fetch_data.__len__() == 0:
+	if order_item_dict.__len__() == 0:
 		raise SubscriptionNotFoundException(ERROR.SUBSCRIPTION_NOT_FOUND)
-
-	order_item_dict = {}
-	for response in response_product_fetch_data[0].get('items')[0].get(
-			'items'):
-		order_item_dict[response.get('id')] = response
 	return order_item_dict
 
 
@@ -236,13 +371,10 @@ def remove_cart(cart_reference_id):
 
 def check_prices_of_item(request_items, data):
 
-	response_data = fetch_product_price(request_items, data)
-	if response_data is None or response_data.__len__() == 0:
+	order_item_price_dict = fetch_product_price(request_items, data)
+	if order_item_price_dict.__len__() == 0:
 		raise SubscriptionNotFoundException(ERROR.SUBSCRIPTION_NOT_FOUND)
-	order_item_price_dict = {}
 
-	for response in response_data[0].get('items')[0].get('items'):
-		order_item_price_dict[response.get('id')] = response
 	for each_item in request_items:
 		check_if_calculate_price_api_response_is_correct_or_quantity_is_available(
 			each_item, order_item_price_dict[
@@ -272,6 +404,8 @@ class CartService(object):
 		self.shipping_address = None
 		self.total_cashback = 0.0
 		self.payment_mode_allowed = None
+		self.coupon_request = None
+		self.coupon_call = None
 
 	def create_or_update_cart(self, body):
 		try:
@@ -302,8 +436,10 @@ class CartService(object):
 			g.UUID)
 		error = True
 		err = None
+		timer = StageTimer('cart_update')
 		while True:
 			# 1 Item update(Added, removed, update)
+			timer.start('items')
 			try:
 				self.update_cart_items(data, cart, operation)
 
@@ -346,11 +482,13 @@ class CartService(object):
 
 
 			# 2 Payment Mode
+			timer.start('payment_mode')
 			if data.get('payment_mode') is not None:
 				cart.payment_mode = payment_modes_dict[
 					data.get('payment_mode')]
 
 			# 3 Check coupons (Cart Level or Item level)
+			timer.start('coupons')
 			if not self.is_cart_empty:
 				try:
 					self.check_for_coupons_applicable(data, cart)
@@ -378,6 +516,7 @@ class CartService(object):
 					break
 
 			# 4 Shipping address
+			timer.start('address')
 			try:
 				self.update_address(data, cart)
 			except Exception as exception:
@@ -388,6 +527,7 @@ class CartService(object):
 				break
 
 			# 5 update cart price
+			timer.start('totals')
 			try:
 				self.update_cart_total_amounts(cart)
 			except Exception as exception:
@@ -416,6 +556,7 @@ class CartService(object):
 				break
 
 			# 6 Save cart
+			timer.start('save')
 			try:
 				db.session.add(cart)
 				for each_cart_item in self.item_id_to_existing_item_dict.values():
@@ -431,6 +572,7 @@ class CartService(object):
 				break
 
 			# 7 Create Response
+			timer.start('response')
 			try:
 				response_data = self.generate_response(None, cart, data)
 			except Exception as exception:
@@ -445,18 +587,23 @@ class CartService(object):
 			error = False
 			break;
 		if error:
+			timer.finish(err)
 			db.session.rollback()
 			return create_error_response(err)
 		else:
+			timer.start('commit')
 			db.session.commit()
+			timer.finish()
 			return create_data_response(data=response_data)
 
 	def create_cart(self, data):
 		error = True
 		err = None
+		timer = StageTimer('cart_create')
 		while True:
 
 			# 0. Validation
+			timer.start('validation')
 			try:
 				validate_create_new_cart(data)
 			except EmptyCartException as ece:
@@ -481,6 +628,7 @@ class CartService(object):
 				break
 
 			# 1. Initialize cart object
+			timer.start('initialize')
 			try:
 				self.cart_reference_uuid = uuid.uuid1().hex
 				cart = Cart()
@@ -493,7 +641,11 @@ class CartService(object):
 				break
 
 			# 2. Calculate item prices and cart total
+			timer.start('price_check')
 			try:
+				self.coupon_request, self.coupon_call = start_check_coupons_api(
+					[CouponProduct(int(item['item_uuid']), item['quantity'], item.get('promocodes'))
+					 for item in data['orderitems']], data, cart)
 				self.get_price_and_update_in_cart_item(data)
 
 			except ServiceUnAvailableException:
@@ -526,10 +678,11 @@ class CartService(object):
 				break
 
 			# 3. check coupons
+			timer.start('coupons')
 			try:
 				if self.cart_items is not None and self.cart_items.__len__()>0:
 					response_data = get_response_from_check_coupons_api(
-						self.cart_items, data, cart)
+						self.cart_items, data, cart, self.coupon_request, self.coupon_call)
 					self.update_discounts_item_level(response_data,
 													 self.cart_items)
 					self.fetch_freebie_details_and_update(
@@ -564,6 +717,7 @@ class CartService(object):
 				break
 
 			# 4. apply shipping charges
+			timer.start('shipping')
 			try:
 				self.total_shipping_charges = get_shipping_charges(
 					self.total_price, self.total_discount)
@@ -577,6 +731,7 @@ class CartService(object):
 				break
 
 			# 5. save in DB
+			timer.start('save')
 			try:
 				self.save_cart(data, cart)
 			except Exception as exception:
@@ -588,6 +743,7 @@ class CartService(object):
 				break
 
 			# 6. create response
+			timer.start('response')
 			try:
 				response_data = self.generate_response(self.cart_items, cart,
 													   data)
@@ -604,10 +760,13 @@ class CartService(object):
 			break
 
 		if error:
+			timer.finish(err)
 			db.session.rollback()
 			return create_error_response(err)
 		else:
+			timer.start('commit')
 			db.session.commit()
+			timer.finish()
 			return create_data_response(data=response_data)
 
 	def save_cart(self, data, cart):
@@ -825,6 +984,13 @@ class CartService(object):
 		return address
 
 	def update_cart_items(self, data, cart, operation):
+		self.update_cart_item_quantities(data, cart, operation)
+		if self.item_id_to_existing_item_dict.values().__len__() > 0:
+			self.coupon_request, self.coupon_call = start_check_coupons_api(
+				self.item_id_to_existing_item_dict.values(), data, cart)
+		self.update_cart_item_prices(data)
+
+	def update_cart_item_quantities(self, data, cart, operation):
 
 		self.item_id_to_existing_item_dict = {}
 		for existing_cart_item in cart.cartItem:
@@ -898,6 +1064,7 @@ class CartService(object):
 						del self.item_id_to_existing_item_dict[data_item['item_uuid']]
 						self.deleted_cart_items[data_item['item_uuid']] = existing_cart_item
 
+	def update_cart_item_prices(self, data):
 		request_items = list()
 		for cart_item in self.item_id_to_existing_item_dict.values():
 			request_item_detail = {"item_uuid": cart_item.cart_item_id,
@@ -929,7 +1096,7 @@ class CartService(object):
 		if self.item_id_to_existing_item_dict.values() is not None and self.item_id_to_existing_item_dict.values().__len__()>0:
 			response_data = get_response_from_check_coupons_api(
 				self.item_id_to_existing_item_dict.values(), data,
-				cart)
+				cart, self.coupon_request, self.coupon_call)
 			if "error" in response_data:
 				if 'promo_codes' in data and hasattr(data.get('promo_codes'),
 													 '__iter__') and data.get(
@@ -1,20 +1,81 @@
 import json
 import logging
+import hashlib
+from collections import namedtuple
 
-import requests
 import config
 
-from apps.app_v1.api import parse_request_data, ERROR
+from apps.app_v1.api import parse_request_data, ERROR, ServiceUnAvailableException
 from apps.app_v1.api.api_schema_signature import CHECK_COUPON_SCHEMA
 from config import APP_NAME
 from flask import current_app, g
 from utils.jsonutils.json_schema_validator import validate
 from utils.jsonutils.output_formatter import create_error_response
+from utils.api_utils.http_client import HttpClient
+from utils.api_utils.circuit_breaker import CircuitOpenException
+from utils.cache_utils.ttl_cache import TTLCache
 
 __author__ = 'divyagarg'
 
 Logger = logging.getLogger(APP_NAME)
 
+CachedResponse = namedtuple('CachedResponse', ['status_code', 'text'])
+
+
+def coupon_check_fingerprint(url, request_data):
+	"""
+	Hash of what decides a coupon check, independent of the order in which
+	products are listed and of str/int differences in ids and quantities.
+	"""
+	products = sorted(
+		(str(product.get('item_id')), str(product.get('subscription_id')), str(product.get('quantity')),
+		 product.get('coupon_code')) for product in request_data.get('products') or [])
+	coupon_codes = request_data.get('coupon_codes')
+	canonical = [url, str(request_data.get('area_id')), str(request_data.get('customer_id')),
+				 str(request_data.get('channel')), request_data.get('payment_mode'),
+				 list(coupon_codes) if coupon_codes is not None else None, products]
+	return hashlib.sha1(json.dumps(canonical, sort_keys=True)).hexdigest()
+
+
+class CouponCheckCache(object):
+	"""
+	Successful coupon check responses keyed by request fingerprint. A cart is
+	checked several times within seconds (update, /check_coupon, /check_cod,
+	order placement) with the same payload, so a short ttl is enough. Coupons
+	are still applied against the service, which has the final say.
+	"""
+	enabled = False
+	cache = TTLCache()
+
+	def __init__(self):
+		pass
+
+	@staticmethod
+	def init(app, shared_backend=None):
+		CouponCheckCache.enabled = app.config.get('COUPON_CHECK_CACHE_ENABLED', False)
+		CouponCheckCache.cache = TTLCache(maxsize=app.config.get('COUPON_CHECK_CACHE_MAXSIZE', 10000),
+										  ttl=app.config.get('COUPON_CHECK_CACHE_TTL', 10),
+										  shared_backend=shared_backend)
+
+	@staticmethod
+	def get(fingerprint):
+		if not CouponCheckCache.enabled:
+			return None
+		cached = CouponCheckCache.cache.get(fingerprint)
+		if cached is None:
+			return None
+		return CachedResponse(*cached)
+
+	@staticmethod
+	def set(fingerprint, response):
+		if not CouponCheckCache.enabled or response.status_code != 200:
+			return
+		CouponCheckCache.cache.set(fingerprint, (response.status_code, response.text))
+
+	@staticmethod
+	def get_stats():
+		return CouponCheckCache.cache.get_stats()
+
 
 class CouponService(object):
 
@@ -43,7 +104,13 @@ class CouponService(object):
 		}
 		if 'payment_mode' in request_data:
 			url = url + config.COUPON_QUERY_PARAM
-		response = requests.post(url=url, data=json.dumps(request_data), headers=header,timeout= current_app.config['API_TIMEOUT'])
+		fingerprint = coupon_check_fingerprint(url, request_data)
+		response = CouponCheckCache.get(fingerprint)
+		if response is not None:
+			Logger.info("[%s] Coupon check served from cache [%s]", g.UUID, fingerprint)
+			return response
+		response = CouponService.post(url, request_data, header)
+		CouponCheckCache.set(fingerprint, response)
 		return response
 
 	@staticmethod
@@ -54,5 +121,13 @@ class CouponService(object):
 			'X-API-TOKEN': current_app.config['X_API_TOKEN'],
 			'Content-type': 'application/json'
 		}
-		response = requests.post(url=url, data=json.dumps(request_data), headers=header,timeout= current_app.config['API_TIMEOUT'])
+		response = CouponService.post(url, request_data, header)
 		return response
+
+	@staticmethod
+	def post(url, request_data, header):
+		try:
+			return HttpClient.post(url=url, data=json.dumps(request_data), headers=header, dependency='coupon')
+		except CircuitOpenException:
+			Logger.error("[%s] Circuit for coupon service is open", g.UUID)
+			raise ServiceUnAvailableException(ERROR.COUPON_SERVICE_DOWN)
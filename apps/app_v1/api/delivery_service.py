@@ -1,21 +1,24 @@
 import json
+import copy
 import logging
 import random
 import time
 import datetime
 from dateutil.tz import tzlocal
 from flask import g, current_app
-import requests
 from requests.exceptions import ConnectTimeout
-from sqlalchemy import func, distinct
 from apps.app_v1.api.api_schema_signature import GET_DELIVERY_DETAILS, UPDATE_DELIVERY_SLOT
 from apps.app_v1.models import db
-from apps.app_v1.models.models import Cart, Address, OrderShipmentDetail, CartItem
+from apps.app_v1.models.models import Address, OrderShipmentDetail
 from config import APP_NAME
 from utils.jsonutils.output_formatter import create_data_response, create_error_response
 from apps.app_v1.api import ERROR, parse_request_data, NoSuchCartExistException, NoShippingAddressFoundException, \
 	NoDeliverySlotException, ShipmentPreviewException, ServiceUnAvailableException, OlderDeliverySlotException
 from utils.jsonutils.json_schema_validator import validate
+from utils.api_utils.http_client import HttpClient
+from utils.api_utils.circuit_breaker import CircuitOpenException
+from apps.app_v1.api.cart_cache import CartCache
+from utils.cache_utils.ttl_cache import TTLCache
 
 __author__ = 'divyagarg'
 
@@ -77,6 +80,58 @@ def update_slot(body):
 		return create_error_response(ERROR.INTERNAL_ERROR)
 
 
+def shipment_preview_key(req_data):
+	"""
+	Canonical key of a shipment preview request: the delivery address and the
+	sorted (subscription, quantity, freebie) list. order_item_id is only a
+	position in the request and is left out.
+	"""
+	address = req_data['fulfilment_request_object']['deliver_to']['address_detail']['address']
+	items = sorted((str(order_item.get('subscription_id')), int(order_item.get('quantity')),
+					bool(order_item.get('freebie'))) for order_item in req_data['order_data']['order_items'])
+	return (address.get('address_line_1'), address.get('city'), address.get('state'),
+			address.get('pincode'), tuple(items))
+
+
+class ShipmentPreviewCache(object):
+	"""
+	Shipment preview results keyed by shipment_preview_key, so that an order
+	placed right after /delivery reuses the preview instead of asking
+	fulfilment again. Callers mutate the preview, so copies are handed out.
+	"""
+	enabled = False
+	cache = TTLCache()
+
+	def __init__(self):
+		pass
+
+	@staticmethod
+	def init(app, shared_backend=None):
+		ShipmentPreviewCache.enabled = app.config.get('SHIPMENT_PREVIEW_CACHE_ENABLED', False)
+		ShipmentPreviewCache.cache = TTLCache(maxsize=app.config.get('SHIPMENT_PREVIEW_CACHE_MAXSIZE', 10000),
+											  ttl=app.config.get('SHIPMENT_PREVIEW_CACHE_TTL', 120),
+											  shared_backend=shared_backend)
+
+	@staticmethod
+	def get(key):
+		if not ShipmentPreviewCache.enabled:
+			return None
+		preview = ShipmentPreviewCache.cache.get(key)
+		if preview is None:
+			return None
+		return copy.deepcopy(preview)
+
+	@staticmethod
+	def set(key, preview):
+		if not ShipmentPreviewCache.enabled:
+			return
+		ShipmentPreviewCache.cache.set(key, copy.deepcopy(preview))
+
+	@staticmethod
+	def get_stats():
+		return ShipmentPreviewCache.cache.get_stats()
+
+
 class DeliveryService(object):
 	def __init__(self):
 
@@ -86,24 +141,20 @@ class DeliveryService(object):
 		try:
 			request_data = parse_request_data(body)
 			validate(request_data, GET_DELIVERY_DETAILS)
-			cart = Cart.query.filter_by(geo_id=int(request_data['geo_id']), user_id=request_data['user_id']).first()
+			cart = CartCache.get_cart(request_data['geo_id'], request_data['user_id'])
 			if cart is None:
 				raise NoSuchCartExistException(ERROR.NO_SUCH_CART_EXIST)
 			else:
 				Logger.info("Cart is not none in get delivery info [%s]", cart.cart_reference_uuid)
-				count = db.session.query(func.count(distinct(OrderShipmentDetail.shipment_id))).filter(
-					OrderShipmentDetail.cart_id == cart.cart_reference_uuid).group_by(
-					OrderShipmentDetail.cart_id).count()
+				count = cart.orderShipmentDetail.__len__()
 				if count > 0:
 					Logger.info("Count is not zero in get delivery info [%s]", count)
-					cart_items_list = CartItem.query.filter_by(cart_id=cart.cart_reference_uuid).all()
-					for each_cart_item in cart_items_list:
+					for each_cart_item in cart.cartItem:
 						each_cart_item.shipment_id = None
 						db.session.add(each_cart_item)
 
-					order_shipment_detail_list = OrderShipmentDetail.query.filter_by(
-						cart_id=cart.cart_reference_uuid).all()
-					for each_shipment in order_shipment_detail_list:
+					for each_shipment in list(cart.orderShipmentDetail):
+						cart.orderShipmentDetail.remove(each_shipment)
 						db.session.delete(each_shipment)
 
 				shipment_preview_response = self.get_shipment_preview(request_data)
@@ -135,9 +186,27 @@ class DeliveryService(object):
 
 	def get_shipment_preview(self, request_data):
 		req_data = self.create_shipment_preview_request_data(request_data)
+		return self.call_shipment_preview_api(req_data)
+
+	def call_shipment_preview_api(self, req_data):
+		key = shipment_preview_key(req_data)
+		shipment_preview = ShipmentPreviewCache.get(key)
+		if shipment_preview is not None:
+			Logger.info("[%s] Shipment preview served from cache", g.UUID)
+			return shipment_preview
+		shipment_preview = self.fetch_shipment_preview(req_data)
+		ShipmentPreviewCache.set(key, shipment_preview)
+		return shipment_preview
+
+	def fetch_shipment_preview(self, req_data):
 		url = current_app.config['SHIPMENT_PREVIEW_URL']
 		Logger.info("request data for shipment preview API is [%s]" , json.dumps(req_data))
-		response = requests.post(url=url, data=json.dumps(req_data), headers={'Content-type': 'application/json'}, 	timeout= current_app.config['API_TIMEOUT'])
+		try:
+			response = HttpClient.post(url=url, data=json.dumps(req_data), headers={'Content-type': 'application/json'},
+									   dependency='fulfilment')
+		except CircuitOpenException:
+			Logger.error("[%s] Circuit for fulfillment service is open", g.UUID)
+			raise ServiceUnAvailableException(ERROR.FULFILLMENT_SERVICE_DOWN)
 		Logger.info("[%s] Response got from get shipment preview API is [%s]" , g.UUID, response)
 		if response.status_code != 200:
 			if response.status_code == 404:
@@ -184,7 +253,7 @@ class DeliveryService(object):
 					db.session().add(item)
 
 	def create_shipment_preview_request_data(self, data):
-		cart = Cart.query.filter_by(geo_id=int(data['geo_id']), user_id=data['user_id']).first()
+		cart = CartCache.get_cart(data['geo_id'], data['user_id'])
 		if cart is None:
 			raise NoSuchCartExistException(ERROR.NO_SUCH_CART_EXIST)
 		if cart.shipping_address_ref is None:
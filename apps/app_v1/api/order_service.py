@@ -4,19 +4,19 @@ import traceback
 import datetime
 
 from flask import g, current_app
-import requests
 from sqlalchemy import func, distinct
+from sqlalchemy.orm import joinedload, subqueryload
+from sqlalchemy.orm.attributes import set_committed_value
 from requests.exceptions import ConnectTimeout
-from apps.app_v1.api.cart_service import remove_cart
+from apps.app_v1.api.cart_service import remove_cart, get_catalog_items
 from apps.app_v1.api.coupon_service import CouponService
 from apps.app_v1.api.delivery_service import DeliveryService, validate_delivery_slot
-import config
 from apps.app_v1.api.api_schema_signature import CREATE_ORDER_SCHEMA_WITH_CART_REFERENCE, \
 	CREATE_ORDER_SCHEMA_WITHOUT_CART_REFERENCE
 from apps.app_v1.api.status_service import StatusService
 from apps.app_v1.models import ORDER_STATUS, DELIVERY_TYPE, order_types, payment_modes_dict
 from apps.app_v1.models.models import Order, db, Cart, Address, OrderItem, Status, OrderShipmentDetail, \
-	MasterOrder, CartItem
+	MasterOrder
 from config import APP_NAME
 from utils.jsonutils.json_utility import json_serial
 from utils.jsonutils.output_formatter import create_error_response, create_data_response
@@ -28,15 +28,22 @@ from apps.app_v1.api import ERROR, parse_request_data, NoSuchCartExistException,
 	ServiceUnAvailableException
 from utils.jsonutils.json_schema_validator import validate
 
-from utils.kafka_utils.kafka_publisher import Publisher
+from apps.app_v1.api.outbox_service import OutboxService
+from utils.api_utils.parallel import BackgroundCall
+from lib.metrics import StageTimer
 
 
 __author__ = 'divyagarg'
 Logger = logging.getLogger(APP_NAME)
 
 
-def get_cart(cart_reference_id):
-	return Cart.query.filter_by(cart_reference_uuid=cart_reference_id).first()
+def get_cart(cart_reference_id, with_items=False):
+	query = Cart.query.filter_by(cart_reference_uuid=cart_reference_id)
+	if with_items:
+		# items are joined in and shipments loaded by one more query, so splitting the order needs no
+		# per row lookups and the two collections do not multiply each other's rows
+		query = query.options(joinedload(Cart.cartItem), subqueryload(Cart.orderShipmentDetail))
+	return query.first()
 
 
 def get_delivery_slot(cart_reference_id):
@@ -189,6 +196,28 @@ def create_order_item_obj(order_id, src_list, list_of_items):
 		list_of_items.append(order_item)
 
 
+def apply_scalar_defaults(obj):
+	# bulk inserts leave python side column defaults to the database, set them
+	# on the object too so it reads the same as a flushed one
+	for column in obj.__table__.columns:
+		if column.default is not None and column.default.is_scalar and getattr(obj, column.key) is None:
+			setattr(obj, column.key, column.default.arg)
+
+
+def bulk_insert_order_items(order_items, return_defaults=False):
+	"""
+	Inserts order items with executemany instead of one INSERT per row through
+	the unit of work. The orders they belong to must already be flushed. The
+	items are not attached to the session; pass return_defaults=True when their
+	generated ids are needed (this falls back to one INSERT per row).
+	"""
+	if order_items.__len__() == 0:
+		return
+	for order_item in order_items:
+		apply_scalar_defaults(order_item)
+	db.session.bulk_save_objects(order_items, return_defaults=return_defaults)
+
+
 def create_order_item_json(order_id, src_dict, list_of_items):
 	for src_item in src_dict.values():
 		order_item = OrderItem()
@@ -315,6 +344,7 @@ class OrderService(object):
 		self.cart_reference_given = None
 
 		self.order_list = list()
+		self.order_items_by_order = {}
 		self.split_order = False
 		self.parent_reference_id = None
 		self.shipment_items_dict = None
@@ -325,17 +355,26 @@ class OrderService(object):
 		self.delivery_slot = None
 		self.final_order_ids = list()
 
+		self.parallel_fanout = False
+		self.order_shipment_details = None
+		self.price_call = None
+		self.coupon_call = None
+		self.shipment_preview_call = None
+
 	def createorder(self, body):
 		error = True
 		err = None
+		timer = StageTimer('order_create')
 
 		while True:
 
 			# 1 Parse request
+			timer.start('parse')
 			request_data = parse_request_data(body)
 			self.cart_reference_given = bool("cart_reference_uuid" in request_data)
 
 			# 2. validate request data fields
+			timer.start('validation')
 			try:
 				if self.cart_reference_given:
 					validate(request_data, CREATE_ORDER_SCHEMA_WITH_CART_REFERENCE)
@@ -352,6 +391,7 @@ class OrderService(object):
 				err = ERROR.INTERNAL_ERROR
 				break
 			# 3. Initialize order Object
+			timer.start('initialize')
 			try:
 				if self.cart_reference_given:
 					self.initialize_order_from_cart_db_data(request_data)
@@ -372,7 +412,11 @@ class OrderService(object):
 				err = ERROR.INTERNAL_ERROR
 				break
 			# 3. calculate and validate price
+			timer.start('price_check')
 			try:
+				self.parallel_fanout = current_app.config.get('PARALLEL_ORDER_FANOUT', False)
+				if self.parallel_fanout:
+					self.start_downstream_calls()
 				self.calculate_and_validate_prices()
 			except SubscriptionNotFoundException:
 				Logger.error("[%s] Subscript not found for data [%s]", g.UUID, json.dumps(request_data))
@@ -398,6 +442,7 @@ class OrderService(object):
 				break
 
 			# 4. check and apply coupons and freebie
+			timer.start('coupons')
 
 			try:
 				response_data = self.get_response_from_check_coupons_api()
@@ -433,15 +478,18 @@ class OrderService(object):
 				break
 
 			# 4.1 calculate shipping charges
+			timer.start('shipping')
 			if self.total_shipping_charges != get_shipping_charges(self.total_offer_price, self.total_discount):
 				err = ERROR.SHIPPING_CHARGES_CHANGED
 				break
 
 
 			# 5. Segregate order items based on shipments, and add freebies with ndd
+			timer.start('segregation')
 			self.segregate_order_based_on_shipments()
 
 			# 6 Create two orders based on ndd and sdd and create a master order id
+			timer.start('save')
 			try:
 				self.create_and_save_order()
 			except NoDeliverySlotException as nse:
@@ -459,6 +507,7 @@ class OrderService(object):
 				break
 
 			# 7 Delete cart of reference id is given
+			timer.start('cart_delete')
 			try:
 				if self.cart_reference_given:
 					remove_cart(self.cart_reference_id)
@@ -470,7 +519,8 @@ class OrderService(object):
 				break
 			# 8 Order History
 
-			# 9 publish on kafka
+			# 9 publish on kafka, through the outbox so it is committed with the order
+			timer.start('publish')
 			try:
 				self.publish_create_order()
 			except Exception as exception:
@@ -485,11 +535,15 @@ class OrderService(object):
 			break
 
 		if error:
+			timer.finish(err)
+			self.cancel_downstream_calls()
 			db.session.rollback()
 			return create_error_response(err)
 		else:
 			try:
+				timer.start('commit')
 				db.session.commit()
+				timer.finish()
 				response = {}
 				if self.final_order_ids.__len__() == 0:
 					response['master_order_id'] = self.parent_reference_id
@@ -516,13 +570,14 @@ class OrderService(object):
 
 				return create_data_response(data=response)
 			except Exception as exception:
+				timer.finish(exception)
 				Logger.error("[%s] Exception occured in committing db changes [%s]", g.UUID, str(exception))
 				ERROR.INTERNAL_ERROR.message = str(exception)
 				return create_error_response(ERROR.INTERNAL_ERROR)
 
 	def initialize_order_from_cart_db_data(self, data):
 		self.cart_reference_id = data['cart_reference_uuid']
-		cart = get_cart(self.cart_reference_id)
+		cart = get_cart(self.cart_reference_id, with_items=True)
 		if cart is None:
 			raise NoSuchCartExistException(ERROR.NO_SUCH_CART_EXIST)
 		self.cart = cart
@@ -581,34 +636,44 @@ class OrderService(object):
 	# self.delivery_slot = json.dumps(data.get('delivery_slot'))
 
 	def fetch_items_price(self, list_of_item_ids):
-		req_data = {
-			"query": {
-				"type": [self.order_type],
-				"filters": {
-					"id": list_of_item_ids
-				},
-				"select": config.SEARCH_API_SELECT_CLAUSE
-			},
-			"count": list_of_item_ids.__len__(),
-			"offset": 0
-		}
-		headers = {'Content-type': 'application/json'}
-		Logger.info("[%s] Request data for calculate price while creating order is [%s]", g.UUID, req_data)
-		response = requests.post(url=current_app.config['PRODUCT_CATALOGUE_URL'], data=json.dumps(req_data), headers=headers, timeout= current_app.config['API_TIMEOUT'])
-		if response.status_code != 200:
-			if response.status_code == 404:
-				Logger.error("[%s] Catalog search API is down", g.UUID)
-				raise ServiceUnAvailableException(ERROR.PRODUCT_CATALOG_SERVICE_DOWN)
-			else:
-				Logger.error("[%s] Error from product catalog service", g.UUID)
-				ERROR.INTERNAL_ERROR.message = "Product catalog return error"
-				raise Exception(ERROR.INTERNAL_ERROR)
-		json_data = json.loads(response.text)
-		Logger.info("[%s] Calculate Price API Request [%s], Response [%s]",
-			g.UUID, json.dumps(req_data), json.dumps(json_data))
-		return json_data['results']
-
-	def calculate_and_validate_prices(self):
+		# Orders always price against the catalog, but the fresh prices are
+		# written back so that carts stop showing stale ones
+		return get_catalog_items(list_of_item_ids, self.order_type, use_cache=False)
+
+	def start_downstream_calls(self):
+		# Catalog, coupon and fulfilment only need data known after initialization,
+		# so issue them together and join each one at the stage that consumes it.
+		# Failures while building a request are left to the owning stage, which
+		# raises them again with the usual error mapping.
+		list_of_items_ids = self.create_item_id_dicts()
+		self.price_call = BackgroundCall(self.fetch_items_price, list_of_items_ids)
+
+		try:
+			req_data = self.create_check_coupons_request_data()
+			if req_data is not None:
+				self.coupon_call = BackgroundCall(CouponService.call_check_coupon_api, req_data)
+		except Exception as exception:
+			Logger.info("[%s] Coupon check not prefetched [%s]", g.UUID, str(exception))
+
+		self.order_shipment_details = self.get_order_shipment_details()
+		if self.order_shipment_details.__len__() == 0:
+			delivery_service = DeliveryService()
+			try:
+				preview_request_data = delivery_service.create_shipment_preview_request_data(
+					{'geo_id': self.geo_id, 'user_id': self.user_id})
+			except Exception as exception:
+				Logger.info("[%s] Shipment preview not prefetched [%s]", g.UUID, str(exception))
+				return
+			self.shipment_preview_call = BackgroundCall(delivery_service.call_shipment_preview_api,
+														preview_request_data)
+
+	def cancel_downstream_calls(self):
+		# a stage that failed before the coupon or shipment stage leaves their calls unjoined
+		for call in (self.price_call, self.coupon_call, self.shipment_preview_call):
+			if call is not None:
+				call.cancel()
+
+	def create_item_id_dicts(self):
 		list_of_items_ids = list()
 
 		if self.cart_reference_given:
@@ -623,20 +688,24 @@ class OrderService(object):
 				list_of_items_ids.append(int(order_item.get('item_uuid')))
 				item_id_to_item_json_dict[int(order_item.get('item_uuid'))] = order_item
 			self.item_id_to_item_json_dict = item_id_to_item_json_dict
+		return list_of_items_ids
 
-		response = self.fetch_items_price(list_of_items_ids)
+	def calculate_and_validate_prices(self):
+		if self.price_call is not None:
+			response = self.price_call.get()
+		else:
+			list_of_items_ids = self.create_item_id_dicts()
+			response = self.fetch_items_price(list_of_items_ids)
 		if response is None or response.__len__() == 0:
 			raise SubscriptionNotFoundException(ERROR.SUBSCRIPTION_NOT_FOUND)
-		order_item_dict = {}
-		for each_response_item in response[0].get('items')[0].get('items'):
-			order_item_dict[int(each_response_item.get('id'))] = each_response_item
+		order_item_dict = response
 
 		if self.cart_reference_given:
-			compare_prices_of_items_objects(item_id_to_item_obj_dict, order_item_dict)
+			compare_prices_of_items_objects(self.item_id_to_item_obj_dict, order_item_dict)
 		else:
-			compare_prices_of_items_json(item_id_to_item_json_dict, order_item_dict)
+			compare_prices_of_items_json(self.item_id_to_item_json_dict, order_item_dict)
 
-	def get_response_from_check_coupons_api(self):
+	def create_check_coupons_request_data(self):
 		product_list = list()
 		if self.cart_reference_given:
 			for key in self.item_id_to_item_obj_dict:
@@ -668,8 +737,16 @@ class OrderService(object):
 				else:
 					coupon_codes = map(str, self.promo_codes)
 					req_data["coupon_codes"] = coupon_codes
+			return req_data
+		return None
 
-			response = CouponService.call_check_coupon_api(req_data)
+	def get_response_from_check_coupons_api(self):
+		req_data = self.create_check_coupons_request_data()
+		if req_data is not None:
+			if self.coupon_call is not None:
+				response = self.coupon_call.get()
+			else:
+				response = CouponService.call_check_coupon_api(req_data)
 			if response.status_code != 200:
 					if response.status_code == 404:
 						Logger.error("[%s] Coupon service is temporarily unavailable", g.UUID)
@@ -728,8 +805,28 @@ class OrderService(object):
 			ERROR.COUPON_SERVICE_RETURNING_FAILURE_STATUS.message = error_msg
 			raise CouponInvalidException(ERROR.COUPON_SERVICE_RETURNING_FAILURE_STATUS)
 
+	def get_order_shipment_details(self):
+		if self.cart is not None:
+			return list(self.cart.orderShipmentDetail)
+		return OrderShipmentDetail.query.filter_by(cart_id=self.cart_reference_id).all()
+
+	def get_cart_items_by_shipment(self):
+		cart_items_by_shipment = {}
+		if self.cart is not None:
+			for cart_item in self.cart.cartItem:
+				cart_items_by_shipment.setdefault(cart_item.shipment_id, list()).append(cart_item)
+		return cart_items_by_shipment
+
+	def get_cart_items_by_ids(self, item_ids):
+		if self.cart is None:
+			return list()
+		item_ids = set(str(item_id) for item_id in item_ids)
+		return [cart_item for cart_item in self.cart.cartItem if str(cart_item.cart_item_id) in item_ids]
+
 	def segregate_order_based_on_shipments(self):
-		order_shipment_details = OrderShipmentDetail.query.filter_by(cart_id=self.cart_reference_id).all()
+		order_shipment_details = self.order_shipment_details
+		if order_shipment_details is None:
+			order_shipment_details = self.get_order_shipment_details()
 		if order_shipment_details is None or order_shipment_details.__len__() == 0:
 			self.shipment_preview_present = False
 			shipment_response = self.get_shipment_preview_for_items()
@@ -762,11 +859,12 @@ class OrderService(object):
 		slot_present_in_request = True
 		if self.shipment_id_slot_dict.values().__len__() == 0:
 			slot_present_in_request = False
+		cart_items_by_shipment = self.get_cart_items_by_shipment()
 		for each_row in order_shipment_details:
 			if slot_present_in_request is False:
 				self.shipment_id_slot_dict[each_row.shipment_id] = each_row.delivery_slot
 			subscription_id_list = list()
-			items = CartItem.query.filter_by(shipment_id=each_row.shipment_id).all()
+			items = cart_items_by_shipment.get(each_row.shipment_id, list())
 			for cart_item_row in items:
 				subscription_id_list.append(cart_item_row.cart_item_id)
 			self.shipment_id_to_item_ids_dict[each_row.shipment_id] = subscription_id_list
@@ -822,7 +920,7 @@ class OrderService(object):
 			order_item_list = list()
 			create_order_item_obj(self.parent_reference_id, self.item_id_to_item_obj_dict.values(),
 									   order_item_list)
-			order.orderItem = order_item_list
+			self.order_items_by_order[order.order_reference_id] = order_item_list
 
 			if self.shipment_id_slot_dict is not None and self.shipment_id_slot_dict.__len__() > 0:
 				order.delivery_slot = validate_delivery_slot(self.shipment_id_slot_dict.values()[0], 'string')
@@ -843,7 +941,7 @@ class OrderService(object):
 			self.order = order
 			self.order_list.append(order)
 			db.session.add(order)
-			db.session.add_all(order_item_list)
+			self.save_order_items()
 			return order.order_reference_id
 		elif self.split_order:
 			freebee_given = False
@@ -860,9 +958,7 @@ class OrderService(object):
 					sub_order.delivery_slot = None
 
 				self.save_common_order_data(sub_order)
-				items = db.session.query(CartItem).filter(
-					CartItem.cart_item_id.in_(self.shipment_id_to_item_ids_dict[key])).filter(
-					CartItem.cart_id == self.cart_reference_id).all()
+				items = self.get_cart_items_by_ids(self.shipment_id_to_item_ids_dict[key])
 
 				order_item_list = list()
 				create_order_item_obj(sub_order.order_reference_id, items, order_item_list)
@@ -882,10 +978,21 @@ class OrderService(object):
 							sub_order.freebie = json.dumps(self.selected_freebies)
 					freebee_given = True
 
-				sub_order.orderItem = order_item_list
+				self.order_items_by_order[sub_order.order_reference_id] = order_item_list
 				db.session.add(sub_order)
-				db.session.add_all(order_item_list)
 				self.order_list.append(sub_order)
+			self.save_order_items()
+
+	def save_order_items(self):
+		# orders go first, their reference id is the items' foreign key
+		db.session.flush()
+		order_items = list()
+		for order in self.order_list:
+			order_items.extend(self.order_items_by_order.get(order.order_reference_id, list()))
+		bulk_insert_order_items(order_items)
+		for order in self.order_list:
+			# the items are already written, keep them readable without a lazy load
+			set_committed_value(order, 'orderItem', self.order_items_by_order.get(order.order_reference_id, list()))
 
 	def save_common_order_data(self, order):
 		order.user_id = self.user_id
@@ -1051,6 +1158,8 @@ class OrderService(object):
 				raise CouponInvalidException(ERROR.COUPON_APPLY_FAILED)
 
 	def get_shipment_preview_for_items(self):
+		if self.shipment_preview_call is not None:
+			return self.shipment_preview_call.get()
 		request_data = {'geo_id': self.geo_id, 'user_id': self.user_id}
 		delivery_service = DeliveryService()
 		return delivery_service.get_shipment_preview(request_data)
@@ -1119,4 +1228,4 @@ class OrderService(object):
 
 		message["data"] = data
 
-		Publisher.publish_message(self.parent_reference_id, json.dumps(message, default=json_serial))
+		OutboxService.publish(self.parent_reference_id, json.dumps(message, default=json_serial))
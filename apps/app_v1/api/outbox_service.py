@@ -0,0 +1,132 @@
+import time
+import logging
+import datetime
+from collections import OrderedDict
+
+from flask import g
+from sqlalchemy import select
+from apps.app_v1.models.models import db, OutboxEvent
+from config import APP_NAME
+from utils.kafka_utils.kafka_publisher import Publisher
+
+__author__ = 'divyagarg'
+
+Logger = logging.getLogger(APP_NAME)
+
+PENDING = 'PENDING'
+SENT = 'SENT'
+FAILED = 'FAILED'
+
+
+class OutboxService(object):
+	"""
+	Kafka messages are added to the session as OutboxEvent rows, so they are
+	committed or rolled back together with the order or payment they describe.
+	OutboxRelay publishes them afterwards, outside the request.
+	"""
+	enabled = False
+	batch_size = 100
+	poll_interval = 0.5
+	max_attempts = 10
+	retry_backoff = 2
+
+	def __init__(self):
+		pass
+
+	@staticmethod
+	def init(app):
+		OutboxService.enabled = app.config.get('KAFKA_OUTBOX_ENABLED', False)
+		OutboxService.batch_size = app.config.get('OUTBOX_RELAY_BATCH_SIZE', OutboxService.batch_size)
+		OutboxService.poll_interval = app.config.get('OUTBOX_RELAY_POLL_INTERVAL', OutboxService.poll_interval)
+		OutboxService.max_attempts = app.config.get('OUTBOX_RELAY_MAX_ATTEMPTS', OutboxService.max_attempts)
+		OutboxService.retry_backoff = app.config.get('OUTBOX_RELAY_RETRY_BACKOFF', OutboxService.retry_backoff)
+
+	@staticmethod
+	def publish(key, message):
+		if not OutboxService.enabled:
+			return Publisher.publish_message(key, message)
+		db.session.add(OutboxEvent(event_key=str(key), topic=Publisher.topic, payload=message))
+		Logger.info("[%s] Kafka message for key [%s] added to outbox", g.UUID, key)
+		return True
+
+
+class OutboxRelay(object):
+	"""
+	Drains pending outbox events to Kafka in batches, oldest first. Events of
+	one key are sent together and in order; while an event of a key is waiting
+	for a retry, later events of that key are held back. Delivery is at least
+	once: a batch sent but not marked before a crash is sent again.
+	"""
+
+	def __init__(self, app):
+		self.app = app
+
+	def run(self):
+		Logger.info("Outbox relay started")
+		with self.app.app_context():
+			while True:
+				self.poll()
+
+	def poll(self):
+		"""
+		Relays one batch and sleeps for the poll interval when it had nothing
+		to send, including when everything pending is backing off.
+		"""
+		relayed = self.relay_batch()
+		if relayed == 0:
+			time.sleep(OutboxService.poll_interval)
+		return relayed
+
+	def relay_batch(self):
+		"""
+		Returns the number of events sent or failed in this batch.
+		"""
+		now = datetime.datetime.utcnow()
+		try:
+			# keys with an event backing off are held back, in the query so they cannot fill the batch
+			waiting_keys = select([OutboxEvent.event_key]).where(OutboxEvent.status == PENDING) \
+				.where(OutboxEvent.available_on > now)
+			events = OutboxEvent.query.filter(OutboxEvent.status == PENDING, OutboxEvent.available_on <= now,
+											  ~OutboxEvent.event_key.in_(waiting_keys)) \
+				.order_by(OutboxEvent.id).limit(OutboxService.batch_size).with_for_update().all()
+			if events.__len__() == 0:
+				db.session.commit()
+				return 0
+
+			events_by_key = OrderedDict()
+			for event in events:
+				events_by_key.setdefault((event.topic, event.event_key), list()).append(event)
+
+			sent = 0
+			failed = 0
+			for (topic, key), key_events in events_by_key.items():
+				try:
+					Publisher.send_messages_sync(topic, key, [event.payload.encode('utf-8') for event in key_events])
+				except Exception as exception:
+					self.mark_failed(key, key_events, exception, now)
+					failed += key_events.__len__()
+					continue
+				for event in key_events:
+					event.status = SENT
+					event.sent_on = now
+				sent += key_events.__len__()
+			db.session.commit()
+			Logger.info("Outbox relay sent [%s] and failed [%s] events", sent, failed)
+			return sent + failed
+		except Exception:
+			db.session.rollback()
+			Logger.error("Exception occurred in outbox relay", exc_info=True)
+			return 0
+
+	def mark_failed(self, key, key_events, exception, now):
+		for event in key_events:
+			event.attempts += 1
+			event.last_error = str(exception)[:512]
+			if event.attempts >= OutboxService.max_attempts:
+				event.status = FAILED
+				Logger.error("Outbox event [%s] for key [%s] failed after [%s] attempts",
+							 event.id, key, event.attempts)
+			else:
+				event.available_on = now + datetime.timedelta(
+					seconds=OutboxService.retry_backoff ** event.attempts)
+		Logger.error("Could not publish outbox events for key [%s] [%s]", key, str(exception))
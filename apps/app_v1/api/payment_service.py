@@ -4,19 +4,24 @@ import datetime
 
 from requests.exceptions import ConnectTimeout
 from flask import g, current_app
-import requests
 from utils.jsonutils.json_utility import json_serial
 
 from utils.jsonutils.output_formatter import create_error_response, create_data_response
 from apps.app_v1.models.models import MasterOrder, Address, Payment, db
 from config import APP_NAME
 from apps.app_v1.api import ERROR, ServiceUnAvailableException
-from utils.kafka_utils.kafka_publisher import Publisher
+from apps.app_v1.api.outbox_service import OutboxService
+from utils.api_utils.http_client import HttpClient
+from utils.api_utils.circuit_breaker import CircuitOpenException
+from utils.api_utils.single_flight import SingleFlight
 
 __author__ = 'amit.bansal'
 
 Logger = logging.getLogger(APP_NAME)
 
+# concurrent status polls of the same order share one payment service call
+PAYMENT_STATUS_FLIGHT = SingleFlight('payment_status')
+
 PAYMENT_METHOD = {
 	   "CC"  : 0,
 	   "DC"  : 1,
@@ -92,6 +97,35 @@ def save_payment_details(pure_json, order_id):
 	return payment_objs
 
 
+def fetch_payment_status(order_id):
+	url = current_app.config['PAYMENT_SERVICE_URL']
+	data = {}
+	data['order_id'] = order_id
+	data['update_order_service'] = False
+	headers = {"Content-type": "application/json"}
+	if current_app.config.get("PAYMENT_AUTH_KEY"):
+		headers['Authorization'] = current_app.config.get(
+			"PAYMENT_AUTH_KEY")
+
+	try:
+		request = HttpClient.post(url=url, data=json.dumps(data),
+								  headers=headers,
+								  dependency='payment')
+	except CircuitOpenException:
+		Logger.error("[%s] Circuit for payment service is open", g.UUID)
+		raise ServiceUnAvailableException(ERROR.PAYMENT_SERVICE_IS_DOWN)
+	if request.status_code == 200:
+		return json.loads(request.text)
+	if request.status_code == 404:
+		Logger.error("[%s] Payment service is down", g.UUID)
+		raise ServiceUnAvailableException(
+			ERROR.PAYMENT_SERVICE_IS_DOWN)
+	Logger.error(
+		"[%s] Exception occurred in Payment service",
+		g.UUID)
+	raise Exception("could not get payment details")
+
+
 def get_payment_details(request):
 	try:
 		raw_data = request.data
@@ -111,40 +145,17 @@ def get_payment_details(request):
 
 		if len(payments) == 0:
 			# call to payment service api
-			url = current_app.config['PAYMENT_SERVICE_URL']
-			data = {}
-			data['order_id'] = pure_json['order_id']
-			data['update_order_service'] = False
-			headers = {"Content-type": "application/json"}
-			if current_app.config.get("PAYMENT_AUTH_KEY"):
-				headers['Authorization'] = current_app.config.get(
-					"PAYMENT_AUTH_KEY")
-
-			request = requests.post(url=url, data=json.dumps(data),
-									headers=headers,
-									timeout=current_app.config[
-										'API_TIMEOUT'])
-			if request.status_code == 200:
-				response = json.loads(request.text)
-				if response['status'] == "success":
-					# update payment_status in order table
-					order_data.payment_status = response['data']['status']
-					db.session.add(order_data)
-					payments = save_payment_details(response['data'],
-													pure_json['order_id'])
-					db.session.commit()
-				else:
-					raise Exception(response['error']["message"])
+			response = PAYMENT_STATUS_FLIGHT.do(pure_json['order_id'], fetch_payment_status,
+												pure_json['order_id'])
+			if response['status'] == "success":
+				# update payment_status in order table
+				order_data.payment_status = response['data']['status']
+				db.session.add(order_data)
+				payments = save_payment_details(response['data'],
+												pure_json['order_id'])
+				db.session.commit()
 			else:
-				if request.status_code == 404:
-					Logger.error("[%s] Payment service is down", g.UUID)
-					raise ServiceUnAvailableException(
-						ERROR.PAYMENT_SERVICE_IS_DOWN)
-				else:
-					Logger.error(
-						"[%s] Exception occurred in Payment service",
-						g.UUID)
-					raise Exception("could not get payment details")
+				raise Exception(response['error']["message"])
 
 		response = {}
 		payment_details = list()
@@ -278,4 +289,4 @@ def publish_update_payment(pure_json, order_id):
 
 	message["data"] = data
 
-	Publisher.publish_message(order_id, json.dumps(message, default=json_serial))
+	OutboxService.publish(order_id, json.dumps(message, default=json_serial))
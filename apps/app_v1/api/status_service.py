@@ -1,21 +1,60 @@
+import logging
+
 from apps.app_v1.api import NoSuchStatusException
-from apps.app_v1.models.models import Status
+from apps.app_v1.models.models import Status, db
 from apps.app_v1.api import ERROR
+from config import APP_NAME
 
 __author__ = 'divyagarg'
 
+Logger = logging.getLogger(APP_NAME)
+
 
 class StatusService(object):
+	"""
+	The status table is tiny and effectively immutable, so code <-> id maps are
+	loaded once per process and served from memory. An unknown code or id
+	triggers one refresh before it is reported as invalid.
+	"""
+	code_to_id = {}
+	id_to_code = {}
+
+	@staticmethod
+	def init(app):
+		with app.app_context():
+			try:
+				StatusService.refresh()
+			except Exception:
+				Logger.error("Could not warm status cache, will load on first use", exc_info=True)
+			finally:
+				# do not hand connections opened here to forked workers
+				db.engine.dispose()
+
+	@staticmethod
+	def refresh():
+		code_to_id = {}
+		id_to_code = {}
+		for status in Status.query.all():
+			code_to_id[status.status_code] = status.id
+			id_to_code[status.id] = status.status_code
+		StatusService.code_to_id = code_to_id
+		StatusService.id_to_code = id_to_code
+		Logger.info("Loaded [%s] statuses", len(code_to_id))
+
 	@staticmethod
 	def get_status_id(value):
-		status = Status.query.filter_by(status_code=value).first()
-		if status is None:
+		if value not in StatusService.code_to_id:
+			StatusService.refresh()
+		status_id = StatusService.code_to_id.get(value)
+		if status_id is None:
 			raise NoSuchStatusException(ERROR.INVALID_STATUS)
-		return status.id
+		return status_id
 
 	@staticmethod
 	def get_status_code(status_id):
-		status = Status.query.filter_by(id=status_id).first()
-		if status is None:
+		if status_id not in StatusService.id_to_code:
+			StatusService.refresh()
+		status_code = StatusService.id_to_code.get(status_id)
+		if status_code is None:
 			raise NoSuchStatusException(ERROR.INVALID_STATUS)
-		return status.status_code
+		return status_code
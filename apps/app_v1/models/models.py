@@ -1,11 +1,15 @@
 import hashlib
+import datetime
 
 from . import db
 from sqlalchemy import func, Index
 from utils.jsonutils.json_utility import JsonUtility
+from utils.jsonutils.model_serializer import ModelSerializer
 
 __author__ = 'divyagarg'
 
+JSON_EXCLUDED_COLUMNS = ('created_on', 'updated_on')
+
 """ Making abstract class having common fields"""
 
 
@@ -15,6 +19,9 @@ class Base(db.Model, JsonUtility):
 	updated_on = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now())
 
 	def convert_to_json(self, pure_json=None, skip_keys_with_none = False):
+		if pure_json is None:
+			return ModelSerializer.serialize(self, exclude=JSON_EXCLUDED_COLUMNS,
+											 skip_keys_with_none=skip_keys_with_none)
 		old_json = self.get_json(pure_json=pure_json, skip_keys_with_none=skip_keys_with_none)
 		for key,val in old_json.items():
 			if str(key).startswith("_"):
@@ -71,6 +78,9 @@ class Address(db.Model, JsonUtility):
 			return address
 
 	def convert_to_json(self, pure_json=None, skip_keys_with_none = False):
+		if pure_json is None:
+			return ModelSerializer.serialize(self, exclude=JSON_EXCLUDED_COLUMNS,
+											 skip_keys_with_none=skip_keys_with_none)
 		old_json = self.get_json(pure_json=pure_json, skip_keys_with_none=skip_keys_with_none)
 		for key,val in old_json.items():
 			if str(key).startswith("_"):
@@ -216,4 +226,22 @@ class Payment(db.Model):
     @classmethod
     def get_payment_details(cls, order_id):
         payments = Payment.query.filter_by(order_id=order_id).all()
-        return payments
\ No newline at end of file
+        return payments
+
+
+class OutboxEvent(db.Model):
+	"""
+	Kafka message written in the same transaction as the order or payment it
+	describes, and published later by the outbox relay.
+	"""
+	id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+	event_key = db.Column(db.String(64), nullable=False, index=True)
+	topic = db.Column(db.String(128), nullable=False)
+	payload = db.Column(db.Text, nullable=False)
+	status = db.Column(db.String(16), nullable=False, default='PENDING')
+	attempts = db.Column(db.Integer, nullable=False, default=0)
+	last_error = db.Column(db.String(512))
+	available_on = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+	sent_on = db.Column(db.DateTime)
+	created_on = db.Column(db.DateTime, server_default=func.now())
+	Index('outbox_event_status_idx', status, available_on)
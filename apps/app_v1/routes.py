@@ -1,21 +1,24 @@
-import json
 import uuid
 import logging
 from apps.app_v1.api.payment_service import get_order_prices, \
-	update_payment_details, get_payment_details
+	update_payment_details, get_payment_details, PAYMENT_STATUS_FLIGHT
 import flask
 from flask import request, g
 from config import APP_NAME
-from apps.app_v1.api.cart_service import CartService
+from apps.app_v1.api.cart_service import CartService, CatalogCache, CatalogBatcher, CATALOG_FLIGHT
+from apps.app_v1.api.cart_cache import CartCache
 from utils.jsonutils.output_formatter import create_error_response
-from apps.app_v1.api.coupon_service import CouponService
-from apps.app_v1.api.delivery_service import DeliveryService, update_slot
+from apps.app_v1.api.coupon_service import CouponService, CouponCheckCache
+from apps.app_v1.api.delivery_service import DeliveryService, ShipmentPreviewCache, update_slot
 from apps.app_v1.api.order_service import OrderService, \
 	get_count_of_orders_of_user, check_if_cod_possible_for_order, \
 	convert_order_to_cod
 from . import app_v1
 from apps.app_v1.api import ERROR
 from lib.decorators import jsonify, logrequest
+from lib.log import loggable_payload
+from lib.metrics import Metrics
+from utils.api_utils.http_client import HttpClient
 
 logger = logging.getLogger(APP_NAME)
 
@@ -29,16 +32,42 @@ def test():
 	return result
 
 
+@app_v1.route('/cache_stats', methods=['GET'])
+@jsonify
+@logrequest
+def cache_stats():
+	return {"success": True, "data": {"catalog": CatalogCache.cache.get_stats(),
+									  "cart": CartCache.get_stats(),
+									  "coupon_check": CouponCheckCache.get_stats(),
+									  "shipment_preview": ShipmentPreviewCache.get_stats()}}
+
+
+@app_v1.route('/dependency_status', methods=['GET'])
+@jsonify
+@logrequest
+def dependency_status():
+	return {"success": True, "data": {"circuits": HttpClient.get_breaker_stats(),
+									  "hosts": HttpClient.get_stats(),
+									  "coalesced": {"catalog": CATALOG_FLIGHT.get_stats(),
+													"payment_status": PAYMENT_STATUS_FLIGHT.get_stats()},
+									  "batched": {"catalog": CatalogBatcher.get_stats()}}}
+
+
+@app_v1.route('/metrics', methods=['GET'])
+def metrics():
+	return flask.Response(Metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app_v1.route('/cart', methods=['POST'])
 @jsonify
 @logrequest
 def createOrUpdateCart():
 	g.UUID = uuid.uuid4()
-	logger.info('START CALL [%s] %s :, arguments = <%s>', g.UUID, '/cart', json.dumps(request.data))
+	logger.info('START CALL [%s] %s :, arguments = <%s>', g.UUID, '/cart', loggable_payload(request.data))
 	try:
 		cartservice = CartService()
 		response = cartservice.create_or_update_cart(request.data)
-		logger.info("[%s] END OF CALL [%s]", g.UUID, json.dumps(response))
+		logger.info("[%s] END OF CALL [%s]", g.UUID, loggable_payload(response))
 		return response
 	except Exception as exception:
 		logger.error("[%s] Exception occured in cart service [%s]", g.UUID, str(exception), exc_info=True)
@@ -53,7 +82,7 @@ def add_item_to_cart_and_get_count_of_items():
 	g.UUID = uuid.uuid4()
 	logger.info(
 		'START CALL [%s] %s : Requested url = <%s> , arguments = <%s>',
-			g.UUID, '/cart', str(request.url), json.dumps(request.data))
+			g.UUID, '/cart', request.url, loggable_payload(request.data))
 	try:
 		cartservice = CartService()
 		response = cartservice.add_item_to_cart(request.data)
@@ -71,7 +100,7 @@ def add_item_to_cart_and_get_count_of_items():
 def get_count_of_orders_of_a_user(user_id):
 	g.UUID = uuid.uuid4()
 	logger.info('START CALL [%s]  [%s] : Requested url = <%s> , arguments = <%s>, user_id =<%s>',
-		g.UUID, '/user', str(request.url), json.dumps(request.data), user_id)
+		g.UUID, '/user', request.url, loggable_payload(request.data), user_id)
 	try:
 		response = get_count_of_orders_of_user(user_id)
 		logger.info("[%s] END OF CALL", g.UUID)
@@ -90,12 +119,12 @@ def order():
 	g.UUID = uuid.uuid4()
 	logger.info(
 		'START CALL [%s] [%s] : Requested url = <%s> , arguments = <%s>',
-			g.UUID, '/order', str(request.url), json.dumps(request.data))
+			g.UUID, '/order', request.url, loggable_payload(request.data))
 
 	try:
 		order_service = OrderService()
 		response = order_service.createorder(request.data)
-		logger.info("[%s] END OF CALL [%s]", g.UUID, json.dumps(response))
+		logger.info("[%s] END OF CALL [%s]", g.UUID, loggable_payload(response))
 		return response
 	except Exception as exception:
 		logger.error("[%s] Exception occured in order service [%s]", g.UUID, str(exception), exc_info=True)
@@ -110,12 +139,12 @@ def delivery_info():
 	g.UUID = uuid.uuid4()
 	logger.info(
 		'START CALL [%s] [%s] : Requested url = <%s> , arguments = <%s>',
-			g.UUID, '/delivery', str(request.url), json.dumps(request.data))
+			g.UUID, '/delivery', request.url, loggable_payload(request.data))
 
 	try:
 		delivery_service = DeliveryService()
 		response = delivery_service.get_delivery_info(request.data)
-		logger.info("[%s] END OF CALL [%s]", g.UUID, json.dumps(response))
+		logger.info("[%s] END OF CALL [%s]", g.UUID, loggable_payload(response))
 		return response
 	except Exception as exception:
 		logger.error("[%s] Exception occured in delivery service [%s]", g.UUID, str(exception), exc_info=True)
@@ -130,10 +159,10 @@ def slot():
 	g.UUID = uuid.uuid4()
 	logger.info(
 		'START CALL [%s] [%s] : Requested url = <%s> , arguments = <%s>',
-			g.UUID, '/slot', str(request.url), json.dumps(request.data))
+			g.UUID, '/slot', request.url, loggable_payload(request.data))
 	try:
 		response = update_slot(request.data)
-		logger.info("[%s] END OF CALL [%s]", g.UUID, json.dumps(response))
+		logger.info("[%s] END OF CALL [%s]", g.UUID, loggable_payload(response))
 		return response
 	except Exception as exception:
 		logger.error("[%s] Exception occured in delivery service [%s]", g.UUID, str(exception), exc_info=True)
@@ -145,9 +174,9 @@ def slot():
 def get_order_prices_api():
 	g.UUID = uuid.uuid4()
 	logger.info('START CALL [%s] [%s] : Requested url = <%s> , arguments = <%s>',
-		g.UUID, '/get_order_price', str(request.url), json.dumps(request.data))
+		g.UUID, '/get_order_price', request.url, loggable_payload(request.data))
 	response = get_order_prices(request)
-	logger.info('[%s] END OF CALL [%s]', g.UUID, json.dumps(response))
+	logger.info('[%s] END OF CALL [%s]', g.UUID, loggable_payload(response))
 	return flask.jsonify(response)
 
 
@@ -155,9 +184,9 @@ def get_order_prices_api():
 def update_payment_details_api():
 	g.UUID = uuid.uuid4()
 	logger.info('START CALL [%s] [%s] : Requested url = <%s> , arguments = <%s>',
-		g.UUID, '/update_payment_details', str(request.url), json.dumps(request.data))
+		g.UUID, '/update_payment_details', request.url, loggable_payload(request.data))
 	response = update_payment_details(request)
-	logger.info('[%s] END OF CALL [%s]', g.UUID, json.dumps(response))
+	logger.info('[%s] END OF CALL [%s]', g.UUID, loggable_payload(response))
 	return flask.jsonify(response)
 
 
@@ -165,9 +194,9 @@ def update_payment_details_api():
 def get_payment_details_api():
 	g.UUID = uuid.uuid4()
 	logger.info('START CALL [%s] [%s] : Requested url = <%s> , arguments = <%s>',
-		g.UUID, '/get_payment_details', str(request.url), json.dumps(request.data))
+		g.UUID, '/get_payment_details', request.url, loggable_payload(request.data))
 	response = get_payment_details(request)
-	logger.info('[%s] END OF CALL [%s]', g.UUID, json.dumps(response))
+	logger.info('[%s] END OF CALL [%s]', g.UUID, loggable_payload(response))
 	return flask.jsonify(response)
 
 
@@ -175,53 +204,53 @@ def get_payment_details_api():
 def change_user():
 	g.UUID = uuid.uuid4()
 	logger.info('START CALL [%s] [%s] : Requested url = <%s> , arguments = <%s>',
-		g.UUID, '/change_user', str(request.url), json.dumps(request.data))
+		g.UUID, '/change_user', request.url, loggable_payload(request.data))
 	cart_service = CartService()
 	response = cart_service.change_user(request.data)
-	logger.info('[%s] END OF CALL [%s]', g.UUID, json.dumps(response))
+	logger.info('[%s] END OF CALL [%s]', g.UUID, loggable_payload(response))
 	return flask.jsonify(response)
 
 
 @app_v1.route('/check_coupon', methods=['POST'])
 def check_coupon():
 	g.UUID = uuid.uuid4()
-	logger.info('START CALL [%s] [%s]: Request url = [%s], arguments = [%s]', g.UUID, '/check_coupon', str(request.url), json.dumps(request.data))
+	logger.info('START CALL [%s] [%s]: Request url = [%s], arguments = [%s]', g.UUID, '/check_coupon', request.url, loggable_payload(request.data))
 	response = CouponService.check_coupon_api(request.data)
-	logger.info('[%s] END OF CALL [%s]', g.UUID, json.dumps(response))
+	logger.info('[%s] END OF CALL [%s]', g.UUID, loggable_payload(response))
 	return flask.jsonify(response)
 
 
 @app_v1.route('/check_cod/<order_id>', methods = ['GET'])
 def check_cod(order_id):
 	g.UUID = uuid.uuid4()
-	logger.info('START CALL [%s] Request url = [%s], arguments = [%s], order_id = [%s]', g.UUID, str(request.url), json.dumps(request.data), order_id)
+	logger.info('START CALL [%s] Request url = [%s], arguments = [%s], order_id = [%s]', g.UUID, request.url, loggable_payload(request.data), order_id)
 	response = check_if_cod_possible_for_order(order_id)
-	logger.info('[%s] END OF CALL [%s]', g.UUID, json.dumps(response))
+	logger.info('[%s] END OF CALL [%s]', g.UUID, loggable_payload(response))
 	return flask.jsonify(response)
 
 
 @app_v1.route('/convert_cod', methods = ['POST'])
 def convert_cod():
 	g.UUID = uuid.uuid4()
-	logger.info('START CALL [%s] Request url = [%s], arguments = [%s], order_id = [%s]', g.UUID, str(request.url), json.dumps(request.data))
+	logger.info('START CALL [%s] Request url = [%s], arguments = [%s], order_id = [%s]', g.UUID, request.url, loggable_payload(request.data))
 	response = convert_order_to_cod(request.data)
-	logger.info('[%s] END OF CALL [%s]', g.UUID, json.dumps(response))
+	logger.info('[%s] END OF CALL [%s]', g.UUID, loggable_payload(response))
 	return flask.jsonify(response)
 
 
 @app_v1.route('/add_item_to_cart', methods = ['POST'])
 def add_to_cart():
 	g.UUID = uuid.uuid4()
-	logger.info('START CALL [%s] Request url = [%s], arguments = [%s]' , g.UUID, str(request.url), json.dumps(request.data))
+	logger.info('START CALL [%s] Request url = [%s], arguments = [%s]' , g.UUID, request.url, loggable_payload(request.data))
 	response = CartService().add_to_cart(request.data)
-	logger.info('[%s] END OF CALL [%s]', g.UUID, json.dumps(response))
+	logger.info('[%s] END OF CALL [%s]', g.UUID, loggable_payload(response))
 	return flask.jsonify(response)
 
 
 @app_v1.route('/remove_from_cart', methods = ['POST'])
 def remove_from_cart():
 	g.UUID = uuid.uuid4()
-	logger.info('START CALL [%s] Request url = [%s], arguments = [%s]' , g.UUID, str(request.url), json.dumps(request.data))
+	logger.info('START CALL [%s] Request url = [%s], arguments = [%s]' , g.UUID, request.url, loggable_payload(request.data))
 	response = CartService().remove_from_cart(request.data)
-	logger.info('[%s] END OF CALL [%s]', g.UUID, json.dumps(response))
+	logger.info('[%s] END OF CALL [%s]', g.UUID, loggable_payload(response))
 	return flask.jsonify(response)
@@ -0,0 +1,92 @@
+"""
+Self-contained end to end benchmark. Boots the app with create_app('testing')
+against the local test database, points every downstream at the in-process
+fakes of benchmarks.fake_services, publishes Kafka events to the file broker
+through the outbox relay, and drives the journeys of benchmarks.journeys:
+
+    python -m benchmarks.bench_end_to_end [--users 50] [--duration 30]
+        [--latency-ms 20] [--jitter-ms 10] [--error-rate 0.0]
+
+Prints throughput and p50/p95/p99 per endpoint, followed by the calls each
+fake received and the service's cache and dependency stats.
+"""
+__author__ = 'divyagarg'
+# the fakes, the app server and the virtual users all share one gevent hub
+import gevent.monkey
+
+gevent.monkey.patch_all()
+
+import json
+import logging
+import argparse
+
+import gevent
+from gevent.pywsgi import WSGIServer
+
+from config import config
+from apps import create_app
+from apps.app_v1.models import db, ORDER_STATUS
+from apps.app_v1.models.models import Status
+from benchmarks import journeys
+from benchmarks.fake_services import start_fake_services
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    return parser.parse_args()
+
+
+def boot_app(urls):
+    testing_config = config['testing']
+    for key, url in urls.items():
+        setattr(testing_config, key, url)
+    # run() starts the outbox relay next to the app
+    testing_config.KAFKA_OUTBOX_ENABLED = True
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        # orders are created PENDING and moved on by payment updates
+        existing = set(status.status_code for status in Status.query.all())
+        for status in ORDER_STATUS:
+            if status.value not in existing:
+                db.session.add(Status(status_code=status.value))
+        db.session.commit()
+    return app
+
+
+def run(args):
+    services, urls = start_fake_services(args.latency_ms / 1000.0, args.jitter_ms / 1000.0, args.error_rate)
+    app = boot_app(urls)
+    server = WSGIServer(('127.0.0.1', 0), app, log=None)
+    server.start()
+    base_url = 'http://127.0.0.1:%d' % server.server_port
+
+    from apps.app_v1.api.outbox_service import OutboxRelay
+    relay = gevent.spawn(OutboxRelay(app).run)
+    try:
+        journeys.run(base_url, args.users, args.duration)
+    finally:
+        relay.kill()
+        server.stop()
+        for service in services.values():
+            service.stop()
+
+    print
+    print "%-24s %8s %7s" % ('fake service', 'calls', 'errors')
+    for name in sorted(services):
+        print "%-24s %8d %7d" % (name, services[name].calls, services[name].errors)
+    client = app.test_client()
+    for path in ('/grocery_orderapi/v1/cache_stats', '/grocery_orderapi/v1/dependency_status'):
+        print
+        print path
+        print json.dumps(json.loads(client.get(path).data).get('data'), indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    run(parse_args())
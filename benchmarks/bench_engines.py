@@ -0,0 +1,21 @@
+"""
+Closed loop load against a running deployment, driving the journeys of
+benchmarks.journeys. Reports throughput and latency percentiles per endpoint,
+so the gevent and threaded engines can be compared on the same hardware:
+
+    uwsgi --ini grocery_order_service_uwsgi.ini --http :9890
+    python -m benchmarks.bench_engines http://127.0.0.1:9890 [users] [seconds]
+
+    uwsgi --ini grocery_order_service_uwsgi_threaded.ini --http :9890
+    python -m benchmarks.bench_engines http://127.0.0.1:9890 [users] [seconds]
+
+Downstream services are whatever the deployment's config points at.
+"""
+__author__ = 'divyagarg'
+import sys
+
+from benchmarks.journeys import run
+
+
+if __name__ == '__main__':
+    run(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 50, float(sys.argv[3]) if len(sys.argv) > 3 else 30)
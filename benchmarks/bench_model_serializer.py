@@ -0,0 +1,55 @@
+"""
+Compares the jsonpickle based JsonUtility.get_json path with the compiled
+ModelSerializer for the models the APIs serialize.
+
+    python -m benchmarks.bench_model_serializer [iterations]
+"""
+__author__ = 'divyagarg'
+import sys
+import timeit
+import datetime
+
+from flask import Flask
+
+from apps.app_v1.models import initialize_db
+from apps.app_v1.models.models import Address, Cart, JSON_EXCLUDED_COLUMNS
+from utils.jsonutils.model_serializer import ModelSerializer
+
+
+def legacy_convert_to_json(obj):
+    old_json = obj.get_json()
+    for key, val in old_json.items():
+        if str(key).startswith("_"):
+            old_json.pop(key)
+    old_json.pop('created_on', None)
+    old_json.pop('updated_on', None)
+    return old_json
+
+
+def build_objects():
+    address = Address(id=1, name='Divya Garg', mobile='1234567890', address='121/5 Silver Oaks Apartment',
+                      city='Gurgaon', pincode='122001', state='Haryana', email='divi191@gmail.com',
+                      landmark='Near Qutub plaza', address_hash='a' * 40)
+    cart = Cart(id=1, cart_reference_uuid='a3d64e4021bb11e6985cf45c899d26fb', geo_id=29557,
+                user_id='8088275032', order_type='grocery', order_source_reference='0', total_offer_price=250.0,
+                total_display_price=300.0, total_discount=10.0, total_shipping_charges=0.0,
+                created_on=datetime.datetime.utcnow(), updated_on=datetime.datetime.utcnow())
+    return [address, cart]
+
+
+def run(iterations):
+    for obj in build_objects():
+        name = type(obj).__name__
+        legacy = timeit.timeit(lambda: legacy_convert_to_json(obj), number=iterations)
+        compiled = timeit.timeit(
+            lambda: ModelSerializer.serialize(obj, exclude=JSON_EXCLUDED_COLUMNS), number=iterations)
+        print "%-8s legacy %8.2f us/obj   compiled %8.2f us/obj   speedup %5.1fx" % (
+            name, legacy * 1e6 / iterations, compiled * 1e6 / iterations, legacy / compiled)
+
+
+if __name__ == '__main__':
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    initialize_db(app)
+    with app.app_context():
+        run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
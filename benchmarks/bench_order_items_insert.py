@@ -0,0 +1,91 @@
+"""
+Times persisting an order with 5, 50 and 200 items through the unit of work
+(one INSERT per item) and through bulk_insert_order_items (executemany).
+
+    python -m benchmarks.bench_order_items_insert [database_uri] [rounds]
+
+Defaults to a temporary on-disk SQLite file. To measure against MySQL pass
+the URI of a scratch database that already has the migrations applied; the
+benchmark never creates or drops tables there and leaves its orders behind.
+"""
+__author__ = 'divyagarg'
+import os
+import sys
+import time
+import uuid
+import tempfile
+
+from flask import Flask
+
+from apps.app_v1.models import initialize_db, db
+from apps.app_v1.models.models import Order, OrderItem, Status
+from apps.app_v1.api.order_service import bulk_insert_order_items
+
+BASKET_SIZES = [5, 50, 200]
+
+
+def build_order(item_count, status_id):
+    order_reference_id = uuid.uuid1().hex
+    order = Order(parent_order_id=order_reference_id, order_reference_id=order_reference_id, geo_id=29557,
+                  user_id='8088275032', shipping_address_ref='a' * 40, total_offer_price=100.0,
+                  status_id=status_id)
+    items = [OrderItem(item_id=str(item_id), quantity=1, display_price=10.0, offer_price=9.0,
+                       item_discount=0.0, item_cashback=0.0, transfer_price=8.0, title='Item %s' % item_id,
+                       image_url='http://img/%s' % item_id, order_id=order_reference_id)
+             for item_id in range(item_count)]
+    return order, items
+
+
+def save_with_unit_of_work(order, items):
+    order.orderItem = items
+    db.session.add(order)
+    db.session.add_all(items)
+    db.session.commit()
+
+
+def save_with_bulk_insert(order, items):
+    db.session.add(order)
+    db.session.flush()
+    bulk_insert_order_items(items)
+    db.session.commit()
+
+
+def run(rounds):
+    status = Status.query.filter_by(status_code='PENDING').first()
+    if status is None:
+        status = Status(status_code='PENDING')
+        db.session.add(status)
+        db.session.commit()
+    for item_count in BASKET_SIZES:
+        results = []
+        for save in (save_with_unit_of_work, save_with_bulk_insert):
+            elapsed = 0.0
+            for _ in range(rounds):
+                order, items = build_order(item_count, status.id)
+                start = time.time()
+                save(order, items)
+                elapsed += time.time() - start
+            results.append(elapsed * 1000 / rounds)
+        print "%4d items   unit of work %8.2f ms/order   bulk %8.2f ms/order   speedup %5.1fx" % (
+            item_count, results[0], results[1], results[0] / results[1])
+
+
+if __name__ == '__main__':
+    database_file = None
+    if len(sys.argv) > 1:
+        database_uri = sys.argv[1]
+    else:
+        handle, database_file = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        database_uri = 'sqlite:///%s' % database_file
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    initialize_db(app)
+    try:
+        with app.app_context():
+            if database_file is not None:
+                db.create_all()
+            run(int(sys.argv[2]) if len(sys.argv) > 2 else 20)
+    finally:
+        if database_file is not None and os.path.exists(database_file):
+            os.remove(database_file)
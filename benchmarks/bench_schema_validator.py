@@ -0,0 +1,73 @@
+"""
+Compares the schema walking validator with the compiled one over
+representative cart and order payloads.
+
+    python -m benchmarks.bench_schema_validator [iterations]
+"""
+__author__ = 'divyagarg'
+import sys
+import uuid
+import timeit
+import logging
+
+from flask import Flask, g
+
+from apps.app_v1.api.api_schema_signature import CREATE_CART_SCHEMA, CREATE_ORDER_SCHEMA_WITH_CART_REFERENCE
+from utils.jsonutils.json_schema_validator import validate, validate_interpreted
+
+ADDRESS = {
+    "name": "Divya Garg",
+    "mobile": "1234567890",
+    "email": "divi191@gmail.com",
+    "address": "121/5 SIlver Oaks Apartment DLF phase 1",
+    "city": "Gurgaon",
+    "pincode": "122001",
+    "state": "Haryana",
+    "landmark": "Near Qutub plaza"
+}
+
+CART_PAYLOAD = {
+    "geo_id": 29557,
+    "user_id": "8088275032",
+    "order_type": 0,
+    "order_source_reference": 0,
+    "payment_mode": 0,
+    "promo_codes": ["TEST10"],
+    "shipping_address": ADDRESS,
+    "orderitems": [{"item_uuid": str(item_id), "quantity": 2, "promo_codes": []} for item_id in range(20)]
+}
+
+ORDER_PAYLOAD = {
+    "cart_reference_uuid": "a3d64e4021bb11e6985cf45c899d26fb",
+    "billing_address": ADDRESS,
+    "geo_id": 29557,
+    "user_id": "8088275032",
+    "order_source_reference": 0,
+    "payment_mode": 0,
+    "delivery_slots": [{"shipment_id": "s1", "start_datetime": "2016-06-01T10:00:00",
+                        "end_datetime": "2016-06-01T12:00:00"}]
+}
+
+
+def run(iterations):
+    for name, payload, schema in (('cart', CART_PAYLOAD, CREATE_CART_SCHEMA),
+                                  ('order', ORDER_PAYLOAD, CREATE_ORDER_SCHEMA_WITH_CART_REFERENCE)):
+        def measure(validator):
+            def call():
+                try:
+                    validator(payload, schema)
+                except Exception:
+                    pass
+            return timeit.timeit(call, number=iterations)
+        interpreted = measure(validate_interpreted)
+        compiled = measure(validate)
+        print "%-6s interpreted %8.2f us/req   compiled %8.2f us/req   speedup %5.1fx" % (
+            name, interpreted * 1e6 / iterations, compiled * 1e6 / iterations, interpreted / compiled)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    app = Flask(__name__)
+    with app.app_context():
+        g.UUID = uuid.uuid1()
+        run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
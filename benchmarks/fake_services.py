@@ -0,0 +1,111 @@
+"""
+In-process stand-ins for the catalog, coupon, fulfilment and payment
+services, served with gevent's WSGI server on local ports. Each one answers
+in the shape the service expects, after a configurable latency, and fails a
+configurable fraction of calls with a 503.
+"""
+__author__ = 'divyagarg'
+import json
+import random
+import threading
+
+import gevent
+from gevent.pywsgi import WSGIServer
+
+
+def catalog_item(item_id):
+    base_price = 100.0 + item_id % 50
+    return {"id": item_id, "basePrice": base_price, "offerPrice": base_price - 10.0,
+            "transferPrice": base_price - 20.0, "maxQuantity": 100, "deliveryDays": item_id % 2,
+            "title": "Item %d" % item_id, "imageURL": "http://localhost/images/%d.png" % item_id}
+
+
+def search_catalog(request_data):
+    item_ids = request_data['query']['filters']['id']
+    return {"results": [{"items": [{"items": [catalog_item(int(item_id)) for item_id in item_ids]}]}]}
+
+
+def check_coupon(request_data):
+    products = [{"itemid": product['item_id'], "discount": 0.0, "cashback": 0.0}
+                for product in request_data.get('products', [])]
+    return {"success": True, "totalDiscount": 0.0, "totalCashback": 0.0, "paymentMode": None,
+            "products": products, "benefits": []}
+
+
+def apply_coupon(request_data):
+    return {"success": True}
+
+
+def shipment_preview(request_data):
+    order_items = request_data['order_data']['order_items']
+    shipment_items = [dict(order_item) for order_item in order_items]
+    return {"success": True, "data": {"fulfilment_estimates": [{"shipments": [{"shipment_items": shipment_items}]}]}}
+
+
+def payment_status(request_data):
+    return {"status": "success", "data": {"status": "success", "paymentMode": "CC", "bankGateway": "HDFC",
+                                          "txnAmount": 100.0, "pgTxnId": "bench%s" % request_data['order_id']}}
+
+
+HANDLERS = {
+    'catalog': search_catalog,
+    'coupon_check': check_coupon,
+    'coupon_apply': apply_coupon,
+    'fulfilment': shipment_preview,
+    'payment': payment_status
+}
+
+
+class FakeService(object):
+    def __init__(self, name, handler, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.name = name
+        self.handler = handler
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.server = None
+
+    def __call__(self, environ, start_response):
+        with self.lock:
+            self.calls += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            gevent.sleep(delay)
+        if random.random() < self.error_rate:
+            with self.lock:
+                self.errors += 1
+            start_response('503 Service Unavailable', [('Content-type', 'application/json')])
+            return ['{"errors": ["injected failure"]}']
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        request_data = json.loads(environ['wsgi.input'].read(length) or '{}')
+        body = json.dumps(self.handler(request_data))
+        start_response('200 OK', [('Content-type', 'application/json'), ('Content-Length', str(len(body)))])
+        return [body]
+
+    def start(self):
+        self.server = WSGIServer(('127.0.0.1', 0), self, log=None)
+        self.server.start()
+        return 'http://127.0.0.1:%d/%s' % (self.server.server_port, self.name)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.stop()
+
+
+def start_fake_services(latency=0.0, jitter=0.0, error_rate=0.0):
+    """
+    Starts one fake per dependency and returns ({name: service}, {config key: url}).
+    """
+    services = dict((name, FakeService(name, handler, latency, jitter, error_rate))
+                    for name, handler in HANDLERS.items())
+    urls = {
+        'PRODUCT_CATALOGUE_URL': services['catalog'].start(),
+        'COUPON_CHECK_URL': services['coupon_check'].start(),
+        'COUPOUN_APPLY_URL': services['coupon_apply'].start(),
+        'SHIPMENT_PREVIEW_URL': services['fulfilment'].start(),
+        'PAYMENT_SERVICE_URL': services['payment'].start()
+    }
+    return services, urls
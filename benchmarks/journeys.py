@@ -0,0 +1,136 @@
+"""
+Scripted user journeys over the HTTP API and the latency bookkeeping shared
+by the load benchmarks. Each virtual user loops: create a cart, add an item,
+get delivery info, place the order and report its payment.
+"""
+__author__ = 'divyagarg'
+import copy
+import json
+import time
+import random
+import threading
+
+import requests
+
+PREFIX = '/grocery_orderapi/v1'
+ENDPOINTS = ('/cart', '/add_item_to_cart', '/delivery', '/order', '/update_payment_details')
+
+ADDRESS = {
+    "name": "Divya Garg",
+    "mobile": "1234567890",
+    "email": "divi191@gmail.com",
+    "address": "121/5 SIlver Oaks Apartment DLF phase 1",
+    "city": "Gurgaon",
+    "pincode": "122001",
+    "state": "Haryana",
+    "landmark": "Near Qutub plaza"
+}
+
+CART_PAYLOAD = {
+    "geo_id": 29557,
+    "order_type": 0,
+    "order_source_reference": 0,
+    "payment_mode": 0,
+    "shipping_address": ADDRESS,
+    "orderitems": []
+}
+
+ORDER_PAYLOAD = {
+    "billing_address": ADDRESS,
+    "geo_id": 29557,
+    "order_source_reference": 0,
+    "payment_mode": 0
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Recorder(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = dict((endpoint, []) for endpoint in ENDPOINTS)
+        self.errors = dict((endpoint, 0) for endpoint in ENDPOINTS)
+
+    def record(self, endpoint, elapsed, ok):
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def report(self, duration):
+        print "%-24s %8s %7s %9s %9s %9s %9s" % ('endpoint', 'requests', 'errors', 'req/s', 'p50 ms',
+                                                 'p95 ms', 'p99 ms')
+        for endpoint in ENDPOINTS:
+            latencies = sorted(self.latencies[endpoint])
+            print "%-24s %8d %7d %9.1f %9.1f %9.1f %9.1f" % (
+                endpoint, len(latencies), self.errors[endpoint], len(latencies) / duration,
+                percentile(latencies, 0.50) * 1000, percentile(latencies, 0.95) * 1000,
+                percentile(latencies, 0.99) * 1000)
+
+
+def call(session, recorder, base_url, endpoint, payload):
+    start = time.time()
+    ok = False
+    body = None
+    try:
+        response = session.post(base_url + PREFIX + endpoint, data=json.dumps(payload),
+                                headers={'Content-type': 'application/json'}, timeout=30)
+        body = response.json()
+        ok = response.status_code == 200 and body.get('status') is True
+    except Exception:
+        pass
+    recorder.record(endpoint, time.time() - start, ok)
+    return body if ok else None
+
+
+def journey(session, recorder, base_url, user_id, item_ids):
+    cart_payload = copy.deepcopy(CART_PAYLOAD)
+    cart_payload['user_id'] = user_id
+    cart_payload['orderitems'] = [{"item_uuid": str(item_id), "quantity": random.randint(1, 3), "promo_codes": []}
+                                  for item_id in random.sample(item_ids, random.randint(1, 5))]
+    cart = call(session, recorder, base_url, '/cart', cart_payload)
+    if cart is None:
+        return
+    add_payload = dict(cart_payload, orderitems=[{"item_uuid": str(random.choice(item_ids)), "quantity": 1,
+                                                  "promo_codes": []}])
+    call(session, recorder, base_url, '/add_item_to_cart', add_payload)
+    if call(session, recorder, base_url, '/delivery', {"geo_id": cart_payload['geo_id'], "user_id": user_id}) is None:
+        return
+    order_payload = dict(ORDER_PAYLOAD, user_id=user_id, cart_reference_uuid=cart['data']['cart_reference_uuid'])
+    order = call(session, recorder, base_url, '/order', order_payload)
+    if order is None:
+        return
+    call(session, recorder, base_url, '/update_payment_details',
+         {"order_id": order['data']['master_order_id'], "status": "success",
+          "childTxns": [{"paymentMode": "CC", "bankGateway": "HDFC", "txnAmount": 100.0, "status": "success"}]})
+
+
+def run(base_url, users, duration, item_ids=range(1, 201)):
+    """
+    Runs users concurrent journeys for duration seconds and prints the report.
+    Under gevent's monkey patching the virtual users are greenlets.
+    """
+    recorder = Recorder()
+    deadline = time.time() + duration
+
+    def virtual_user(index):
+        session = requests.Session()
+        iteration = 0
+        while time.time() < deadline:
+            journey(session, recorder, base_url, 'bench%d_%d_%d' % (index, iteration, random.randint(0, 1 << 30)),
+                    item_ids)
+            iteration += 1
+
+    threads = [threading.Thread(target=virtual_user, args=(index,)) for index in range(users)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    recorder.report(time.time() - start)
+    return recorder
@@ -22,12 +22,96 @@ class Config:
 	DEBUG = False
 	TESTING = False
 	API_TIMEOUT = 10
+	# Fail fast on unreachable hosts; API_TIMEOUT is the read timeout of dependencies not listed below.
+	# Catalog, coupon and fulfilment get 5s instead of the former 10s, payment keeps 10s
+	HTTP_CONNECT_TIMEOUT = 1
+	HTTP_READ_TIMEOUTS = {'catalog': 5, 'coupon': 5, 'fulfilment': 5, 'payment': 10}
+	# Open a dependency's circuit after consecutive failures and probe it again after the reset timeout
+	CIRCUIT_FAILURE_THRESHOLD = 5
+	CIRCUIT_RESET_TIMEOUT = 10
+	CIRCUIT_HALF_OPEN_MAX_CALLS = 1
+	# Connection pool per downstream host, sized to the uwsgi "gevent = 1024" greenlets of a worker
+	HTTP_POOL_MAXSIZE = 1024
+	HTTP_POOL_BLOCK = False
+	# Issue catalog, coupon and fulfilment calls of an order concurrently
+	PARALLEL_ORDER_FANOUT = True
+	# Check coupons speculatively while the catalog prices a cart
+	PARALLEL_CART_FANOUT = True
+	# Catalog details of items served to carts, orders always bypass the cache
+	CATALOG_CACHE_ENABLED = True
+	CATALOG_CACHE_TTL = 60
+	CATALOG_CACHE_MAXSIZE = 10000
+	# Hold catalog lookups this long to merge concurrent requests of an order type into one search; 0 disables
+	CATALOG_BATCH_WINDOW_MS = 0
+	CATALOG_BATCH_MAX_ITEMS = 100
+	# Cart snapshots per (geo_id, user_id); only coherent across uwsgi workers with a shared backend
+	CART_CACHE_ENABLED = False
+	CART_CACHE_TTL = 30
+	CART_CACHE_MAXSIZE = 10000
+	# Successful coupon checks of an identical payload; apply_coupon always goes to the coupon service
+	COUPON_CHECK_CACHE_ENABLED = True
+	COUPON_CHECK_CACHE_TTL = 10
+	COUPON_CHECK_CACHE_MAXSIZE = 10000
+	# Shipment previews by address and items, reused by order placement after /delivery
+	SHIPMENT_PREVIEW_CACHE_ENABLED = True
+	SHIPMENT_PREVIEW_CACHE_TTL = 120
+	SHIPMENT_PREVIEW_CACHE_MAXSIZE = 10000
+	# Write logs from a background thread; payloads are truncated and sampled
+	LOG_ASYNC = True
+	LOG_PAYLOAD_MAX_LENGTH = 4096
+	LOG_PAYLOAD_SAMPLE_RATE = 1.0
+	# Write Kafka events to the outbox table with the order; only enable where "manage.py outbox_relay" runs
+	KAFKA_OUTBOX_ENABLED = False
+	OUTBOX_RELAY_BATCH_SIZE = 100
+	OUTBOX_RELAY_POLL_INTERVAL = 0.5
+	OUTBOX_RELAY_MAX_ATTEMPTS = 10
+	OUTBOX_RELAY_RETRY_BACKOFF = 2
+	# Kafka producer: 'legacy' keyed producer, 'batched' (size/time batching, compressed) or 'file' stand-in
+	KAFKA_PRODUCER = 'batched'
+	KAFKA_COMPRESSION_TYPE = 'gzip'
+	KAFKA_BATCH_SIZE = 65536
+	KAFKA_LINGER_MS = 10
+	KAFKA_ACKS = 1
+	KAFKA_RETRIES = 3
+	KAFKA_SEND_TIMEOUT = 10
+	# Longest send() blocks waiting for metadata or buffer space before it raises
+	KAFKA_MAX_BLOCK_MS = 1000
+	# Messages Kafka does not take are spooled to local disk and replayed in order
+	KAFKA_SPOOL_ENABLED = True
+	# Left unset, init_app puts it under the environment's HOME so it survives /tmp cleanups in production
+	KAFKA_SPOOL_DIR = None
+	KAFKA_SPOOL_SEGMENT_BYTES = 16 * 1024 * 1024
+	KAFKA_SPOOL_FSYNC = False
+	KAFKA_SPOOL_REPLAY_INTERVAL = 1.0
+	# Each uwsgi worker snapshots its metrics here so /metrics can report all of them; left unset, init_app
+	# puts it under the environment's HOME
+	METRICS_DIR = None
+	METRICS_FLUSH_INTERVAL = 5
+	# Span tree per request; sampled, slow and failed traces are written as Zipkin JSON and/or sent to a collector
+	TRACING_ENABLED = True
+	TRACING_SAMPLE_RATE = 0.01
+	TRACING_SLOW_MS = 2000
+	TRACING_MAX_SPANS = 1000
+	# Left unset, init_app writes it next to the service logs
+	TRACING_FILE = None
+	TRACING_COLLECTOR_URL = None
+	# Per-request query counts, slow queries and repeated (N+1) statements; full statement logging is separate
+	SQL_PROFILER_ENABLED = True
+	SQL_SLOW_QUERY_MS = 200
+	SQL_REPEATED_QUERY_THRESHOLD = 5
+	SQL_STATEMENT_LOGGING = False
 	def __init__(self):
 		pass
 
 	@staticmethod
 	def init_app(app):
-		pass
+		home = app.config.get('HOME', HOME)
+		if app.config.get('KAFKA_SPOOL_DIR') is None:
+			app.config['KAFKA_SPOOL_DIR'] = os.path.join(home, 'grocery_order_service_kafka_spool')
+		if app.config.get('METRICS_DIR') is None:
+			app.config['METRICS_DIR'] = os.path.join(home, 'grocery_order_service_metrics')
+		if app.config.get('TRACING_FILE') is None:
+			app.config['TRACING_FILE'] = os.path.join(home, LOG_DIR, 'grocery_order_service_traces.log')
 
 
 class DevelopmentConfig(Config):
@@ -45,6 +129,8 @@ class DevelopmentConfig(Config):
 	SQLALCHEMY_POOL_SIZE = 100
 	SQLALCHEMY_POOL_TIMEOUT = 20
 	SQLALCHEMY_POOL_RECYCLE = 1750
+	TRACING_SAMPLE_RATE = 1.0
+	SQL_STATEMENT_LOGGING = True
 	PRODUCT_CATALOGUE_URL = "http://pyservice01.staging.askme.com:9070/v1/search"
 	COUPON_CHECK_URL = "http://pyservice01.staging.askme.com:8823/vouchers/grocery/v1/check"
 	COUPOUN_APPLY_URL = "http://pyservice01.staging.askme.com:8823/vouchers/grocery/v1/apply"
@@ -67,6 +153,8 @@ class TestingConfig(Config):
 	SECRET_KEY = 'hard to guess string'
 	KAFKA_HOSTS = ['dc1.staging.askme.com:9092', 'dc2.staging.askme.com:9092']
 	KAFKA_TOPIC = 'grocery_orderservice_staging'
+	KAFKA_PRODUCER = 'file'
+	KAFKA_FILE_BROKER_PATH = '/tmp/grocery_order_service_kafka_test.log'
 	# KAKFA_GROUP = 'fulfillmentservice_group'
 	SQLALCHEMY_DATABASE_URI = DATABASE_URI + DATABASE_NAME
 	SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -132,6 +220,7 @@ class ProductionConfig(Config):
 
 	KAFKA_HOSTS= ['kafka01.production.askmebazaar.com:9092', 'kafka02.production.askmebazaar.com:9092','kafka03.production.askmebazaar.com:9092']
 	KAFKA_TOPIC = 'grocery_orderservice_prod'
+	LOG_PAYLOAD_SAMPLE_RATE = 0.2
 
 
 config = {
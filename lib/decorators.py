@@ -2,7 +2,8 @@ import time
 import functools
 import logging
 import ujson as json
-from flask import Response
+from flask import Response, g
+from lib.log import loggable_payload
 logger = logging.getLogger()
 
 def logtime(f):
@@ -32,7 +33,11 @@ def jsonify(f):
       logger.exception('Error while processing request')
       resp = Response(response=json.dumps({'message': str(e)}), status=500,
         mimetype="application/json")
-    logger.info('Total time taken = %s', time.time() - start)
+    stage_timings = getattr(g, 'stage_timings', None)
+    if stage_timings:
+      logger.info('Total time taken = %s, stages (stage, outcome, ms) = %s', time.time() - start, stage_timings)
+    else:
+      logger.info('Total time taken = %s', time.time() - start)
     return resp
   return wrapped
 
@@ -40,6 +45,6 @@ def logrequest(f):
   @functools.wraps(f)
   def wrapped(*args, **kwargs):
     rv = f(*args, **kwargs)
-    logger.info("Arguments = %s Returned %s" % (kwargs, rv))
+    logger.info("Arguments = %s Returned %s", kwargs, loggable_payload(rv))
     return rv
   return wrapped
\ No newline at end of file
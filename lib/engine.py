@@ -0,0 +1,63 @@
+"""
+Execution engine of the service, picked at startup with SERVICE_ENGINE.
+
+gevent   (default) monkey patches the process; requests and PyMySQL yield on
+         I/O and background work runs on greenlets. Deployed with
+         grocery_order_service_uwsgi.ini (4 processes x 1024 greenlets).
+threaded no patching; each request and each background task gets an OS
+         thread. Deployed with grocery_order_service_uwsgi_threaded.ini.
+
+Code that starts background work goes through spawn() and sleep() so it runs
+the same way under both. uwsgi forks workers from the master and OS threads do
+not survive the fork, so anything owning a thread or connections (HTTP
+sessions, Kafka producers, the log writer, the spool replayer) is created on
+first use in each process rather than in create_app. Only os is imported at module level: manage.py
+imports this before monkey patching, and threading must not be loaded yet.
+"""
+__author__ = 'divyagarg'
+import os
+
+ENGINE_VARIABLE = 'SERVICE_ENGINE'
+GEVENT = 'gevent'
+THREADED = 'threaded'
+ENGINES = (GEVENT, THREADED)
+
+
+def get_engine():
+    engine = os.environ.get(ENGINE_VARIABLE, GEVENT)
+    if engine not in ENGINES:
+        raise ValueError('%s must be one of %s, got [%s]' % (ENGINE_VARIABLE, ', '.join(ENGINES), engine))
+    return engine
+
+
+def setup_engine():
+    """
+    Must run before anything else is imported, see manage.py.
+    """
+    engine = get_engine()
+    if engine == GEVENT:
+        import gevent.monkey
+        gevent.monkey.patch_all()
+    return engine
+
+
+def spawn(func, *args, **kwargs):
+    """
+    Starts func in the background and returns a task with join() and ready().
+    """
+    if get_engine() == GEVENT:
+        import gevent
+        return gevent.spawn(func, *args, **kwargs)
+    import threading
+    task = threading.Thread(target=func, args=args, kwargs=kwargs)
+    task.daemon = True
+    # same check as a greenlet's ready()
+    task.ready = lambda: not task.is_alive()
+    task.start()
+    return task
+
+
+def sleep(seconds):
+    # time.sleep is cooperative once gevent has patched it
+    import time
+    time.sleep(seconds)
@@ -1,10 +1,159 @@
 import os
+import json
+import atexit
+import random
 import logging
 import logging.config
+import logging.handlers
+from collections import deque
 from config import LOG_DIR, LOG_FILE, ERROR_LOG_FILE, APP_NAME, DB_FILE
 
+try:
+    # the listener has to be a real OS thread even when gevent has patched threading
+    from gevent.monkey import get_original
+    start_new_thread, allocate_lock, get_ident = get_original(
+        'thread', ['start_new_thread', 'allocate_lock', 'get_ident'])
+    sleep = get_original('time', 'sleep')
+except ImportError:
+    from thread import start_new_thread, allocate_lock, get_ident
+    from time import sleep
+
+PAYLOAD_MAX_LENGTH = 4096
+PAYLOAD_SAMPLE_RATE = 1.0
+
+
+class ThreadRLock(object):
+    """
+    Re-entrant lock built on the unpatched thread primitives, for handlers
+    driven from the listener thread rather than from greenlets.
+    """
+
+    def __init__(self):
+        self.lock = allocate_lock()
+        self.owner = None
+        self.count = 0
+
+    def acquire(self):
+        me = get_ident()
+        if self.owner == me:
+            self.count += 1
+            return
+        self.lock.acquire()
+        self.owner = me
+        self.count = 1
+
+    def release(self):
+        self.count -= 1
+        if self.count == 0:
+            self.owner = None
+            self.lock.release()
+
+
+class LazyPayload(object):
+    """
+    Renders a request/response payload only when a handler formats the record,
+    truncated to PAYLOAD_MAX_LENGTH characters.
+    """
+    __slots__ = ('payload',)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self):
+        payload = self.payload
+        if not isinstance(payload, basestring):
+            try:
+                payload = json.dumps(payload, default=str)
+            except Exception:
+                payload = repr(payload)
+        if len(payload) > PAYLOAD_MAX_LENGTH:
+            payload = '%s...<truncated %d chars>' % (payload[:PAYLOAD_MAX_LENGTH], len(payload) - PAYLOAD_MAX_LENGTH)
+        return payload
+
+
+def loggable_payload(payload):
+    if PAYLOAD_SAMPLE_RATE < 1.0 and random.random() >= PAYLOAD_SAMPLE_RATE:
+        return '<payload not sampled>'
+    return LazyPayload(payload)
+
+
+class AsyncLogHandler(logging.Handler):
+    """
+    Queues records and hands them to the wrapped handlers on a background
+    thread, so formatting and file writes stay off the request path. The
+    thread is started lazily in each process, since it does not survive the
+    uwsgi fork. When the queue is full new records are dropped and counted.
+    """
+
+    def __init__(self, handlers, capacity=100000, flush_interval=0.05):
+        logging.Handler.__init__(self)
+        self.handlers = handlers
+        for handler in handlers:
+            # these run on the listener thread, a gevent lock would need that thread's hub
+            handler.lock = ThreadRLock()
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.queue = deque()
+        self.dropped = 0
+        self.pid = None
+        self.start_lock = allocate_lock()
+        atexit.register(self.flush)
+
+    def start(self):
+        with self.start_lock:
+            if self.pid != os.getpid():
+                self.queue.clear()
+                self.pid = os.getpid()
+                start_new_thread(self.listen, ())
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            self.start()
+        if len(self.queue) >= self.capacity:
+            self.dropped += 1
+            return
+        if record.exc_info:
+            # tracebacks hold on to frames, render them now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.queue.append(record)
+
+    def close(self):
+        # hand over whatever is still queued before the wrapped handlers close
+        self.flush()
+        for handler in self.handlers:
+            handler.close()
+        logging.Handler.close(self)
+
+    def listen(self):
+        while True:
+            if not self.flush():
+                sleep(self.flush_interval)
+
+    def flush(self):
+        handled = False
+        while self.queue:
+            try:
+                record = self.queue.popleft()
+            except IndexError:
+                break
+            handled = True
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    try:
+                        handler.handle(record)
+                    except Exception:
+                        handler.handleError(record)
+        return handled
+
 
 def setup_logging(config):
+    global PAYLOAD_MAX_LENGTH, PAYLOAD_SAMPLE_RATE
+    PAYLOAD_MAX_LENGTH = getattr(config, 'LOG_PAYLOAD_MAX_LENGTH', PAYLOAD_MAX_LENGTH)
+    PAYLOAD_SAMPLE_RATE = getattr(config, 'LOG_PAYLOAD_SAMPLE_RATE', PAYLOAD_SAMPLE_RATE)
+    log_async = getattr(config, 'LOG_ASYNC', False)
+    statement_logging = getattr(config, 'SQL_STATEMENT_LOGGING', False)
+
     if not os.path.exists(config.HOME):
         os.makedirs(config.HOME)
 
@@ -26,14 +175,21 @@ def setup_logging(config):
     errorhandler.setLevel(logging.ERROR)
     errorhandler.setFormatter(formatter)
 
-    logger.addHandler(errorhandler)
-    logger.addHandler(handler)
+    if log_async:
+        logger.addHandler(AsyncLogHandler([errorhandler, handler]))
+    else:
+        logger.addHandler(errorhandler)
+        logger.addHandler(handler)
 
+    # INFO writes every statement with its parameters, WARNING keeps errors only
     orm_logger = logging.getLogger('sqlalchemy.engine')
-    orm_logger.setLevel(logging.INFO)
+    orm_logger.setLevel(logging.INFO if statement_logging else logging.WARNING)
 
     orm_handler = logging.handlers.TimedRotatingFileHandler(os.path.join(log_dir, DB_FILE), 'midnight')
     orm_handler.setLevel(logging.INFO)
     orm_handler.setFormatter(formatter)
 
-    orm_logger.addHandler(orm_handler)
\ No newline at end of file
+    if log_async:
+        orm_logger.addHandler(AsyncLogHandler([orm_handler]))
+    else:
+        orm_logger.addHandler(orm_handler)
@@ -0,0 +1,403 @@
+__author__ = 'divyagarg'
+import os
+import json
+import time
+import glob
+import errno
+import bisect
+import logging
+import threading
+
+from flask import g, request, has_app_context
+from config import APP_NAME
+from lib.tracing import Tracer
+
+Logger = logging.getLogger(APP_NAME)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+    """
+    Cumulative-bucket histogram in the Prometheus layout; values are seconds.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        cumulative = []
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('"', '\\"')) for key, value in labels)
+
+
+class Metrics(object):
+    """
+    Process wide registry of histograms and counters, keyed by name and sorted
+    labels, and rendered in the Prometheus text format by the /metrics
+    endpoint. Collectors add values read at scrape time, such as cache and DB
+    pool stats.
+
+    uwsgi hands each scrape to one worker, so with METRICS_DIR set every
+    worker writes a snapshot of its registry to <dir>/<pid>.json, at most
+    every METRICS_FLUSH_INTERVAL seconds from its requests and always before
+    it renders. Rendering merges the snapshots of all workers: histograms and
+    counters are summed, including those of workers that have exited, while
+    gauges are summed over live workers only.
+    """
+    histograms = {}
+    counters = {}
+    collectors = []
+    help_texts = {}
+    lock = threading.Lock()
+    directory = None
+    flush_interval = 5
+    flushed_at = 0
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def init(app):
+        Metrics.directory = app.config.get('METRICS_DIR')
+        Metrics.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', Metrics.flush_interval)
+        if Metrics.directory:
+            if not os.path.isdir(Metrics.directory):
+                os.makedirs(Metrics.directory)
+            if is_uwsgi_master():
+                # a fresh set of workers is about to fork, the old snapshots belong to the previous run
+                for path in glob.glob(os.path.join(Metrics.directory, '*.json')):
+                    os.remove(path)
+        app.before_request(start_request)
+        app.after_request(end_request)
+
+    @staticmethod
+    def describe(name, help_text):
+        Metrics.help_texts[name] = help_text
+
+    @staticmethod
+    def add_collector(collector):
+        """
+        collector() returns (kind, name, labels dict, value) tuples, kind
+        being 'counter' or 'gauge'.
+        """
+        Metrics.collectors.append(collector)
+
+    @staticmethod
+    def observe(name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with Metrics.lock:
+            histogram = Metrics.histograms.get(key)
+            if histogram is None:
+                histogram = Histogram()
+                Metrics.histograms[key] = histogram
+            histogram.observe(value)
+
+    @staticmethod
+    def increment(name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with Metrics.lock:
+            Metrics.counters[key] = Metrics.counters.get(key, 0) + value
+
+    @staticmethod
+    def reset():
+        with Metrics.lock:
+            Metrics.histograms = {}
+            Metrics.counters = {}
+
+    @staticmethod
+    def snapshot():
+        with Metrics.lock:
+            histograms = [[name, labels, histogram.buckets, histogram.counts, histogram.sum, histogram.count]
+                          for (name, labels), histogram in Metrics.histograms.items()]
+            counters = [[name, labels, value] for (name, labels), value in Metrics.counters.items()]
+        gauges = []
+        for collector in Metrics.collectors:
+            try:
+                for kind, name, labels, value in collector():
+                    sample = [name, tuple(sorted(labels.items())), value]
+                    if kind == 'counter':
+                        counters.append(sample)
+                    else:
+                        gauges.append(sample)
+            except Exception:
+                Logger.error('Metrics collector failed', exc_info=True)
+        return {'pid': os.getpid(), 'histograms': histograms, 'counters': counters, 'gauges': gauges}
+
+    @staticmethod
+    def flush():
+        if not Metrics.directory:
+            return
+        Metrics.flushed_at = time.time()
+        path = os.path.join(Metrics.directory, '%d.json' % os.getpid())
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as snapshot_file:
+            json.dump(Metrics.snapshot(), snapshot_file)
+        os.rename(temp_path, path)
+
+    @staticmethod
+    def maybe_flush():
+        if Metrics.directory and time.time() - Metrics.flushed_at >= Metrics.flush_interval:
+            try:
+                Metrics.flush()
+            except Exception:
+                Logger.error('Could not write metrics snapshot', exc_info=True)
+
+    @staticmethod
+    def load_snapshots():
+        if not Metrics.directory:
+            return [Metrics.snapshot()]
+        Metrics.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(Metrics.directory, '*.json')):
+            try:
+                with open(path) as snapshot_file:
+                    snapshots.append(json.load(snapshot_file))
+            except (IOError, ValueError):
+                Logger.error('Skipping unreadable metrics snapshot [%s]', path, exc_info=True)
+        return snapshots
+
+    @staticmethod
+    def merge(snapshots):
+        histograms = {}
+        counters = {}
+        gauges = {}
+        for snapshot in snapshots:
+            alive = is_alive(snapshot['pid'])
+            for name, labels, buckets, counts, total, count in snapshot['histograms']:
+                key = (name, tuple(tuple(label) for label in labels))
+                histogram = histograms.get(key)
+                if histogram is None:
+                    histogram = Histogram(buckets)
+                    histograms[key] = histogram
+                elif list(histogram.buckets) != list(buckets):
+                    Logger.error('Skipping %s of worker [%s], its buckets differ', name, snapshot['pid'])
+                    continue
+                histogram.counts = [merged + counted for merged, counted in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(label) for label in labels))
+                counters[key] = counters.get(key, 0) + value
+            if alive:
+                for name, labels, value in snapshot['gauges']:
+                    key = (name, tuple(tuple(label) for label in labels))
+                    gauges[key] = gauges.get(key, 0) + value
+        add_hit_ratios(counters, gauges)
+        return histograms, counters, gauges
+
+    @staticmethod
+    def render():
+        histograms, counters, gauges = Metrics.merge(Metrics.load_snapshots())
+        lines = []
+        last_name = None
+        for name, labels in sorted(histograms):
+            histogram = histograms[(name, labels)]
+            if name != last_name:
+                lines.extend(header(name, 'histogram'))
+                last_name = name
+            cumulative = histogram.cumulative_counts()
+            for bound, count in zip(histogram.buckets + ('+Inf',), cumulative):
+                bucket_labels = labels + (('le', bound if bound == '+Inf' else repr(bound)),)
+                lines.append('%s_bucket%s %d' % (name, format_labels(bucket_labels), count))
+            lines.append('%s_sum%s %.6f' % (name, format_labels(labels), histogram.sum))
+            lines.append('%s_count%s %d' % (name, format_labels(labels), histogram.count))
+        for kind, samples in (('counter', counters), ('gauge', gauges)):
+            for name, labels in sorted(samples):
+                if name != last_name:
+                    lines.extend(header(name, kind))
+                    last_name = name
+                lines.append('%s%s %s' % (name, format_labels(labels), format_value(samples[(name, labels)])))
+        return '\n'.join(lines) + '\n'
+
+
+def header(name, kind):
+    lines = []
+    if name in Metrics.help_texts:
+        lines.append('# HELP %s %s' % (name, Metrics.help_texts[name]))
+    lines.append('# TYPE %s %s' % (name, kind))
+    return lines
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def is_uwsgi_master():
+    """
+    True while uwsgi's master loads the app. manage.py commands and other
+    processes started on a live host must leave the workers' snapshots alone.
+    """
+    try:
+        import uwsgi
+    except ImportError:
+        return False
+    return uwsgi.masterpid() == os.getpid()
+
+
+def is_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+REQUEST_METRIC = 'grocery_http_request_duration_seconds'
+REQUEST_COUNT_METRIC = 'grocery_http_requests_total'
+Metrics.describe(REQUEST_METRIC, 'Duration of HTTP requests by route, method and status.')
+Metrics.describe(REQUEST_COUNT_METRIC, 'HTTP requests by route, method and status.')
+
+
+def start_request():
+    g.request_started_at = time.time()
+
+
+def end_request(response):
+    started_at = getattr(g, 'request_started_at', None)
+    if started_at is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        labels = {'route': route, 'method': request.method, 'status': str(response.status_code)}
+        Metrics.observe(REQUEST_METRIC, time.time() - started_at, **labels)
+        Metrics.increment(REQUEST_COUNT_METRIC, **labels)
+    Metrics.maybe_flush()
+    return response
+
+
+CACHE_HITS_METRIC = 'grocery_cache_hits_total'
+CACHE_MISSES_METRIC = 'grocery_cache_misses_total'
+CACHE_HIT_RATIO_METRIC = 'grocery_cache_hit_ratio'
+Metrics.describe(CACHE_HITS_METRIC, 'Lookups served from a local cache.')
+Metrics.describe(CACHE_MISSES_METRIC, 'Lookups a local cache could not serve.')
+Metrics.describe(CACHE_HIT_RATIO_METRIC, 'Hits over lookups of a local cache, across all workers.')
+
+
+def track_caches(caches):
+    """
+    Exposes hits and misses of the caches in {name: get_stats}; the hit ratio
+    is derived from the merged counters when rendering.
+    """
+
+    def collect():
+        samples = []
+        for cache_name, get_stats in caches.items():
+            stats = get_stats()
+            samples.append(('counter', CACHE_HITS_METRIC, {'cache': cache_name}, stats['hits']))
+            samples.append(('counter', CACHE_MISSES_METRIC, {'cache': cache_name}, stats['misses']))
+        return samples
+
+    Metrics.add_collector(collect)
+
+
+def add_hit_ratios(counters, gauges):
+    for (name, labels), hits in counters.items():
+        if name != CACHE_HITS_METRIC:
+            continue
+        lookups = hits + counters.get((CACHE_MISSES_METRIC, labels), 0)
+        gauges[(CACHE_HIT_RATIO_METRIC, labels)] = float(hits) / lookups if lookups > 0 else 0.0
+
+
+DB_POOL_WAIT_METRIC = 'grocery_db_pool_wait_seconds'
+Metrics.describe(DB_POOL_WAIT_METRIC, 'Time to check a connection out of the SQLAlchemy pool, opening one if needed.')
+Metrics.describe('grocery_db_pool_size', 'Connections the SQLAlchemy pools keep open.')
+Metrics.describe('grocery_db_pool_checked_out', 'Connections checked out of the SQLAlchemy pools.')
+Metrics.describe('grocery_db_pool_overflow', 'Connections opened beyond the pool size.')
+
+
+def track_pool(engine):
+    """
+    Times checkouts from the engine's pool and exposes its usage. dispose()
+    swaps in a new pool, which gets timed again through engine_disposed.
+    """
+    from sqlalchemy import event
+
+    def timed(checkout):
+        def timed_checkout():
+            start = time.time()
+            try:
+                return checkout()
+            finally:
+                Metrics.observe(DB_POOL_WAIT_METRIC, time.time() - start)
+
+        return timed_checkout
+
+    def time_checkouts(pool):
+        # sessions check out through connect(), engine.connect() through unique_connection()
+        pool.connect = timed(pool.connect)
+        pool.unique_connection = timed(pool.unique_connection)
+
+    def collect():
+        pool = engine.pool
+        if not hasattr(pool, 'checkedout'):
+            return []
+        return [('gauge', 'grocery_db_pool_size', {}, pool.size()),
+                ('gauge', 'grocery_db_pool_checked_out', {}, pool.checkedout()),
+                ('gauge', 'grocery_db_pool_overflow', {}, max(pool.overflow(), 0))]
+
+    time_checkouts(engine.pool)
+    event.listen(engine, 'engine_disposed', lambda disposed_engine: time_checkouts(disposed_engine.pool))
+    Metrics.add_collector(collect)
+
+
+STAGE_METRIC = 'grocery_stage_duration_seconds'
+Metrics.describe(STAGE_METRIC, 'Duration of each stage of the cart and order pipelines.')
+
+
+class StageTimer(object):
+    """
+    Times the numbered stages of a pipeline. start(stage) closes the running
+    stage as ok and opens the next one; finish(error) closes the last stage
+    with outcome error when the pipeline broke out with one. Durations go to
+    the grocery_stage_duration_seconds histogram and to g.stage_timings,
+    which the request log prints.
+    """
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.stage = None
+        self.started_at = None
+        self.span = None
+        self.timings = []
+        if has_app_context():
+            g.stage_timings = self.timings
+
+    def start(self, stage):
+        now = time.time()
+        self.close(now, 'ok')
+        self.stage = stage
+        self.started_at = now
+        self.span = Tracer.start_span(stage, 'stage', pipeline=self.pipeline)
+
+    def finish(self, error=None):
+        self.close(time.time(), 'ok' if error is None else 'error', error)
+        self.stage = None
+
+    def close(self, now, outcome, error=None):
+        if self.stage is None:
+            return
+        Tracer.finish_span(self.span, error)
+        self.span = None
+        elapsed = now - self.started_at
+        self.timings.append((self.stage, outcome, round(elapsed * 1000, 2)))
+        Metrics.observe(STAGE_METRIC, elapsed, pipeline=self.pipeline, stage=self.stage, outcome=outcome)
@@ -0,0 +1,134 @@
+__author__ = 'divyagarg'
+import time
+import logging
+
+from flask import g, request, has_app_context, has_request_context
+from config import APP_NAME
+from lib.metrics import Metrics
+
+Logger = logging.getLogger(APP_NAME)
+
+STATEMENT_MAX_LENGTH = 1000
+QUERY_METRIC = 'grocery_db_query_duration_seconds'
+N_PLUS_ONE_METRIC = 'grocery_db_repeated_queries_total'
+Metrics.describe(QUERY_METRIC, 'Duration of SQL statements by route.')
+Metrics.describe(N_PLUS_ONE_METRIC, 'Requests that ran one statement at least SQL_REPEATED_QUERY_THRESHOLD times.')
+
+
+class RequestProfile(object):
+    """
+    Statements one request ran, keyed by their parameterized SQL, so a lookup
+    repeated per row (the N+1 pattern) shows up as one statement with a high
+    count.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.statements = {}
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.total_time += elapsed
+        stats = self.statements.get(statement)
+        if stats is None:
+            stats = self.statements[statement] = [0, 0.0]
+        stats[0] += 1
+        stats[1] += elapsed
+
+    def repeated(self, threshold):
+        return sorted(((stats[0], stats[1], statement) for statement, stats in self.statements.items()
+                       if stats[0] >= threshold), reverse=True)
+
+
+class SqlProfiler(object):
+    """
+    Counts and times the statements of every request through SQLAlchemy
+    cursor events, logs a per-request summary, warns about statements that
+    repeat within a request and about statements slower than
+    SQL_SLOW_QUERY_MS, with the route and g.UUID. Only the parameterized SQL
+    is logged, never the parameters; full statement logging is the separate
+    SQL_STATEMENT_LOGGING switch of lib.log.
+    """
+    enabled = False
+    slow_threshold = 0.2
+    repeated_threshold = 5
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def init(app):
+        SqlProfiler.enabled = app.config.get('SQL_PROFILER_ENABLED', False)
+        if not SqlProfiler.enabled:
+            return
+        SqlProfiler.slow_threshold = app.config.get('SQL_SLOW_QUERY_MS', 200) / 1000.0
+        SqlProfiler.repeated_threshold = app.config.get('SQL_REPEATED_QUERY_THRESHOLD',
+                                                        SqlProfiler.repeated_threshold)
+        app.before_request(begin_request_profile)
+        app.teardown_request(end_request_profile)
+
+    @staticmethod
+    def profile(engine):
+        if not SqlProfiler.enabled:
+            return
+        from sqlalchemy import event
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('profile_start_times', []).append(time.time())
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            start_times = conn.info.get('profile_start_times')
+            if start_times:
+                SqlProfiler.record(statement, time.time() - start_times.pop())
+
+        def handle_error(exception_context):
+            start_times = exception_context.connection.info.get('profile_start_times') \
+                if exception_context.connection is not None else None
+            if start_times:
+                start_times.pop()
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(engine, 'handle_error', handle_error)
+
+    @staticmethod
+    def record(statement, elapsed):
+        route = get_route()
+        Metrics.observe(QUERY_METRIC, elapsed, route=route)
+        profile = getattr(g, 'sql_profile', None) if has_app_context() else None
+        if profile is not None:
+            profile.record(statement, elapsed)
+        if elapsed >= SqlProfiler.slow_threshold:
+            Logger.warning('[%s] Slow query on route [%s] took %.2f ms: %s', get_uuid(), route, elapsed * 1000,
+                           statement[:STATEMENT_MAX_LENGTH])
+
+
+def get_route():
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    return 'background'
+
+
+def get_uuid():
+    return getattr(g, 'UUID', None) if has_app_context() else None
+
+
+def begin_request_profile():
+    g.sql_profile = RequestProfile()
+
+
+def end_request_profile(exception=None):
+    profile = getattr(g, 'sql_profile', None)
+    if profile is None or profile.count == 0:
+        return
+    g.sql_profile = None
+    route = get_route()
+    Logger.info('[%s] SQL queries on route [%s] = %d, time = %.2f ms', get_uuid(), route, profile.count,
+                profile.total_time * 1000)
+    repeated = profile.repeated(SqlProfiler.repeated_threshold)
+    if repeated:
+        Metrics.increment(N_PLUS_ONE_METRIC, route=route)
+    for count, total_time, statement in repeated:
+        Logger.warning('[%s] Possible N+1 on route [%s]: %d runs, %.2f ms of: %s', get_uuid(), route, count,
+                       total_time * 1000, statement[:STATEMENT_MAX_LENGTH])
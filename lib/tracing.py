@@ -0,0 +1,273 @@
+"""
+In-process tracing of a request's call tree.
+
+Every request gets a trace in flask g with a root span for its route; the
+cart and order pipeline stages, SQL statements and downstream HTTP calls open
+child spans under whichever span is current. The current span lives in g, so
+BackgroundCall greenlets, which get a copy of g, parent their spans on the
+span that spawned them.
+
+Spans are recorded for every request and a trace is exported when it is
+sampled (TRACING_SAMPLE_RATE), slower than TRACING_SLOW_MS or failed. Traces
+are exported as Zipkin v2 JSON: one line per trace to TRACING_FILE, written
+by the async log handler, and/or posted to TRACING_COLLECTOR_URL.
+"""
+__author__ = 'divyagarg'
+import os
+import json
+import time
+import uuid
+import random
+import logging
+import logging.handlers
+
+from flask import g, request, has_app_context
+from config import APP_NAME
+
+Logger = logging.getLogger(APP_NAME)
+
+# Zipkin kinds of the span kinds used here, the rest are local spans
+ZIPKIN_KINDS = {'route': 'SERVER', 'http': 'CLIENT'}
+STATEMENT_MAX_LENGTH = 1000
+
+
+class Span(object):
+    __slots__ = ('trace', 'span_id', 'parent', 'name', 'kind', 'start', 'duration', 'tags', 'error')
+
+    def __init__(self, trace, parent, name, kind, tags):
+        self.trace = trace
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent = parent
+        self.name = name
+        self.kind = kind
+        self.start = time.time()
+        self.duration = None
+        self.tags = tags
+        self.error = None
+
+    def finish(self, error=None):
+        if self.duration is not None:
+            return
+        self.duration = time.time() - self.start
+        if error is not None:
+            self.error = str(error) or error.__class__.__name__
+
+    def to_zipkin(self):
+        tags = dict((key, str(value)) for key, value in self.tags.items() if value is not None)
+        tags['component'] = self.kind
+        if self.error is not None:
+            tags['error'] = self.error
+        if self.duration is None:
+            tags['unfinished'] = 'true'
+        span = {'traceId': self.trace.trace_id, 'id': self.span_id, 'name': self.name,
+                'timestamp': int(self.start * 1000000),
+                'duration': int((self.duration or time.time() - self.start) * 1000000),
+                'localEndpoint': {'serviceName': APP_NAME}, 'tags': tags}
+        if self.parent is not None:
+            span['parentId'] = self.parent.span_id
+        if self.kind in ZIPKIN_KINDS:
+            span['kind'] = ZIPKIN_KINDS[self.kind]
+        return span
+
+
+class Trace(object):
+    def __init__(self, sampled, max_spans):
+        self.trace_id = uuid.uuid4().hex
+        self.sampled = sampled
+        self.max_spans = max_spans
+        self.spans = []
+        self.dropped = 0
+
+    def add(self, span):
+        if len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return False
+        self.spans.append(span)
+        return True
+
+
+class Tracer(object):
+    enabled = False
+    sample_rate = 0.0
+    slow_threshold = None
+    max_spans = 1000
+    collector_url = None
+    trace_logger = None
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def init(app):
+        Tracer.enabled = app.config.get('TRACING_ENABLED', False)
+        if not Tracer.enabled:
+            return
+        Tracer.sample_rate = app.config.get('TRACING_SAMPLE_RATE', 0.0)
+        slow_ms = app.config.get('TRACING_SLOW_MS')
+        Tracer.slow_threshold = slow_ms / 1000.0 if slow_ms is not None else None
+        Tracer.max_spans = app.config.get('TRACING_MAX_SPANS', Tracer.max_spans)
+        Tracer.collector_url = app.config.get('TRACING_COLLECTOR_URL')
+        trace_file = app.config.get('TRACING_FILE')
+        if trace_file:
+            Tracer.trace_logger = get_trace_logger(trace_file, app.config.get('LOG_ASYNC', False))
+        app.before_request(begin_request_trace)
+        app.after_request(record_response_status)
+        app.teardown_request(end_request_trace)
+
+    @staticmethod
+    def current_trace():
+        if not Tracer.enabled or not has_app_context():
+            return None
+        return getattr(g, 'trace', None)
+
+    @staticmethod
+    def start_span(name, kind, **tags):
+        """
+        Opens a child of the current span and makes it current; returns None
+        outside of a traced request.
+        """
+        trace = Tracer.current_trace()
+        if trace is None:
+            return None
+        span = Span(trace, getattr(g, 'trace_span', None), name, kind, tags)
+        if not trace.add(span):
+            return None
+        g.trace_span = span
+        return span
+
+    @staticmethod
+    def finish_span(span, error=None, **tags):
+        if span is None:
+            return
+        span.tags.update(tags)
+        span.finish(error)
+        if has_app_context() and getattr(g, 'trace_span', None) is span:
+            g.trace_span = span.parent
+
+    @staticmethod
+    def propagation_headers(headers):
+        """
+        Adds B3 headers of the current span so downstream services can join
+        the trace.
+        """
+        span = getattr(g, 'trace_span', None) if Tracer.current_trace() is not None else None
+        if span is None:
+            return headers
+        headers = dict(headers or {})
+        headers['X-B3-TraceId'] = span.trace.trace_id
+        headers['X-B3-SpanId'] = span.span_id
+        return headers
+
+    @staticmethod
+    def should_export(trace, root):
+        if trace.sampled or root.error is not None:
+            return True
+        return Tracer.slow_threshold is not None and root.duration >= Tracer.slow_threshold
+
+    @staticmethod
+    def export(trace):
+        spans = [span.to_zipkin() for span in trace.spans]
+        if trace.dropped:
+            spans[0]['tags']['dropped_spans'] = str(trace.dropped)
+        if Tracer.trace_logger is not None:
+            Tracer.trace_logger.info(LazyJson(spans))
+        if Tracer.collector_url:
+            from lib import engine
+            engine.spawn(post_to_collector, Tracer.collector_url, spans)
+
+    @staticmethod
+    def trace_sql(engine):
+        """
+        Opens a span around every statement the engine runs inside a traced
+        request. Statements are recorded without their parameters.
+        """
+        from sqlalchemy import event
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            span = Tracer.start_span(statement.split(None, 1)[0].upper() if statement else 'SQL', 'sql',
+                                     statement=statement[:STATEMENT_MAX_LENGTH], executemany=executemany)
+            conn.info.setdefault('trace_spans', []).append(span)
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            spans = conn.info.get('trace_spans')
+            if spans:
+                Tracer.finish_span(spans.pop(), rows=cursor.rowcount)
+
+        def handle_error(exception_context):
+            spans = exception_context.connection.info.get('trace_spans') \
+                if exception_context.connection is not None else None
+            if spans:
+                Tracer.finish_span(spans.pop(), error=exception_context.original_exception)
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(engine, 'handle_error', handle_error)
+
+
+class LazyJson(object):
+    """
+    Serializes a trace only when the trace log handler writes it.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return json.dumps(self.value)
+
+
+def get_trace_logger(trace_file, log_async):
+    from lib.log import AsyncLogHandler
+    trace_dir = os.path.dirname(trace_file)
+    if trace_dir and not os.path.exists(trace_dir):
+        os.makedirs(trace_dir)
+    handler = logging.handlers.TimedRotatingFileHandler(trace_file, 'midnight')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    trace_logger = logging.getLogger(APP_NAME + '.traces')
+    trace_logger.setLevel(logging.INFO)
+    # traces go to their own file only, not to the service log
+    trace_logger.propagate = False
+    trace_logger.handlers = []
+    trace_logger.addHandler(AsyncLogHandler([handler]) if log_async else handler)
+    return trace_logger
+
+
+def post_to_collector(url, spans):
+    from utils.api_utils.http_client import HttpClient
+    try:
+        HttpClient.post(url, data=json.dumps(spans), headers={'Content-Type': 'application/json'},
+                        dependency='trace_collector')
+    except Exception:
+        Logger.error('Could not export trace to [%s]', url, exc_info=True)
+
+
+def begin_request_trace():
+    g.trace = Trace(random.random() < Tracer.sample_rate, Tracer.max_spans)
+    g.trace_span = None
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    g.trace_root = Tracer.start_span('%s %s' % (request.method, route), 'route', path=request.path)
+
+
+def record_response_status(response):
+    root = getattr(g, 'trace_root', None)
+    if root is not None:
+        root.tags['status'] = response.status_code
+        if response.status_code >= 500 and root.error is None:
+            root.error = 'HTTP %d' % response.status_code
+    return response
+
+
+def end_request_trace(exception=None):
+    trace = getattr(g, 'trace', None)
+    root = getattr(g, 'trace_root', None)
+    if trace is None or root is None:
+        return
+    g.trace = None
+    root.tags['request_uuid'] = getattr(g, 'UUID', None)
+    root.finish(exception)
+    try:
+        if Tracer.should_export(trace, root):
+            Tracer.export(trace)
+    except Exception:
+        Logger.error('Could not export trace [%s]', trace.trace_id, exc_info=True)
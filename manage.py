@@ -1,8 +1,8 @@
-# Always keep the monkeypatching above anything.
-# Otherwise any library before it will use unpatched sockets and threads
-import gevent.monkey
+# Always keep the engine setup above anything.
+# Under gevent any library imported before it would use unpatched sockets and threads
+from lib.engine import setup_engine
 
-gevent.monkey.patch_all()
+setup_engine()
 
 from apps import create_app
 import os
@@ -35,5 +35,11 @@ def test(coverage=False):
     tests = unittest.TestLoader().discover('test')
     unittest.TextTestRunner(verbosity=2).run(tests)
 
+@manager.command
+def outbox_relay():
+    """Publish pending outbox events to Kafka."""
+    from apps.app_v1.api.outbox_service import OutboxRelay
+    OutboxRelay(app).run()
+
 if __name__ == '__main__':
     manager.run()
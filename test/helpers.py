@@ -0,0 +1,25 @@
+import logging
+
+__author__ = 'divyagarg'
+
+
+class CollectingHandler(logging.Handler):
+	def __init__(self):
+		logging.Handler.__init__(self)
+		self.messages = []
+		self.closed = False
+
+	def emit(self, record):
+		self.messages.append(record.getMessage())
+
+	def close(self):
+		self.closed = True
+		logging.Handler.close(self)
+
+
+class FakeTimer(object):
+	def __init__(self):
+		self.now = 1000.0
+
+	def __call__(self):
+		return self.now
@@ -0,0 +1,71 @@
+import unittest
+
+from flask import Flask
+from apps.app_v1.models import db
+from apps.app_v1.models.models import Cart, CartItem, OrderShipmentDetail
+from apps.app_v1.api.cart_cache import CartCache
+
+__author__ = 'divyagarg'
+
+
+class TestCartCache(unittest.TestCase):
+	def setUp(self):
+		self.app = Flask(__name__)
+		self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+		self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+		self.app.config['CART_CACHE_ENABLED'] = True
+		db.init_app(self.app)
+		CartCache.init(self.app)
+		self.context = self.app.app_context()
+		self.context.push()
+		db.create_all()
+		cart = Cart(cart_reference_uuid='cart-1', geo_id=29, user_id='user-1', total_offer_price=100.0)
+		cart.cartItem = [CartItem(cart_item_id='1', quantity=1), CartItem(cart_item_id='2', quantity=3)]
+		cart.orderShipmentDetail = [OrderShipmentDetail(shipment_id='shipment-1')]
+		db.session.add(cart)
+		db.session.commit()
+		db.session.remove()
+
+	def tearDown(self):
+		db.session.remove()
+		db.drop_all()
+		self.context.pop()
+
+	def test_cart_is_served_from_the_cache(self):
+		cart = CartCache.get_cart(29, 'user-1')
+		self.assertEqual(len(cart.cartItem), 2)
+		db.session.remove()
+		cart = CartCache.get_cart(29, 'user-1')
+		self.assertEqual(CartCache.get_stats()['hits'], 1)
+		self.assertEqual(sorted(cart_item.quantity for cart_item in cart.cartItem), [1, 3])
+		self.assertEqual([shipment.shipment_id for shipment in cart.orderShipmentDetail], ['shipment-1'])
+
+	def test_commit_invalidates_the_cart(self):
+		cart = CartCache.get_cart(29, 'user-1')
+		cart.total_offer_price = 250.0
+		db.session.commit()
+		db.session.remove()
+		cart = CartCache.get_cart(29, 'user-1')
+		self.assertEqual(CartCache.get_stats()['hits'], 0)
+		self.assertEqual(cart.total_offer_price, 250.0)
+
+	def test_rollback_keeps_the_cached_cart(self):
+		CartCache.get_cart(29, 'user-1')
+		db.session.remove()
+		cart = CartCache.get_cart(29, 'user-1')
+		cart.total_offer_price = 250.0
+		db.session.flush()
+		db.session.rollback()
+		db.session.remove()
+		self.assertEqual(CartCache.get_cart(29, 'user-1').total_offer_price, 100.0)
+
+	def test_disabled_cache_loads_from_the_database(self):
+		self.app.config['CART_CACHE_ENABLED'] = False
+		CartCache.init(self.app)
+		cart = CartCache.get_cart(29, 'user-1')
+		self.assertEqual(len(cart.cartItem), 2)
+		self.assertEqual(CartCache.get_stats()['size'], 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
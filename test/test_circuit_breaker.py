@@ -0,0 +1,63 @@
+import unittest
+
+from test.helpers import FakeTimer
+from utils.api_utils.circuit_breaker import CircuitBreaker, CircuitOpenException, CLOSED, OPEN, HALF_OPEN
+
+__author__ = 'divyagarg'
+
+
+class TestCircuitBreaker(unittest.TestCase):
+	def setUp(self):
+		self.timer = FakeTimer()
+		self.breaker = CircuitBreaker('catalog', failure_threshold=3, reset_timeout=10, timer=self.timer)
+
+	def trip(self, times):
+		for i in range(times):
+			self.breaker.before_call()
+			self.breaker.record_failure()
+
+	def test_opens_after_consecutive_failures(self):
+		self.trip(2)
+		self.assertEqual(self.breaker.get_state(), CLOSED)
+		self.trip(1)
+		self.assertEqual(self.breaker.get_state(), OPEN)
+		self.assertRaises(CircuitOpenException, self.breaker.before_call)
+		self.assertEqual(self.breaker.get_stats()['rejected'], 1)
+
+	def test_success_resets_failure_count(self):
+		self.trip(2)
+		self.breaker.before_call()
+		self.breaker.record_success()
+		self.trip(2)
+		self.assertEqual(self.breaker.get_state(), CLOSED)
+
+	def test_half_open_lets_one_probe_through(self):
+		self.trip(3)
+		self.timer.now += 10
+		self.assertEqual(self.breaker.get_state(), HALF_OPEN)
+		self.breaker.before_call()
+		self.assertRaises(CircuitOpenException, self.breaker.before_call)
+		self.breaker.record_success()
+		self.assertEqual(self.breaker.get_state(), CLOSED)
+		self.breaker.before_call()
+
+	def test_failed_probe_opens_again(self):
+		self.trip(3)
+		self.timer.now += 10
+		self.trip(1)
+		self.assertEqual(self.breaker.get_state(), OPEN)
+		self.assertEqual(self.breaker.get_stats()['times_opened'], 2)
+		self.timer.now += 5
+		self.assertRaises(CircuitOpenException, self.breaker.before_call)
+
+	def test_released_probe_lets_another_through(self):
+		self.trip(3)
+		self.timer.now += 10
+		self.breaker.before_call()
+		self.breaker.release()
+		self.breaker.before_call()
+		self.assertRaises(CircuitOpenException, self.breaker.before_call)
+
+
+if __name__ == '__main__':
+	unittest.main()
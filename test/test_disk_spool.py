@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils.kafka_utils.disk_spool import DiskSpool
+
+__author__ = 'divyagarg'
+
+
+class TestDiskSpool(unittest.TestCase):
+	def setUp(self):
+		self.base_dir = tempfile.mkdtemp()
+		self.directory = os.path.join(self.base_dir, 'spool')
+
+	def tearDown(self):
+		shutil.rmtree(self.base_dir, ignore_errors=True)
+
+	def test_records_are_replayed_in_order_across_segments(self):
+		spool = DiskSpool(self.directory, segment_max_bytes=100)
+		for i in range(10):
+			spool.append('topic', 'order-%d' % (i % 2), 'message-%d' % i)
+		self.assertTrue(len(spool.segment_numbers()) > 1)
+		records, cursor = spool.read_batch(4)
+		self.assertEqual([record[2] for record in records], ['message-%d' % i for i in range(4)])
+		spool.commit(cursor)
+		records, cursor = spool.read_batch(100)
+		self.assertEqual([record[2] for record in records], ['message-%d' % i for i in range(4, 10)])
+		spool.commit(cursor)
+		self.assertFalse(spool.has_backlog())
+		self.assertEqual(len(spool.segment_numbers()), 1)
+
+	def test_uncommitted_records_are_read_again(self):
+		spool = DiskSpool(self.directory)
+		spool.append('topic', 'order-1', 'first')
+		spool.read_batch()
+		records, cursor = spool.read_batch()
+		self.assertEqual(records, [('topic', 'order-1', 'first')])
+		self.assertTrue(spool.has_backlog())
+
+	def test_cursor_survives_reopen(self):
+		spool = DiskSpool(self.directory)
+		spool.append('topic', 'order-1', 'first')
+		spool.append('topic', 'order-1', 'second')
+		records, cursor = spool.read_batch(1)
+		spool.commit(cursor)
+		spool.close()
+		spool = DiskSpool(self.directory)
+		records, cursor = spool.read_batch()
+		self.assertEqual([record[2] for record in records], ['second'])
+
+	def test_directory_of_live_spool_is_not_adopted(self):
+		spool = DiskSpool(self.directory)
+		spool.append('topic', 'order-1', 'first')
+		self.assertEqual(DiskSpool.adopt_orphans(self.base_dir), [])
+		spool.close()
+		orphans = DiskSpool.adopt_orphans(self.base_dir)
+		self.assertEqual(len(orphans), 1)
+		self.assertTrue(orphans[0].has_backlog())
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,69 @@
+import copy
+import unittest
+
+from apps.app_v1.api import ERROR, RequiredFieldMissing, IncorrectDataException
+from apps.app_v1.api.api_schema_signature import CREATE_CART_SCHEMA
+from utils.jsonutils.json_schema_validator import compile_schema
+
+__author__ = 'divyagarg'
+
+
+class TestCompiledSchemaValidator(unittest.TestCase):
+	cart_data = {
+		"geo_id": 29557,
+		"user_id": "8088275032",
+		"order_type": 0,
+		"order_source_reference": 0,
+		"payment_mode": 0,
+		"shipping_address": {
+			"name": "Divya Garg",
+			"mobile": "1234567890",
+			"address": "121/5 SIlver Oaks Apartment DLF phase 1",
+			"city": "Gurgaon",
+			"pincode": "122001",
+			"state": "Haryana"
+		},
+		"orderitems": [
+			{"item_uuid": "2", "quantity": 1},
+			{"item_uuid": "5", "quantity": 3}
+		]
+	}
+
+	def setUp(self):
+		self.validate = compile_schema(CREATE_CART_SCHEMA)
+
+	def test_schema_is_compiled_once(self):
+		self.assertIs(compile_schema(CREATE_CART_SCHEMA), self.validate)
+
+	def test_valid_cart_passes(self):
+		self.validate(copy.deepcopy(self.cart_data))
+
+	def test_missing_required_key(self):
+		data = copy.deepcopy(self.cart_data)
+		del data['user_id']
+		with self.assertRaises(RequiredFieldMissing) as context:
+			self.validate(data)
+		self.assertEqual(context.exception.code, ERROR.KEY_MISSING.code)
+		self.assertEqual(ERROR.KEY_MISSING.message, 'key missing is :{user_id}')
+
+	def test_missing_required_key_in_nested_list(self):
+		data = copy.deepcopy(self.cart_data)
+		del data['orderitems'][1]['quantity']
+		with self.assertRaises(RequiredFieldMissing):
+			self.validate(data)
+
+	def test_value_not_contained(self):
+		data = copy.deepcopy(self.cart_data)
+		data['order_type'] = 7
+		with self.assertRaises(IncorrectDataException) as context:
+			self.validate(data)
+		self.assertEqual(context.exception.code, ERROR.INCORRECT_DATA.code)
+
+	def test_invalid_nested_value(self):
+		data = copy.deepcopy(self.cart_data)
+		data['shipping_address']['mobile'] = '12345'
+		self.assertRaises(Exception, self.validate, data)
+
+
+if __name__ == '__main__':
+	unittest.main()
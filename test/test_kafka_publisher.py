@@ -0,0 +1,124 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask, g
+from utils.kafka_utils.disk_spool import DiskSpool
+from utils.kafka_utils import kafka_publisher
+from utils.kafka_utils.kafka_publisher import Publisher, BatchedProducerBackend
+
+__author__ = 'divyagarg'
+
+
+class TestFileBackedPublisher(unittest.TestCase):
+	def setUp(self):
+		self.broker_path = tempfile.mktemp()
+		self.app = Flask(__name__)
+		self.app.config['KAFKA_TOPIC'] = 'grocery_orderservice_test'
+		self.app.config['KAFKA_PRODUCER'] = 'file'
+		self.app.config['KAFKA_FILE_BROKER_PATH'] = self.broker_path
+		Publisher.init(self.app)
+
+	def tearDown(self):
+		if os.path.exists(self.broker_path):
+			os.remove(self.broker_path)
+
+	def test_publish_message_is_written_and_counted(self):
+		with self.app.app_context():
+			g.UUID = 'test'
+			Publisher.publish_message('order-1', json.dumps({'msg_type': 'create_order'}))
+		messages = Publisher.backend.read_messages('grocery_orderservice_test')
+		self.assertEqual(len(messages), 1)
+		self.assertEqual(messages[0]['key'], 'order-1')
+		stats = Publisher.get_stats()
+		self.assertEqual(stats['sent'], 1)
+		self.assertEqual(stats['acked'], 1)
+		self.assertEqual(stats['in_flight'], 0)
+
+	def test_send_messages_sync_keeps_order(self):
+		Publisher.send_messages_sync('grocery_orderservice_test', 'order-2', ['first', 'second'])
+		self.assertEqual([message['value'] for message in Publisher.backend.read_messages()], ['first', 'second'])
+
+
+class FakeKafkaProducer(object):
+	created = []
+
+	def __init__(self, **options):
+		self.options = options
+		FakeKafkaProducer.created.append(self)
+
+
+class TestBatchedProducerBackend(unittest.TestCase):
+	def setUp(self):
+		self.app = Flask(__name__)
+		self.app.config['KAFKA_HOSTS'] = ['localhost:9092']
+		self.kafka_producer = kafka_publisher.KafkaProducer
+		kafka_publisher.KafkaProducer = FakeKafkaProducer
+		FakeKafkaProducer.created = []
+
+	def tearDown(self):
+		kafka_publisher.KafkaProducer = self.kafka_producer
+
+	def test_producer_is_created_once_per_process(self):
+		backend = BatchedProducerBackend(self.app)
+		self.assertEqual(FakeKafkaProducer.created, [])
+		producer = backend.get_producer()
+		self.assertIs(backend.get_producer(), producer)
+		self.assertEqual(producer.options['max_block_ms'], 1000)
+		# as seen by a forked worker
+		backend.pid = -1
+		self.assertIsNot(backend.get_producer(), producer)
+		self.assertEqual(len(FakeKafkaProducer.created), 2)
+
+
+class TestOrphanedSpoolReplay(unittest.TestCase):
+	def setUp(self):
+		self.broker_path = tempfile.mktemp()
+		self.spool_dir = tempfile.mkdtemp()
+		self.app = Flask(__name__)
+		self.app.config['KAFKA_TOPIC'] = 'grocery_orderservice_test'
+		self.app.config['KAFKA_PRODUCER'] = 'file'
+		self.app.config['KAFKA_FILE_BROKER_PATH'] = self.broker_path
+		Publisher.init(self.app)
+		orphan = DiskSpool(os.path.join(self.spool_dir, 'exited-worker'))
+		for i in range(250):
+			orphan.append('grocery_orderservice_test', 'order-%d' % (i % 3), 'message-%d' % i)
+		orphan.close()
+
+	def tearDown(self):
+		shutil.rmtree(self.spool_dir, ignore_errors=True)
+		if os.path.exists(self.broker_path):
+			os.remove(self.broker_path)
+
+	def test_every_batch_is_replayed_before_the_spool_is_removed(self):
+		orphans = DiskSpool.adopt_orphans(self.spool_dir)
+		self.assertEqual(len(orphans), 1)
+		self.assertTrue(Publisher.replay_orphan(orphans[0]))
+		self.assertEqual([message['value'] for message in Publisher.backend.read_messages()],
+						 ['message-%d' % i for i in range(250)])
+		self.assertEqual(os.listdir(self.spool_dir), [])
+
+	def test_failed_replay_keeps_the_spool_and_releases_it(self):
+		backend = Publisher.backend
+		send_sync = backend.send_sync
+		sent = []
+
+		def fail_after_first_batch(topic, key, messages):
+			if len(sent) >= Publisher.replay_batch_size:
+				raise Exception('broker unavailable')
+			sent.extend(messages)
+			send_sync(topic, key, messages)
+
+		backend.send_sync = fail_after_first_batch
+		self.assertRaises(Exception, Publisher.replay_orphan, DiskSpool.adopt_orphans(self.spool_dir)[0])
+		orphans = DiskSpool.adopt_orphans(self.spool_dir)
+		self.assertEqual(len(orphans), 1)
+		records, cursor = orphans[0].read_batch(1000)
+		self.assertEqual([record[2] for record in records], ['message-%d' % i for i in range(100, 250)])
+		orphans[0].close()
+
+
+if __name__ == '__main__':
+	unittest.main()
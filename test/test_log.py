@@ -0,0 +1,82 @@
+import random
+import logging
+import unittest
+
+import lib.log as log
+from lib.log import AsyncLogHandler, LazyPayload, loggable_payload
+from test.helpers import CollectingHandler
+
+__author__ = 'divyagarg'
+
+
+class CountingPayload(object):
+	renders = 0
+
+	def __str__(self):
+		CountingPayload.renders += 1
+		return 'payload'
+
+
+def make_record(message, *args):
+	return logging.LogRecord('test', logging.INFO, __file__, 1, message, args, None)
+
+
+class TestAsyncLogHandler(unittest.TestCase):
+	def test_queue_drains_on_close(self):
+		collecting = CollectingHandler()
+		handler = AsyncLogHandler([collecting], flush_interval=60)
+		for number in range(100):
+			handler.emit(make_record('record %d', number))
+		handler.close()
+		# the listener thread may have handled some of them already
+		self.assertEqual(sorted(collecting.messages), sorted('record %d' % number for number in range(100)))
+		self.assertTrue(collecting.closed)
+
+	def test_records_beyond_capacity_are_dropped(self):
+		collecting = CollectingHandler()
+		handler = AsyncLogHandler([collecting], capacity=0)
+		handler.emit(make_record('dropped'))
+		handler.close()
+		self.assertEqual(handler.dropped, 1)
+		self.assertEqual(collecting.messages, [])
+
+
+class TestLoggablePayload(unittest.TestCase):
+	def setUp(self):
+		self.sample_rate = log.PAYLOAD_SAMPLE_RATE
+		self.max_length = log.PAYLOAD_MAX_LENGTH
+		CountingPayload.renders = 0
+
+	def tearDown(self):
+		log.PAYLOAD_SAMPLE_RATE = self.sample_rate
+		log.PAYLOAD_MAX_LENGTH = self.max_length
+
+	def test_payload_is_rendered_only_when_a_record_is_emitted(self):
+		collecting = CollectingHandler()
+		logger = logging.getLogger('test_log.lazy_payload')
+		logger.propagate = False
+		logger.addHandler(collecting)
+		logger.setLevel(logging.WARNING)
+		logger.info('payload %s', LazyPayload({'item': CountingPayload()}))
+		self.assertEqual(CountingPayload.renders, 0)
+		logger.warning('payload %s', LazyPayload({'item': CountingPayload()}))
+		self.assertEqual(CountingPayload.renders, 1)
+		self.assertEqual(collecting.messages, ['payload {"item": "payload"}'])
+
+	def test_long_payloads_are_truncated(self):
+		log.PAYLOAD_MAX_LENGTH = 10
+		self.assertEqual(str(LazyPayload('x' * 15)), 'x' * 10 + '...<truncated 5 chars>')
+
+	def test_sample_rate(self):
+		log.PAYLOAD_SAMPLE_RATE = 1.0
+		self.assertIsInstance(loggable_payload('payload'), LazyPayload)
+		log.PAYLOAD_SAMPLE_RATE = 0.0
+		self.assertEqual(loggable_payload('payload'), '<payload not sampled>')
+		log.PAYLOAD_SAMPLE_RATE = 0.5
+		random.seed(7)
+		sampled = sum(1 for _ in range(1000) if isinstance(loggable_payload('payload'), LazyPayload))
+		self.assertTrue(400 < sampled < 600)
+
+
+if __name__ == '__main__':
+	unittest.main()
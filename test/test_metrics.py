@@ -0,0 +1,108 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from flask import Flask
+from lib.metrics import DEFAULT_BUCKETS, Histogram, Metrics, StageTimer, STAGE_METRIC, CACHE_HITS_METRIC, \
+	CACHE_MISSES_METRIC, track_caches
+
+__author__ = 'divyagarg'
+
+
+class TestHistogram(unittest.TestCase):
+	def test_values_fall_in_the_first_bucket_they_fit(self):
+		histogram = Histogram(buckets=(0.1, 1.0))
+		for value in (0.05, 0.1, 0.5, 5.0):
+			histogram.observe(value)
+		self.assertEqual(histogram.counts, [2, 1, 1])
+		self.assertEqual(histogram.cumulative_counts(), [2, 3, 4])
+		self.assertEqual(histogram.count, 4)
+		self.assertAlmostEqual(histogram.sum, 5.65)
+
+
+class TestStageTimer(unittest.TestCase):
+	def setUp(self):
+		Metrics.reset()
+
+	def test_stages_are_closed_by_the_next_one(self):
+		timer = StageTimer('cart_update')
+		timer.start('items')
+		timer.start('coupons')
+		timer.finish('coupon service down')
+		self.assertEqual([(stage, outcome) for stage, outcome, ms in timer.timings],
+						 [('items', 'ok'), ('coupons', 'error')])
+		keys = sorted(labels for name, labels in Metrics.histograms if name == STAGE_METRIC)
+		self.assertEqual(keys, [
+			(('outcome', 'error'), ('pipeline', 'cart_update'), ('stage', 'coupons')),
+			(('outcome', 'ok'), ('pipeline', 'cart_update'), ('stage', 'items'))])
+
+	def test_render_prometheus_text(self):
+		Metrics.observe(STAGE_METRIC, 0.02, pipeline='order_create', stage='save', outcome='ok')
+		text = Metrics.render()
+		self.assertIn('# TYPE %s histogram' % STAGE_METRIC, text)
+		self.assertIn('%s_bucket{outcome="ok",pipeline="order_create",stage="save",le="0.025"} 1' % STAGE_METRIC,
+					  text)
+		self.assertIn('%s_bucket{outcome="ok",pipeline="order_create",stage="save",le="+Inf"} 1' % STAGE_METRIC,
+					  text)
+		self.assertIn('%s_count{outcome="ok",pipeline="order_create",stage="save"} 1' % STAGE_METRIC, text)
+
+
+class TestWorkerSnapshots(unittest.TestCase):
+	def setUp(self):
+		Metrics.reset()
+		Metrics.collectors = []
+		Metrics.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(Metrics.directory)
+		Metrics.directory = None
+		Metrics.collectors = []
+
+	def write_snapshot(self, pid, histograms=(), counters=(), gauges=()):
+		with open(os.path.join(Metrics.directory, '%d.json' % pid), 'w') as snapshot_file:
+			json.dump({'pid': pid, 'histograms': list(histograms), 'counters': list(counters),
+					   'gauges': list(gauges)}, snapshot_file)
+
+	def exited_pid(self):
+		process = subprocess.Popen(['true'])
+		process.wait()
+		return process.pid
+
+	def test_counters_and_histograms_are_summed_across_workers(self):
+		Metrics.increment('grocery_http_requests_total', route='/cart')
+		Metrics.observe('grocery_http_request_duration_seconds', 0.02, route='/cart')
+		self.write_snapshot(self.exited_pid(),
+							histograms=[['grocery_http_request_duration_seconds', [['route', '/cart']], DEFAULT_BUCKETS,
+										 [2] + [0] * len(DEFAULT_BUCKETS), 0.004, 2]],
+							counters=[['grocery_http_requests_total', [['route', '/cart']], 3]])
+		text = Metrics.render()
+		self.assertIn('grocery_http_requests_total{route="/cart"} 4', text)
+		self.assertIn('grocery_http_request_duration_seconds_count{route="/cart"} 3', text)
+		self.assertIn('grocery_http_request_duration_seconds_bucket{route="/cart",le="0.005"} 2', text)
+		self.assertIn('grocery_http_request_duration_seconds_bucket{route="/cart",le="0.025"} 3', text)
+
+	def test_gauges_of_exited_workers_are_dropped(self):
+		Metrics.add_collector(lambda: [('gauge', 'grocery_db_pool_checked_out', {}, 2)])
+		self.write_snapshot(os.getppid(), gauges=[['grocery_db_pool_checked_out', [], 3]])
+		self.write_snapshot(self.exited_pid(), gauges=[['grocery_db_pool_checked_out', [], 50]])
+		self.assertIn('grocery_db_pool_checked_out 5\n', Metrics.render())
+
+	def test_init_outside_the_uwsgi_master_keeps_worker_snapshots(self):
+		self.write_snapshot(os.getppid(), counters=[['grocery_http_requests_total', [['route', '/cart']], 3]])
+		app = Flask(__name__)
+		app.config['METRICS_DIR'] = Metrics.directory
+		Metrics.init(app)
+		self.assertIn('grocery_http_requests_total{route="/cart"} 3', Metrics.render())
+
+	def test_cache_hit_ratio_over_all_workers(self):
+		track_caches({'catalog': lambda: {'hits': 1, 'misses': 3}})
+		self.write_snapshot(os.getppid(), counters=[[CACHE_HITS_METRIC, [['cache', 'catalog']], 5],
+													[CACHE_MISSES_METRIC, [['cache', 'catalog']], 1]])
+		self.assertIn('grocery_cache_hit_ratio{cache="catalog"} 0.6', Metrics.render())
+
+
+if __name__ == '__main__':
+	unittest.main()
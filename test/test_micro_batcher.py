@@ -0,0 +1,67 @@
+import threading
+import unittest
+
+from utils.api_utils.micro_batcher import MicroBatcher
+
+__author__ = 'divyagarg'
+
+
+class TestMicroBatcher(unittest.TestCase):
+	def setUp(self):
+		self.searches = []
+
+	def search(self, order_type, item_ids):
+		self.searches.append((order_type, sorted(item_ids)))
+		if order_type == 'broken':
+			raise ValueError('catalog down')
+		return dict((item_id, {'id': item_id, 'type': order_type}) for item_id in item_ids if item_id != 404)
+
+	def run_concurrently(self, batcher, calls):
+		results = [None] * len(calls)
+		errors = []
+
+		def call(index, order_type, item_ids):
+			try:
+				results[index] = batcher.get_many(order_type, item_ids)
+			except ValueError as e:
+				errors.append(e)
+
+		threads = [threading.Thread(target=call, args=(index, order_type, item_ids))
+				   for index, (order_type, item_ids) in enumerate(calls)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		return results, errors
+
+	def test_concurrent_lookups_share_one_search_per_order_type(self):
+		batcher = MicroBatcher('catalog', self.search, window=0.2)
+		results, errors = self.run_concurrently(batcher, [('grocery', [1, 2]), ('grocery', [2, 3]),
+														  ('grocery', [404]), ('deals', [1])])
+		self.assertEqual(sorted(self.searches), [('deals', [1]), ('grocery', [1, 2, 3, 404])])
+		self.assertEqual(sorted(results[0].keys()), [1, 2])
+		self.assertEqual(sorted(results[1].keys()), [2, 3])
+		self.assertEqual(results[2], {})
+		self.assertEqual(results[3], {1: {'id': 1, 'type': 'deals'}})
+		self.assertEqual(batcher.get_stats()['batches'], 2)
+
+	def test_full_batch_is_searched_without_waiting_for_the_window(self):
+		batcher = MicroBatcher('catalog', self.search, window=60, max_batch_size=2)
+		result = batcher.get_many('grocery', [1, 2])
+		self.assertEqual(sorted(result.keys()), [1, 2])
+
+	def test_callers_get_their_own_copy(self):
+		batcher = MicroBatcher('catalog', self.search, window=0.2)
+		results, errors = self.run_concurrently(batcher, [('grocery', [1]), ('grocery', [1])])
+		results[0][1]['type'] = 'changed'
+		self.assertEqual(results[1][1]['type'], 'grocery')
+
+	def test_failure_is_raised_to_every_caller(self):
+		batcher = MicroBatcher('catalog', self.search, window=0.2)
+		results, errors = self.run_concurrently(batcher, [('broken', [1]), ('broken', [2])])
+		self.assertEqual(len(self.searches), 1)
+		self.assertEqual(len(errors), 2)
+
+
+if __name__ == '__main__':
+	unittest.main()
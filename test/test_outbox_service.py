@@ -0,0 +1,121 @@
+import os
+import time
+import datetime
+import tempfile
+import unittest
+
+from flask import Flask, g
+from apps.app_v1.models import db
+from apps.app_v1.models.models import OutboxEvent
+from apps.app_v1.api.outbox_service import OutboxService, OutboxRelay, PENDING, SENT
+from utils.kafka_utils.kafka_publisher import Publisher, FileBackend
+
+__author__ = 'divyagarg'
+
+TOPIC = 'grocery_orderservice_test'
+
+
+class FlakyBackend(FileBackend):
+	"""
+	File broker that refuses the messages of failing_keys.
+	"""
+
+	def __init__(self, app):
+		FileBackend.__init__(self, app)
+		self.failing_keys = set()
+
+	def send_sync(self, topic, key, messages):
+		if key in self.failing_keys:
+			raise Exception('broker unavailable for key %s' % key)
+		FileBackend.send_sync(self, topic, key, messages)
+
+
+class TestOutboxRelay(unittest.TestCase):
+	def setUp(self):
+		self.broker_path = tempfile.mktemp()
+		self.app = Flask(__name__)
+		self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+		self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+		self.app.config['KAFKA_TOPIC'] = TOPIC
+		self.app.config['KAFKA_PRODUCER'] = 'file'
+		self.app.config['KAFKA_FILE_BROKER_PATH'] = self.broker_path
+		self.app.config['KAFKA_OUTBOX_ENABLED'] = True
+		self.app.config['OUTBOX_RELAY_BATCH_SIZE'] = 100
+		self.app.config['OUTBOX_RELAY_POLL_INTERVAL'] = 0.05
+		db.init_app(self.app)
+		Publisher.init(self.app)
+		Publisher.backend = FlakyBackend(self.app)
+		OutboxService.init(self.app)
+		self.context = self.app.app_context()
+		self.context.push()
+		g.UUID = 'test'
+		OutboxEvent.__table__.create(db.engine)
+		self.relay = OutboxRelay(self.app)
+
+	def tearDown(self):
+		db.session.remove()
+		OutboxEvent.__table__.drop(db.engine)
+		self.context.pop()
+		if os.path.exists(self.broker_path):
+			os.remove(self.broker_path)
+
+	def add_events(self, *key_payloads):
+		for key, payload in key_payloads:
+			OutboxService.publish(key, payload)
+		db.session.commit()
+
+	def published(self, key=None):
+		return [message['value'] for message in Publisher.backend.read_messages(TOPIC)
+				if key is None or message['key'] == key]
+
+	def test_events_are_published_only_by_the_relay(self):
+		self.add_events(('order-1', 'created'))
+		self.assertEqual(self.published(), [])
+		self.assertEqual(self.relay.relay_batch(), 1)
+		self.assertEqual(self.published(), ['created'])
+		self.assertEqual(OutboxEvent.query.one().status, SENT)
+		self.assertEqual(self.relay.relay_batch(), 0)
+
+	def test_events_of_a_key_keep_their_order(self):
+		self.add_events(('order-1', 'created'), ('order-2', 'created'), ('order-1', 'paid'), ('order-2', 'paid'))
+		self.assertEqual(self.relay.relay_batch(), 4)
+		self.assertEqual(self.published('order-1'), ['created', 'paid'])
+		self.assertEqual(self.published('order-2'), ['created', 'paid'])
+
+	def test_failed_key_backs_off_and_holds_back_its_later_events(self):
+		Publisher.backend.failing_keys.add('order-1')
+		self.add_events(('order-1', 'created'), ('order-2', 'created'))
+		self.assertEqual(self.relay.relay_batch(), 2)
+		failed = OutboxEvent.query.filter_by(event_key='order-1').one()
+		self.assertEqual(failed.status, PENDING)
+		self.assertEqual(failed.attempts, 1)
+		self.assertTrue(failed.available_on > datetime.datetime.utcnow())
+
+		Publisher.backend.failing_keys.clear()
+		self.add_events(('order-1', 'paid'), ('order-2', 'paid'))
+		self.assertEqual(self.relay.relay_batch(), 1)
+		self.assertEqual(self.published('order-1'), [])
+		self.assertEqual(self.published('order-2'), ['created', 'paid'])
+
+	def test_held_back_events_do_not_fill_the_batch(self):
+		OutboxService.batch_size = 2
+		self.add_events(('order-1', 'created'), ('order-1', 'paid'), ('order-1', 'cancelled'), ('order-2', 'created'))
+		first = OutboxEvent.query.filter_by(event_key='order-1').order_by(OutboxEvent.id).first()
+		first.available_on = datetime.datetime.utcnow() + datetime.timedelta(minutes=5)
+		db.session.commit()
+		self.assertEqual(self.relay.relay_batch(), 1)
+		self.assertEqual(self.published(), ['created'])
+		self.assertEqual(self.published('order-2'), ['created'])
+
+	def test_poll_sleeps_when_only_held_back_events_are_pending(self):
+		self.add_events(('order-1', 'created'))
+		event = OutboxEvent.query.one()
+		event.available_on = datetime.datetime.utcnow() + datetime.timedelta(minutes=5)
+		db.session.commit()
+		start = time.time()
+		self.assertEqual(self.relay.poll(), 0)
+		self.assertTrue(time.time() - start >= OutboxService.poll_interval)
+
+
+if __name__ == '__main__':
+	unittest.main()
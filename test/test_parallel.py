@@ -0,0 +1,52 @@
+import logging
+import unittest
+
+import gevent
+from config import APP_NAME
+from test.helpers import CollectingHandler
+from utils.api_utils.parallel import BackgroundCall
+
+__author__ = 'divyagarg'
+
+
+def check_coupon():
+	raise ValueError('coupon service down')
+
+
+class TestBackgroundCall(unittest.TestCase):
+	def setUp(self):
+		self.handler = CollectingHandler()
+		logging.getLogger(APP_NAME).addHandler(self.handler)
+
+	def tearDown(self):
+		logging.getLogger(APP_NAME).removeHandler(self.handler)
+
+	def test_get_reraises_the_failure(self):
+		call = BackgroundCall(check_coupon)
+		self.assertRaises(ValueError, call.get)
+		call.cancel()
+		self.assertEqual(self.handler.messages, [])
+
+	def test_failure_of_a_cancelled_call_is_logged(self):
+		call = BackgroundCall(check_coupon)
+		gevent.sleep(0)
+		call.cancel()
+		self.assertEqual(self.handler.messages, ['[None] Cancelled call to [check_coupon] failed'])
+
+	def test_cancel_stops_a_running_call(self):
+		finished = []
+
+		def preview_shipments():
+			gevent.sleep(10)
+			finished.append(True)
+
+		call = BackgroundCall(preview_shipments)
+		gevent.sleep(0)
+		call.cancel()
+		gevent.sleep(0)
+		self.assertTrue(call.ready())
+		self.assertEqual(finished, [])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,71 @@
+import threading
+import unittest
+
+from utils.api_utils.single_flight import SingleFlight
+
+__author__ = 'divyagarg'
+
+
+class TestSingleFlight(unittest.TestCase):
+	def setUp(self):
+		self.flight = SingleFlight('catalog')
+		self.started = threading.Event()
+		self.release = threading.Event()
+		self.upstream_calls = 0
+
+	def slow_call(self, value):
+		self.upstream_calls += 1
+		self.started.set()
+		self.release.wait()
+		if value is None:
+			raise ValueError('no value')
+		return {'items': [value]}
+
+	def run_waiters(self, value, count):
+		results = []
+		errors = []
+
+		def call():
+			try:
+				results.append(self.flight.do('key', self.slow_call, value))
+			except ValueError as e:
+				errors.append(e)
+
+		leader = threading.Thread(target=call)
+		leader.start()
+		self.started.wait()
+		waiters = [threading.Thread(target=call) for i in range(count)]
+		for waiter in waiters:
+			waiter.start()
+		while self.flight.get_stats()['shared'] < count:
+			pass
+		self.release.set()
+		for thread in [leader] + waiters:
+			thread.join()
+		return results, errors
+
+	def test_identical_calls_share_one_upstream_call(self):
+		results, errors = self.run_waiters(1, 3)
+		self.assertEqual(self.upstream_calls, 1)
+		self.assertEqual(results, [{'items': [1]}] * 4)
+		self.assertEqual(self.flight.get_stats(), {'calls': 1, 'shared': 3, 'in_flight': 0})
+
+	def test_waiters_get_their_own_copy(self):
+		results, errors = self.run_waiters(1, 2)
+		results[0]['items'].append(2)
+		self.assertEqual(results[1], {'items': [1]})
+
+	def test_exception_is_raised_to_every_waiter(self):
+		results, errors = self.run_waiters(None, 2)
+		self.assertEqual(results, [])
+		self.assertEqual(len(errors), 3)
+
+	def test_nothing_is_kept_after_the_call(self):
+		self.release.set()
+		self.flight.do('key', self.slow_call, 1)
+		self.flight.do('key', self.slow_call, 1)
+		self.assertEqual(self.upstream_calls, 2)
+
+
+if __name__ == '__main__':
+	unittest.main()
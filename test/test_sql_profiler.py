@@ -0,0 +1,74 @@
+import logging
+import unittest
+
+from flask import Flask, g
+from sqlalchemy import create_engine
+from config import APP_NAME
+from lib.metrics import Metrics
+from lib.sql_profiler import RequestProfile, SqlProfiler, N_PLUS_ONE_METRIC
+from test.helpers import CollectingHandler
+
+__author__ = 'divyagarg'
+
+
+class TestRequestProfile(unittest.TestCase):
+	def test_statements_repeated_within_a_request_are_reported(self):
+		profile = RequestProfile()
+		profile.record('SELECT * FROM cart WHERE cart_reference_uuid = %s', 0.002)
+		for _ in range(6):
+			profile.record('SELECT * FROM cart_item WHERE cart_id = %s AND item_id = %s', 0.001)
+		self.assertEqual(profile.count, 7)
+		self.assertAlmostEqual(profile.total_time, 0.008)
+		repeated = profile.repeated(5)
+		self.assertEqual(len(repeated), 1)
+		self.assertEqual(repeated[0][0], 6)
+		self.assertEqual(repeated[0][2], 'SELECT * FROM cart_item WHERE cart_id = %s AND item_id = %s')
+		self.assertEqual(profile.repeated(7), [])
+
+
+class TestSqlProfilerRequest(unittest.TestCase):
+	def setUp(self):
+		Metrics.reset()
+		self.app = Flask(__name__)
+		self.app.config['SQL_PROFILER_ENABLED'] = True
+		self.app.config['SQL_SLOW_QUERY_MS'] = 0
+		self.app.config['SQL_REPEATED_QUERY_THRESHOLD'] = 5
+		SqlProfiler.init(self.app)
+		engine = create_engine('sqlite://')
+		SqlProfiler.profile(engine)
+
+		@self.app.route('/cart/<int:cart_id>')
+		def get_cart(cart_id):
+			g.UUID = 'request-1'
+			for item_id in range(6):
+				engine.execute('SELECT ? AS cart_id, ? AS item_id', cart_id, item_id).fetchall()
+			return 'ok'
+
+		self.handler = CollectingHandler()
+		self.logger = logging.getLogger(APP_NAME)
+		self.logger.addHandler(self.handler)
+		self.level = self.logger.level
+		self.logger.setLevel(logging.INFO)
+
+	def tearDown(self):
+		self.logger.removeHandler(self.handler)
+		self.logger.setLevel(self.level)
+		SqlProfiler.enabled = False
+		Metrics.reset()
+
+	def test_repeated_statement_is_reported_for_the_request(self):
+		self.assertEqual(self.app.test_client().get('/cart/7').status_code, 200)
+		messages = self.handler.messages
+		self.assertTrue(any(message.startswith('[request-1] Slow query on route [/cart/<int:cart_id>]')
+							for message in messages))
+		self.assertIn('[request-1] SQL queries on route [/cart/<int:cart_id>] = 6',
+					  [message.split(', time')[0] for message in messages])
+		n_plus_one = [message for message in messages if 'Possible N+1' in message]
+		self.assertEqual(len(n_plus_one), 1)
+		self.assertIn('route [/cart/<int:cart_id>]: 6 runs', n_plus_one[0])
+		self.assertIn('SELECT ? AS cart_id, ? AS item_id', n_plus_one[0])
+		self.assertEqual(Metrics.counters[(N_PLUS_ONE_METRIC, (('route', '/cart/<int:cart_id>'),))], 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
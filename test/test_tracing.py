@@ -0,0 +1,64 @@
+import os
+import json
+import tempfile
+import unittest
+
+from flask import Flask
+from lib.metrics import StageTimer
+from lib.tracing import Tracer
+
+__author__ = 'divyagarg'
+
+
+class TestRequestTrace(unittest.TestCase):
+	def setUp(self):
+		self.trace_file = tempfile.mktemp()
+		self.app = Flask(__name__)
+		self.app.config['TRACING_ENABLED'] = True
+		self.app.config['TRACING_SAMPLE_RATE'] = 1.0
+		self.app.config['TRACING_FILE'] = self.trace_file
+
+		@self.app.route('/order')
+		def order():
+			timer = StageTimer('order_create')
+			timer.start('validation')
+			timer.start('save')
+			span = Tracer.start_span('POST fulfilment', 'http')
+			Tracer.finish_span(span, status=200)
+			timer.finish()
+			return 'ok'
+
+		Tracer.init(self.app)
+
+	def tearDown(self):
+		Tracer.enabled = False
+		if os.path.exists(self.trace_file):
+			os.remove(self.trace_file)
+
+	def read_traces(self):
+		with open(self.trace_file) as trace_file:
+			return [json.loads(line) for line in trace_file]
+
+	def test_spans_are_linked_to_their_parents(self):
+		self.app.test_client().get('/order')
+		traces = self.read_traces()
+		self.assertEqual(len(traces), 1)
+		spans = dict((span['name'], span) for span in traces[0])
+		self.assertEqual(sorted(spans), ['GET /order', 'POST fulfilment', 'save', 'validation'])
+		root = spans['GET /order']
+		self.assertNotIn('parentId', root)
+		self.assertEqual(root['kind'], 'SERVER')
+		self.assertEqual(root['tags']['status'], '200')
+		self.assertEqual(spans['validation']['parentId'], root['id'])
+		self.assertEqual(spans['save']['parentId'], root['id'])
+		self.assertEqual(spans['POST fulfilment']['parentId'], spans['save']['id'])
+		self.assertEqual(len(set(span['traceId'] for span in traces[0])), 1)
+
+	def test_unsampled_fast_requests_are_not_exported(self):
+		Tracer.sample_rate = 0.0
+		self.app.test_client().get('/order')
+		self.assertFalse(os.path.exists(self.trace_file) and self.read_traces())
+
+
+if __name__ == '__main__':
+	unittest.main()
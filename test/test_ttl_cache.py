@@ -0,0 +1,59 @@
+import unittest
+
+from test.helpers import FakeTimer
+from utils.cache_utils.ttl_cache import TTLCache
+
+__author__ = 'divyagarg'
+
+
+class DictBackend(object):
+	def __init__(self):
+		self.store = {}
+
+	def get_many(self, keys):
+		return dict((key, self.store[key]) for key in keys if key in self.store)
+
+	def set_many(self, mapping, ttl):
+		self.store.update(mapping)
+
+
+class TestTTLCache(unittest.TestCase):
+	def setUp(self):
+		self.timer = FakeTimer()
+		self.cache = TTLCache(maxsize=3, ttl=60, timer=self.timer)
+
+	def test_partial_hit_returns_only_missing_keys(self):
+		self.cache.set_many({1: 'a', 2: 'b'})
+		found, missing = self.cache.get_many([1, 2, 3, 4])
+		self.assertEqual(found, {1: 'a', 2: 'b'})
+		self.assertEqual(missing, [3, 4])
+		self.assertEqual(self.cache.get_stats()['hits'], 2)
+		self.assertEqual(self.cache.get_stats()['misses'], 2)
+
+	def test_entries_expire_after_ttl(self):
+		self.cache.set(1, 'a')
+		self.timer.now += 59
+		self.assertEqual(self.cache.get(1), 'a')
+		self.timer.now += 2
+		self.assertIsNone(self.cache.get(1))
+		self.assertEqual(len(self.cache), 0)
+
+	def test_least_recently_used_entry_is_evicted(self):
+		self.cache.set_many({1: 'a', 2: 'b', 3: 'c'})
+		self.cache.get(1)
+		self.cache.set(4, 'd')
+		found, missing = self.cache.get_many([1, 2, 3, 4])
+		self.assertEqual(missing, [2])
+		self.assertEqual(self.cache.get_stats()['evictions'], 1)
+
+	def test_shared_backend_fills_local_misses(self):
+		backend = DictBackend()
+		writer = TTLCache(ttl=60, shared_backend=backend, timer=self.timer)
+		reader = TTLCache(ttl=60, shared_backend=backend, timer=self.timer)
+		writer.set(1, 'a')
+		self.assertEqual(reader.get(1), 'a')
+		self.assertEqual(len(reader), 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,102 @@
+__author__ = 'divyagarg'
+import time
+import logging
+import threading
+
+from config import APP_NAME
+
+Logger = logging.getLogger(APP_NAME)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenException(Exception):
+    def __init__(self, name):
+        self.name = name
+        super(CircuitOpenException, self).__init__('Circuit for [%s] is open' % name)
+
+
+class CircuitBreaker(object):
+    """
+    Fails calls to a dependency fast once it keeps failing.
+
+    After failure_threshold consecutive failures the circuit opens and
+    before_call raises CircuitOpenException without touching the network.
+    Once reset_timeout seconds have passed, up to half_open_max_calls probes
+    are let through: a successful probe closes the circuit, a failed one opens
+    it again for another reset_timeout.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=10, half_open_max_calls=1, timer=time.time):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.timer = timer
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.half_open_calls = 0
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def before_call(self):
+        with self.lock:
+            if self.state == OPEN:
+                if self.timer() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenException(self.name)
+                self.state = HALF_OPEN
+                self.half_open_calls = 0
+                Logger.info('Circuit for [%s] is half open, probing', self.name)
+            if self.state == HALF_OPEN:
+                if self.half_open_calls >= self.half_open_max_calls:
+                    self.rejected += 1
+                    raise CircuitOpenException(self.name)
+                self.half_open_calls += 1
+            self.calls += 1
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                self.state = CLOSED
+                self.opened_at = None
+                Logger.info('Circuit for [%s] is closed again', self.name)
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                    Logger.error('Circuit for [%s] opened after [%s] consecutive failures',
+                                 self.name, self.consecutive_failures)
+                self.state = OPEN
+                self.opened_at = self.timer()
+
+    def release(self):
+        """
+        Gives back the probe slot of a call that ended without an outcome,
+        e.g. a killed greenlet, so the half open circuit can probe again.
+        """
+        with self.lock:
+            if self.state == HALF_OPEN and self.half_open_calls > 0:
+                self.half_open_calls -= 1
+
+    def get_state(self):
+        with self.lock:
+            if self.state == OPEN and self.timer() - self.opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self.state
+
+    def get_stats(self):
+        return {'state': self.get_state(), 'consecutive_failures': self.consecutive_failures,
+                'calls': self.calls, 'failures': self.failures, 'rejected': self.rejected,
+                'times_opened': self.times_opened}
@@ -0,0 +1,212 @@
+__author__ = 'divyagarg'
+import os
+import time
+import logging
+import threading
+from urlparse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import Timeout
+from config import APP_NAME
+from lib.metrics import Metrics
+from lib.tracing import Tracer
+from utils.api_utils.circuit_breaker import CircuitBreaker, CircuitOpenException
+
+Logger = logging.getLogger(APP_NAME)
+
+DOWNSTREAM_METRIC = 'grocery_downstream_duration_seconds'
+DOWNSTREAM_ERRORS_METRIC = 'grocery_downstream_errors_total'
+Metrics.describe(DOWNSTREAM_METRIC, 'Duration of downstream calls by dependency and outcome.')
+Metrics.describe(DOWNSTREAM_ERRORS_METRIC, 'Failed downstream calls by dependency and reason.')
+
+
+class HttpClient(object):
+    """
+    Shared client for all downstream calls.
+
+    Keeps one keep-alive session per downstream host so that cart and order
+    calls reuse established TCP/TLS connections instead of opening a new one
+    on every request. Sessions are created lazily per worker process, so the
+    pools are never shared across uwsgi forks.
+
+    Calls made with a dependency name go through that dependency's circuit
+    breaker: 5xx responses, timeouts and connection errors count as failures,
+    and while the circuit is open CircuitOpenException is raised right away.
+    """
+    pool_maxsize = 1024
+    pool_block = False
+    default_timeout = 10
+    connect_timeout = None
+    read_timeouts = {}
+    breaker_settings = {}
+
+    sessions = {}
+    stats = {}
+    breakers = {}
+    pid = None
+    lock = threading.Lock()
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def init(app):
+        HttpClient.pool_maxsize = app.config.get('HTTP_POOL_MAXSIZE', HttpClient.pool_maxsize)
+        HttpClient.pool_block = app.config.get('HTTP_POOL_BLOCK', HttpClient.pool_block)
+        HttpClient.default_timeout = app.config.get('API_TIMEOUT', HttpClient.default_timeout)
+        HttpClient.connect_timeout = app.config.get('HTTP_CONNECT_TIMEOUT')
+        HttpClient.read_timeouts = app.config.get('HTTP_READ_TIMEOUTS', {})
+        HttpClient.breaker_settings = {
+            'failure_threshold': app.config.get('CIRCUIT_FAILURE_THRESHOLD', 5),
+            'reset_timeout': app.config.get('CIRCUIT_RESET_TIMEOUT', 10),
+            'half_open_max_calls': app.config.get('CIRCUIT_HALF_OPEN_MAX_CALLS', 1)
+        }
+        HttpClient.reset()
+
+    @staticmethod
+    def reset():
+        with HttpClient.lock:
+            for session in HttpClient.sessions.values():
+                session.close()
+            HttpClient.sessions = {}
+            HttpClient.stats = {}
+            HttpClient.breakers = {}
+            HttpClient.pid = os.getpid()
+
+    @staticmethod
+    def get_host(url):
+        parsed_url = urlparse(url)
+        return '%s://%s' % (parsed_url.scheme, parsed_url.netloc)
+
+    @staticmethod
+    def get_session(host):
+        if HttpClient.pid != os.getpid():
+            # pools inherited from the parent process must not be reused
+            HttpClient.reset()
+        session = HttpClient.sessions.get(host)
+        if session is None:
+            with HttpClient.lock:
+                session = HttpClient.sessions.get(host)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HttpClient.pool_maxsize,
+                                          pool_block=HttpClient.pool_block)
+                    session.mount(host, adapter)
+                    HttpClient.sessions[host] = session
+                    HttpClient.stats[host] = {'requests': 0, 'errors': 0, 'timeouts': 0,
+                                              'total_time': 0.0, 'max_time': 0.0}
+                    Logger.info('Created connection pool for host [%s] with maxsize [%s]',
+                                host, HttpClient.pool_maxsize)
+        return session
+
+    @staticmethod
+    def get_breaker(dependency):
+        breaker = HttpClient.breakers.get(dependency)
+        if breaker is None:
+            with HttpClient.lock:
+                breaker = HttpClient.breakers.get(dependency)
+                if breaker is None:
+                    breaker = CircuitBreaker(dependency, **HttpClient.breaker_settings)
+                    HttpClient.breakers[dependency] = breaker
+        return breaker
+
+    @staticmethod
+    def get_timeout(dependency):
+        read_timeout = HttpClient.read_timeouts.get(dependency, HttpClient.default_timeout)
+        if HttpClient.connect_timeout is None:
+            return read_timeout
+        return HttpClient.connect_timeout, read_timeout
+
+    @staticmethod
+    def request(method, url, data=None, headers=None, params=None, timeout=None, dependency=None):
+        host = HttpClient.get_host(url)
+        session = HttpClient.get_session(host)
+        if timeout is None:
+            timeout = HttpClient.get_timeout(dependency)
+        breaker = None
+        if dependency is not None:
+            breaker = HttpClient.get_breaker(dependency)
+            try:
+                breaker.before_call()
+            except CircuitOpenException:
+                Metrics.increment(DOWNSTREAM_ERRORS_METRIC, dependency=dependency, reason='circuit_open')
+                raise
+        span = Tracer.start_span('%s %s' % (method, dependency or host), 'http', url=url)
+        headers = Tracer.propagation_headers(headers)
+        start = time.time()
+        error = False
+        timed_out = False
+        outcome = 'ok'
+        response = None
+        recorded = False
+        try:
+            response = session.request(method, url, data=data, headers=headers, params=params, timeout=timeout)
+            if response.status_code >= 500:
+                outcome = 'server_error'
+            if breaker is not None:
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                recorded = True
+            return response
+        except Timeout:
+            timed_out = True
+            outcome = 'timeout'
+            raise
+        except Exception:
+            error = True
+            outcome = 'error'
+            raise
+        finally:
+            if breaker is not None:
+                if error or timed_out:
+                    breaker.record_failure()
+                elif not recorded:
+                    # interrupted by a BaseException such as GreenletExit
+                    breaker.release()
+            Tracer.finish_span(span, None if outcome == 'ok' else outcome,
+                               status=response.status_code if response is not None else None)
+            elapsed = time.time() - start
+            HttpClient.record(host, elapsed, error=error, timed_out=timed_out)
+            Metrics.observe(DOWNSTREAM_METRIC, elapsed, dependency=dependency or host, outcome=outcome)
+            if outcome != 'ok':
+                Metrics.increment(DOWNSTREAM_ERRORS_METRIC, dependency=dependency or host, reason=outcome)
+
+    @staticmethod
+    def post(url, data=None, headers=None, timeout=None, dependency=None):
+        return HttpClient.request('POST', url, data=data, headers=headers, timeout=timeout, dependency=dependency)
+
+    @staticmethod
+    def get(url, params=None, headers=None, timeout=None, dependency=None):
+        return HttpClient.request('GET', url, params=params, headers=headers, timeout=timeout,
+                                  dependency=dependency)
+
+    @staticmethod
+    def record(host, elapsed, error=False, timed_out=False):
+        host_stats = HttpClient.stats.get(host)
+        if host_stats is None:
+            return
+        host_stats['requests'] += 1
+        host_stats['total_time'] += elapsed
+        if elapsed > host_stats['max_time']:
+            host_stats['max_time'] = elapsed
+        if timed_out:
+            host_stats['timeouts'] += 1
+        if error or timed_out:
+            host_stats['errors'] += 1
+
+    @staticmethod
+    def get_stats():
+        stats = {}
+        for host, host_stats in HttpClient.stats.items():
+            host_stats = host_stats.copy()
+            host_stats['avg_time'] = host_stats['total_time'] / host_stats['requests'] \
+                if host_stats['requests'] > 0 else 0.0
+            stats[host] = host_stats
+        return stats
+
+    @staticmethod
+    def get_breaker_stats():
+        return dict((dependency, breaker.get_stats()) for dependency, breaker in HttpClient.breakers.items())
@@ -0,0 +1,90 @@
+__author__ = 'divyagarg'
+import sys
+import copy
+import threading
+
+import six
+
+
+class Batch(object):
+    def __init__(self):
+        self.keys = []
+        self.key_set = set()
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+    def add(self, keys):
+        for key in keys:
+            if key not in self.key_set:
+                self.key_set.add(key)
+                self.keys.append(key)
+
+
+class MicroBatcher(object):
+    """
+    Merges lookups of concurrent callers in the same group into one call.
+
+    The first caller of get_many(group, keys) opens a batch and waits up to
+    window seconds (or until max_batch_size keys are collected) for others to
+    add their keys, then calls fetch_many(group, keys), which must return a
+    dict keyed like the keys asked for. Every caller gets a copy of just the
+    entries it asked for; if the call fails, every caller gets its exception.
+
+    Built on threading primitives, which gevent's monkey patching turns into
+    greenlet aware ones.
+    """
+
+    def __init__(self, name, fetch_many, window=0.005, max_batch_size=100):
+        self.name = name
+        self.fetch_many = fetch_many
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.keys = 0
+        self.largest_batch = 0
+
+    def get_many(self, group, keys):
+        with self.lock:
+            batch = self.pending.get(group)
+            flusher = batch is None
+            if flusher:
+                batch = Batch()
+                self.pending[group] = batch
+            batch.add(keys)
+            self.requests += 1
+            if len(batch.keys) >= self.max_batch_size:
+                # later callers start a new batch, this one goes out right away
+                self.pending.pop(group, None)
+                batch.full.set()
+        if flusher:
+            self.flush(group, batch)
+        else:
+            batch.done.wait()
+        if batch.exc_info is not None:
+            six.reraise(*batch.exc_info)
+        return dict((key, copy.deepcopy(batch.result[key])) for key in keys if key in batch.result)
+
+    def flush(self, group, batch):
+        batch.full.wait(self.window)
+        with self.lock:
+            if self.pending.get(group) is batch:
+                self.pending.pop(group)
+            self.batches += 1
+            self.keys += len(batch.keys)
+            self.largest_batch = max(self.largest_batch, len(batch.keys))
+        try:
+            batch.result = self.fetch_many(group, list(batch.keys))
+        except BaseException:
+            batch.exc_info = sys.exc_info()
+        finally:
+            batch.done.set()
+
+    def get_stats(self):
+        return {'window': self.window, 'requests': self.requests, 'batches': self.batches,
+                'avg_batch_size': float(self.keys) / self.batches if self.batches > 0 else 0.0,
+                'largest_batch': self.largest_batch}
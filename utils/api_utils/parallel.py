@@ -0,0 +1,78 @@
+__author__ = 'divyagarg'
+import sys
+import logging
+
+import six
+from flask import current_app, g, has_app_context
+
+from config import APP_NAME
+from lib import engine
+
+Logger = logging.getLogger(APP_NAME)
+
+
+class BackgroundCall(object):
+    """
+    Runs a function on its own greenlet (or thread, under the threaded
+    engine) and hands back its result (or re-raises its exception) on get().
+
+    The task gets a fresh app context carrying a copy of the caller's
+    flask g, so g.UUID and current_app keep working inside it. Flask-SQLAlchemy
+    scopes sessions per greenlet, so the function must not touch ORM objects
+    loaded by the caller; do DB work first and pass plain data in.
+
+    A call whose result is no longer wanted is cancel()ed: its greenlet is
+    killed, while a thread runs to completion. Either way a failure nobody
+    will get() is logged instead of dropped.
+    """
+
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.exc_info = None
+        self.app = None
+        self.g_values = {}
+        self.joined = False
+        self.cancelled = False
+        if has_app_context():
+            self.app = current_app._get_current_object()
+            self.g_values = dict(g.__dict__)
+        self.task = engine.spawn(self.run)
+
+    def run(self):
+        try:
+            if self.app is None:
+                self.result = self.func(*self.args, **self.kwargs)
+            else:
+                with self.app.app_context():
+                    g.__dict__.update(self.g_values)
+                    self.result = self.func(*self.args, **self.kwargs)
+        except Exception:
+            self.exc_info = sys.exc_info()
+            if self.cancelled:
+                self.log_failure()
+
+    def ready(self):
+        return self.task.ready()
+
+    def cancel(self):
+        if self.joined or self.cancelled:
+            return
+        self.cancelled = True
+        if self.exc_info is not None:
+            self.log_failure()
+        elif not self.task.ready() and hasattr(self.task, 'kill'):
+            self.task.kill(block=False)
+
+    def log_failure(self):
+        Logger.error('[%s] Cancelled call to [%s] failed', self.g_values.get('UUID'),
+                     getattr(self.func, '__name__', self.func), exc_info=self.exc_info)
+
+    def get(self):
+        self.joined = True
+        self.task.join()
+        if self.exc_info is not None:
+            six.reraise(*self.exc_info)
+        return self.result
@@ -0,0 +1,69 @@
+__author__ = 'divyagarg'
+import sys
+import copy
+import threading
+
+import six
+
+
+class Flight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """
+    Merges identical in-flight calls within a worker process.
+
+    The first caller of do(key, ...) runs the function; callers arriving with
+    the same key while it is running wait for it and get a deep copy of its
+    result, or its exception re-raised. Nothing is kept once the call returns,
+    so this never serves a stale result.
+
+    Built on threading primitives, which gevent's monkey patching turns into
+    greenlet aware ones.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, func, *args, **kwargs):
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight()
+                self.flights[key] = flight
+                self.calls += 1
+            else:
+                flight.waiters += 1
+                self.shared += 1
+        if not leader:
+            flight.done.wait()
+            if flight.exc_info is not None:
+                six.reraise(*flight.exc_info)
+            return copy.deepcopy(flight.result)
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            flight.exc_info = sys.exc_info()
+            raise
+        else:
+            return result
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+            if flight.waiters > 0 and flight.exc_info is None:
+                # the leader's caller may change its result before the waiters wake up
+                flight.result = copy.deepcopy(result)
+            flight.done.set()
+
+    def get_stats(self):
+        return {'calls': self.calls, 'shared': self.shared, 'in_flight': len(self.flights)}
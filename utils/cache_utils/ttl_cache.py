@@ -0,0 +1,93 @@
+__author__ = 'divyagarg'
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    """
+    Size bounded in-process cache whose entries expire ttl seconds after they
+    were written. When full, the least recently used entry is evicted.
+
+    An optional shared_backend (any object with get_many(keys) returning a
+    dict, set_many(mapping, ttl) and delete_many(keys)) is consulted on local
+    misses and written through on set and invalidate, so several worker
+    processes can share one store.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60, shared_backend=None, timer=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared_backend = shared_backend
+        self.timer = timer
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        found, missing = self.get_many([key])
+        return found.get(key, default)
+
+    def get_many(self, keys):
+        """
+        Returns a dict of the keys found and a list of the keys missing, in
+        the order they were asked for.
+        """
+        found = {}
+        missing = []
+        now = self.timer()
+        with self.lock:
+            for key in keys:
+                entry = self.entries.pop(key, None)
+                if entry is not None and entry[0] > now:
+                    # re-insert to mark as most recently used
+                    self.entries[key] = entry
+                    found[key] = entry[1]
+                else:
+                    missing.append(key)
+        if missing and self.shared_backend is not None:
+            shared = self.shared_backend.get_many(missing)
+            if shared:
+                self.set_many(shared, write_through=False)
+                found.update(shared)
+                missing = [key for key in missing if key not in shared]
+        with self.lock:
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, mapping, write_through=True):
+        expires_at = self.timer() + self.ttl
+        with self.lock:
+            for key, value in mapping.items():
+                self.entries.pop(key, None)
+                self.entries[key] = (expires_at, value)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        if write_through and self.shared_backend is not None:
+            self.shared_backend.set_many(mapping, self.ttl)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+        if self.shared_backend is not None:
+            self.shared_backend.delete_many([key])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'maxsize': self.maxsize, 'ttl': self.ttl,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_ratio': float(self.hits) / lookups if lookups > 0 else 0.0}
@@ -11,6 +11,9 @@ FUNCTIONS = 'functions'
 SCHEMA = 'schema'
 REQUIRED = 'required'
 
+# id(schema) -> (schema, compiled validator)
+COMPILED_SCHEMAS = {}
+
 Logger = logging.getLogger(APP_NAME)
 
 def Integer(val, min_value=None, max_value=None):
@@ -115,7 +118,53 @@ def MobileNumber(val):
 
 
 
+def compile_schema(schema):
+    """
+    Flattens a schema into a single closure so a request is checked without
+    walking the schema dicts again. Compiled schemas are kept in
+    COMPILED_SCHEMAS against the schema object they were built from.
+    """
+    entry = COMPILED_SCHEMAS.get(id(schema))
+    if entry is not None and entry[0] is schema:
+        return entry[1]
+
+    checks = []
+    for key, validator_json in schema.items():
+        required = validator_json.get(REQUIRED, True)
+        functions = []
+        for function in validator_json.get(FUNCTIONS, []):
+            functions.extend(function.items())
+        nested = compile_schema(validator_json[SCHEMA]) if SCHEMA in validator_json else None
+        checks.append((key, required, tuple(functions), nested))
+    checks = tuple(checks)
+
+    def validate_compiled(data):
+        for key, required, functions, nested in checks:
+            if key not in data:
+                if required:
+                    ERROR.KEY_MISSING.message = 'key missing is :{%s}'%key
+                    raise RequiredFieldMissing(ERROR.KEY_MISSING)
+                continue
+            value = data[key]
+            for func_name, kwargs in functions:
+                func_name(val=value, **kwargs)
+            if nested is not None:
+                if isinstance(value, dict):
+                    nested(value)
+                elif isinstance(value, collections.Iterable):
+                    for nested_json in value:
+                        nested(nested_json)
+
+    COMPILED_SCHEMAS[id(schema)] = (schema, validate_compiled)
+    return validate_compiled
+
+
 def validate(data, schema):
+    Logger.info("[%s] ********Validating request *********" %(g.UUID))
+    compile_schema(schema)(data)
+
+
+def validate_interpreted(data, schema):
     Logger.info("[%s] ********Validating request *********" %(g.UUID))
     for key, validator_json in schema.items():
         required = validator_json.get(REQUIRED, True)
@@ -132,7 +181,6 @@ def validate(data, schema):
                 schema = validator_json[SCHEMA]
                 if isinstance(value, collections.Iterable) and not isinstance(value, dict):
                     for nested_json in value:
-                        validate(data=nested_json, schema=schema)
+                        validate_interpreted(data=nested_json, schema=schema)
                 if isinstance(value, dict):
-                    validate(data=value, schema=schema)
-
+                    validate_interpreted(data=value, schema=schema)
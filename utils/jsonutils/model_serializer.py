@@ -0,0 +1,66 @@
+__author__ = 'divyagarg'
+import threading
+
+from sqlalchemy import inspect
+from sqlalchemy.types import Date, DateTime, Time
+
+
+class ModelSerializer(object):
+    """
+    Serializes a mapped object to a plain dict in one pass over its columns.
+
+    The list of columns (and which of them hold dates/times) is worked out
+    once per model class from the mapper and reused for every object,
+    instead of round tripping each object through jsonpickle.
+    """
+    serializers = {}
+    lock = threading.Lock()
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def compile(model_class, exclude=()):
+        plain_keys = []
+        temporal_keys = []
+        for column_property in inspect(model_class).column_attrs:
+            key = column_property.key
+            if key in exclude or key.startswith('_'):
+                continue
+            if isinstance(column_property.columns[0].type, (Date, DateTime, Time)):
+                temporal_keys.append(key)
+            else:
+                plain_keys.append(key)
+        plain_keys = tuple(plain_keys)
+        temporal_keys = tuple(temporal_keys)
+
+        def serialize(obj, skip_keys_with_none=False):
+            data = {}
+            for key in plain_keys:
+                data[key] = getattr(obj, key)
+            for key in temporal_keys:
+                value = getattr(obj, key)
+                data[key] = value.isoformat() if value is not None else None
+            if skip_keys_with_none:
+                for key, value in data.items():
+                    if value is None:
+                        del data[key]
+            return data
+
+        return serialize
+
+    @staticmethod
+    def get_serializer(model_class, exclude=()):
+        cache_key = (model_class, tuple(exclude))
+        serializer = ModelSerializer.serializers.get(cache_key)
+        if serializer is None:
+            with ModelSerializer.lock:
+                serializer = ModelSerializer.serializers.get(cache_key)
+                if serializer is None:
+                    serializer = ModelSerializer.compile(model_class, exclude)
+                    ModelSerializer.serializers[cache_key] = serializer
+        return serializer
+
+    @staticmethod
+    def serialize(obj, exclude=(), skip_keys_with_none=False):
+        return ModelSerializer.get_serializer(type(obj), exclude)(obj, skip_keys_with_none)
@@ -0,0 +1,153 @@
+__author__ = 'divyagarg'
+import os
+import json
+import fcntl
+import logging
+import threading
+
+from config import APP_NAME
+
+logger = logging.getLogger(APP_NAME)
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+INDEX_FILE = 'index'
+LOCK_FILE = 'lock'
+
+
+class DiskSpool(object):
+    """
+    Append-only spool of messages that could not be handed to Kafka.
+
+    Records are json lines written to numbered segment files. The index file
+    holds the replay cursor (segment number and byte offset); it is replaced
+    atomically after every commit, and segments behind the cursor are deleted.
+    Each process spools into its own directory under base_dir, holding an
+    exclusive lock on it, so uwsgi workers never write the same files.
+    """
+
+    def __init__(self, directory, segment_max_bytes=16 * 1024 * 1024, fsync=False):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.lock_file = open(os.path.join(directory, LOCK_FILE), 'a')
+        # raises IOError when another live process owns the directory
+        fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.cursor = self.read_index()
+        segments = self.segment_numbers()
+        self.write_segment = segments[-1] if segments else self.cursor[0]
+        self.write_file = None
+
+    @staticmethod
+    def for_process(base_dir, **kwargs):
+        return DiskSpool(os.path.join(base_dir, str(os.getpid())), **kwargs)
+
+    @staticmethod
+    def adopt_orphans(base_dir, **kwargs):
+        """
+        Returns spools left behind by processes that are no longer running.
+        """
+        spools = []
+        if not os.path.exists(base_dir):
+            return spools
+        for name in os.listdir(base_dir):
+            directory = os.path.join(base_dir, name)
+            if name == str(os.getpid()) or not os.path.isdir(directory):
+                continue
+            try:
+                spools.append(DiskSpool(directory, **kwargs))
+            except IOError:
+                continue
+        return spools
+
+    def segment_path(self, number):
+        return os.path.join(self.directory, '%s%010d%s' % (SEGMENT_PREFIX, number, SEGMENT_SUFFIX))
+
+    def segment_numbers(self):
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                numbers.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+        return sorted(numbers)
+
+    def read_index(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(path):
+            return (0, 0)
+        with open(path) as index_file:
+            segment, offset = index_file.read().split()
+        return (int(segment), int(offset))
+
+    def write_index(self, cursor):
+        path = os.path.join(self.directory, INDEX_FILE)
+        with open(path + '.tmp', 'w') as index_file:
+            index_file.write('%d %d' % cursor)
+            index_file.flush()
+            if self.fsync:
+                os.fsync(index_file.fileno())
+        os.rename(path + '.tmp', path)
+
+    def append(self, topic, key, message):
+        record = json.dumps({'topic': topic, 'key': key, 'value': message}) + '\n'
+        with self.lock:
+            if self.write_file is None:
+                self.write_file = open(self.segment_path(self.write_segment), 'a')
+            if self.write_file.tell() > 0 and self.write_file.tell() + len(record) > self.segment_max_bytes:
+                self.write_file.close()
+                self.write_segment += 1
+                self.write_file = open(self.segment_path(self.write_segment), 'a')
+            self.write_file.write(record)
+            self.write_file.flush()
+            if self.fsync:
+                os.fsync(self.write_file.fileno())
+
+    def has_backlog(self):
+        segment, offset = self.cursor
+        if segment < self.write_segment:
+            return True
+        path = self.segment_path(segment)
+        return os.path.exists(path) and os.path.getsize(path) > offset
+
+    def read_batch(self, max_records=100):
+        """
+        Returns up to max_records (topic, key, value) tuples from the cursor,
+        in the order they were appended, and the cursor after the last one.
+        Nothing is consumed until commit() is called with that cursor.
+        """
+        records = []
+        segment, offset = self.cursor
+        while len(records) < max_records:
+            path = self.segment_path(segment)
+            if os.path.exists(path):
+                with open(path) as segment_file:
+                    segment_file.seek(offset)
+                    while len(records) < max_records:
+                        line = segment_file.readline()
+                        if not line.endswith('\n'):
+                            # end of segment, or a record still being written
+                            break
+                        record = json.loads(line)
+                        records.append((record['topic'], record['key'], record['value']))
+                        offset = segment_file.tell()
+            if len(records) >= max_records or segment >= self.write_segment:
+                break
+            segment, offset = segment + 1, 0
+        return records, (segment, offset)
+
+    def commit(self, cursor):
+        with self.lock:
+            self.write_index(cursor)
+            for number in self.segment_numbers():
+                if number < cursor[0]:
+                    os.remove(self.segment_path(number))
+            self.cursor = cursor
+
+    def close(self):
+        with self.lock:
+            if self.write_file is not None:
+                self.write_file.close()
+                self.write_file = None
+        self.lock_file.close()
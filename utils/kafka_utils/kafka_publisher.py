@@ -1,17 +1,153 @@
 from config import PUBLISH_TO_KAFKA, APP_NAME
 from flask import g
-from kafka import SimpleClient, KeyedProducer
+from kafka import SimpleClient, KeyedProducer, KafkaProducer
+import os
+import json
+import time
+import shutil
 import logging
-import datetime
+import threading
+from lib import engine
+from lib.metrics import Metrics
 from utils.jsonutils.output_formatter import create_data_response
+from utils.kafka_utils.disk_spool import DiskSpool
 
 logger = logging.getLogger(APP_NAME)
 
+KAFKA_PUBLISH_METRIC = 'grocery_kafka_publish_duration_seconds'
+Metrics.describe(KAFKA_PUBLISH_METRIC, 'Time until the broker acked or rejected a published message.')
+
+
+class LegacyKeyedBackend(object):
+    """
+    SimpleClient/KeyedProducer, flushing every batch_send_every_t seconds.
+    Created on first use in each process, see BatchedProducerBackend.
+    """
+
+    def __init__(self, app):
+        self.hosts = app.config['KAFKA_HOSTS']
+        self.kafka = None
+        self.producer = None
+        self.sync_producer = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def get_producer(self):
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.kafka = SimpleClient(self.hosts)
+                    self.producer = KeyedProducer(self.kafka, async=True, batch_send_every_t=0.010)
+                    self.sync_producer = None
+                    self.pid = os.getpid()
+        return self.producer
+
+    def send(self, topic, key, message, on_success, on_error):
+        # the legacy producer gives no per message acknowledgement
+        self.get_producer().send_messages(topic, key, message)
+        on_success()
+
+    def send_sync(self, topic, key, messages):
+        self.get_producer()
+        if self.sync_producer is None:
+            self.sync_producer = KeyedProducer(self.kafka, async=False)
+        self.sync_producer.send_messages(topic, key, *messages)
+
+
+class BatchedProducerBackend(object):
+    """
+    KafkaProducer batching by size (KAFKA_BATCH_SIZE bytes per partition) and
+    time (KAFKA_LINGER_MS), with compressed batches.
+
+    The producer is created on first use in each process: its sender thread
+    does not survive the uwsgi fork, and a producer inherited from the master
+    would hand out futures that never resolve.
+    """
+
+    def __init__(self, app):
+        self.options = {'bootstrap_servers': app.config['KAFKA_HOSTS'],
+                        'compression_type': app.config.get('KAFKA_COMPRESSION_TYPE', 'gzip'),
+                        'batch_size': app.config.get('KAFKA_BATCH_SIZE', 16384),
+                        'linger_ms': app.config.get('KAFKA_LINGER_MS', 10),
+                        'acks': app.config.get('KAFKA_ACKS', 1),
+                        'retries': app.config.get('KAFKA_RETRIES', 3),
+                        'max_block_ms': app.config.get('KAFKA_MAX_BLOCK_MS', 1000)}
+        self.timeout = app.config.get('KAFKA_SEND_TIMEOUT', 10)
+        self.producer = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def get_producer(self):
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.producer = KafkaProducer(**self.options)
+                    self.pid = os.getpid()
+        return self.producer
+
+    def send(self, topic, key, message, on_success, on_error):
+        future = self.get_producer().send(topic, key=key, value=message)
+        future.add_callback(lambda metadata: on_success())
+        future.add_errback(on_error)
+
+    def send_sync(self, topic, key, messages):
+        producer = self.get_producer()
+        futures = [producer.send(topic, key=key, value=message) for message in messages]
+        producer.flush()
+        for future in futures:
+            future.get(timeout=self.timeout)
+
+
+class FileBackend(object):
+    """
+    Stand-in broker for tests and local runs: appends every message as a json
+    line to KAFKA_FILE_BROKER_PATH.
+    """
+
+    def __init__(self, app):
+        self.path = app.config.get('KAFKA_FILE_BROKER_PATH', '/tmp/grocery_order_service_kafka.log')
+        self.lock = threading.Lock()
+
+    def send(self, topic, key, message, on_success, on_error):
+        try:
+            self.send_sync(topic, key, [message])
+        except Exception as e:
+            on_error(e)
+            return
+        on_success()
+
+    def send_sync(self, topic, key, messages):
+        with self.lock:
+            with open(self.path, 'a') as broker_file:
+                for message in messages:
+                    broker_file.write(json.dumps({'topic': topic, 'key': key, 'value': message}) + '\n')
+
+    def read_messages(self, topic=None):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path) as broker_file:
+            messages = [json.loads(line) for line in broker_file if line.strip()]
+        return [message for message in messages if topic is None or message['topic'] == topic]
+
+
+PRODUCER_BACKENDS = {
+    'legacy': LegacyKeyedBackend,
+    'batched': BatchedProducerBackend,
+    'file': FileBackend,
+}
+
+
 class Publisher:
-    kafka = None
-    producer = None
+    backend = None
     topic = None
+    stats = {'sent': 0, 'acked': 0, 'errors': 0, 'in_flight': 0, 'total_latency': 0.0, 'max_latency': 0.0}
 
+    spool_dir = None
+    spool_options = {}
+    spool = None
+    spool_pid = None
+    replay_interval = 1.0
+    replay_batch_size = 100
 
     def __init__(self):
         pass
@@ -19,29 +155,162 @@ class Publisher:
     @staticmethod
     def init(app):
         Publisher.topic = app.config['KAFKA_TOPIC']
-        Publisher.kafka = SimpleClient(app.config['KAFKA_HOSTS'])
-        Publisher.producer = KeyedProducer(Publisher.kafka, async=True, batch_send_every_t=0.010)
+        Publisher.backend = PRODUCER_BACKENDS[app.config.get('KAFKA_PRODUCER', 'legacy')](app)
+        Publisher.stats = {'sent': 0, 'acked': 0, 'errors': 0, 'in_flight': 0, 'total_latency': 0.0,
+                           'max_latency': 0.0, 'spooled': 0, 'replayed': 0}
+        Publisher.spool_dir = app.config.get('KAFKA_SPOOL_DIR') if app.config.get('KAFKA_SPOOL_ENABLED') else None
+        Publisher.spool_options = {'segment_max_bytes': app.config.get('KAFKA_SPOOL_SEGMENT_BYTES', 16 * 1024 * 1024),
+                                   'fsync': app.config.get('KAFKA_SPOOL_FSYNC', False)}
+        Publisher.replay_interval = app.config.get('KAFKA_SPOOL_REPLAY_INTERVAL', Publisher.replay_interval)
+        Publisher.spool = None
+        Publisher.spool_pid = None
+
+    @staticmethod
+    def get_spool():
+        """
+        Opens this process's spool and starts its replayer on first use in
+        each process, since neither survives the uwsgi fork.
+        """
+        if Publisher.spool_dir is None:
+            return None
+        if Publisher.spool_pid != os.getpid():
+            Publisher.spool_pid = os.getpid()
+            Publisher.spool = DiskSpool.for_process(Publisher.spool_dir, **Publisher.spool_options)
+            engine.spawn(Publisher.replay_spools)
+        return Publisher.spool
+
+    @staticmethod
+    def spool_message(key, message):
+        Publisher.get_spool().append(Publisher.topic, str(key), message)
+        Publisher.stats['spooled'] += 1
+
+    @staticmethod
+    def replay_spools():
+        spool = Publisher.spool
+        while True:
+            try:
+                for orphan in DiskSpool.adopt_orphans(Publisher.spool_dir, **Publisher.spool_options):
+                    Publisher.replay_orphan(orphan)
+                while Publisher.drain(spool):
+                    pass
+            except Exception:
+                logger.error('Kafka spool replay failed, will retry', exc_info=True)
+            engine.sleep(Publisher.replay_interval)
+
+    @staticmethod
+    def replay_orphan(orphan):
+        """
+        Drains the spool of a process that is gone and removes it once nothing
+        is left. On failure the directory stays and is adopted again later.
+        """
+        logger.info('Replaying kafka spool left at {%s}', orphan.directory)
+        try:
+            while Publisher.drain(orphan):
+                pass
+            replayed = not orphan.has_backlog()
+        finally:
+            orphan.close()
+        if replayed:
+            shutil.rmtree(orphan.directory, ignore_errors=True)
+        return replayed
+
+    @staticmethod
+    def drain(spool):
+        """
+        Sends one batch from the spool in order; returns True if more is left.
+        Raises on the first failure so the batch is retried from the cursor.
+        """
+        records, cursor = spool.read_batch(Publisher.replay_batch_size)
+        if not records:
+            return False
+        for topic, key, value in records:
+            Publisher.backend.send_sync(topic, key, [value.encode('utf-8')])
+        spool.commit(cursor)
+        Publisher.stats['replayed'] += len(records)
+        return spool.has_backlog()
 
     @staticmethod
     def publish_message(key, message, **kwargs):
         UUID = g.UUID
         try:
-            logger.info('{%s} Publishing data {%s} '%(UUID, message))
-            startTime = datetime.datetime.now()
+            logger.info('{%s} Publishing data {%s} ', UUID, message)
+            if not PUBLISH_TO_KAFKA:
+                return True
+            spool = Publisher.get_spool()
+            if spool is not None and spool.has_backlog():
+                # keep order behind messages still waiting to be replayed
+                Publisher.spool_message(key, message)
+                logger.info('{%s} Kafka backlog present, message spooled', UUID)
+                return True
+            start = time.time()
+            Publisher.stats['sent'] += 1
+            Publisher.stats['in_flight'] += 1
 
-            if PUBLISH_TO_KAFKA:
-                Publisher.producer.send_messages(Publisher.topic, str(key), message)
+            def on_success():
+                Publisher.record_delivery(start)
 
-            endTime = datetime.datetime.now()
-            total_time = endTime-startTime
-            total_time = total_time.seconds*1000000 + total_time.microseconds
-            logger.info('{%s} Kafka took {%s} microseconds for publishing'%(UUID, total_time))
+            def on_error(exception):
+                Publisher.record_delivery(start, error=True)
+                logger.error('{%s} Kafka could not deliver message for key {%s} {%s}', UUID, key, str(exception))
+                if spool is not None:
+                    Publisher.spool_message(key, message)
+
+            try:
+                Publisher.backend.send(Publisher.topic, str(key), message, on_success, on_error)
+            except Exception as e:
+                if spool is None:
+                    raise
+                Publisher.record_delivery(start, error=True)
+                logger.error('{%s} Kafka unavailable, spooling message {%s}', UUID, str(e))
+                Publisher.spool_message(key, message)
+                return True
+            logger.info('{%s} Kafka took {%s} microseconds for publishing', UUID, int((time.time() - start) * 1000000))
             return True
         except Exception as e:
-            logger.error('{%s} Exception while publishing', exc_info=True)
+            logger.error('{%s} Exception while publishing', UUID, exc_info=True)
             raise Exception(str(e))
 
+    @staticmethod
+    def send_messages_sync(topic, key, messages):
+        """
+        Sends the messages of one key in a single request and waits for the
+        broker to acknowledge them, raising if it does not.
+        """
+        if not PUBLISH_TO_KAFKA:
+            return
+        start = time.time()
+        Publisher.stats['sent'] += len(messages)
+        Publisher.stats['in_flight'] += len(messages)
+        try:
+            Publisher.backend.send_sync(topic, str(key), messages)
+        except Exception:
+            for _ in messages:
+                Publisher.record_delivery(start, error=True)
+            raise
+        for _ in messages:
+            Publisher.record_delivery(start)
+
+    @staticmethod
+    def record_delivery(start, error=False):
+        latency = time.time() - start
+        Metrics.observe(KAFKA_PUBLISH_METRIC, latency, outcome='error' if error else 'ok')
+        stats = Publisher.stats
+        stats['in_flight'] -= 1
+        if error:
+            stats['errors'] += 1
+            return
+        stats['acked'] += 1
+        stats['total_latency'] += latency
+        if latency > stats['max_latency']:
+            stats['max_latency'] = latency
+
+    @staticmethod
+    def get_stats():
+        stats = Publisher.stats.copy()
+        stats['avg_latency'] = stats['total_latency'] / stats['acked'] if stats['acked'] > 0 else 0.0
+        return stats
+
     @staticmethod
     def test():
         Publisher.publish_message("test", "This is a test msg")
-        return create_data_response()
\ No newline at end of file
+        return create_data_response()